@@ -18,12 +18,31 @@ const HDR_SESSIONS = [
 const HDR_GENERAL = ['Doc. Identidad','Marca de tiempo','Kit Entregado'];
 const HDR_SESSIONS_ATTN = ['Doc. Identidad','Sesion ID','Marca de tiempo'];
 
+// CacheService admite como máximo 6 horas
+const IDEMPOTENCY_TTL_SECONDS = 21600;
+
+// Contadores de inscritos por sesión (CacheService + respaldo en PropertiesService)
+const CAPACITY_STATE_KEY = 'capacity_state';
+const CAPACITY_CACHE_TTL_SECONDS = 21600;
+
+// Matriz de cruces de horario entre sesiones (solo CacheService: se recompila si falta)
+const CONFLICTS_STATE_KEY = 'session_conflicts';
+const CONFLICTS_CACHE_TTL_SECONDS = 21600;
+
+// Registro de filas editadas a mano (onEdit) para la réplica local de la app.
+// Una propiedad admite ~9 KB: al superar el máximo se pide releer la hoja
+const SYNC_EDITS_KEY = 'sync_edits';
+const SYNC_EDITS_MAX_ROWS = 400;
+const SYNC_TRACKED_SHEETS = [SHEET_ATTENDEES, SHEET_SESSIONS];
+
 /*******************************
  *          WEB APP
  *******************************/
 function doGet(e) {
+  const timing = e.parameter.timing ? { action: '', started: Date.now() } : null;
   try {
     const action = (e.parameter.action || '').trim();
+    if (timing) timing.action = action;
     let out;
 
     if (action === 'getAttendeeByDNI') {
@@ -33,26 +52,55 @@ function doGet(e) {
       out = getSessionsList();
     } else if (action === 'getSessionsCapacity') {
       out = getSessionsCapacity();
+    } else if (action === 'getSessionConflicts') {
+      out = sessionConflicts();
+    } else if (action === 'getEventStats') {
+      out = getEventStats(toNumber(e.parameter.minutes) || 60);
     } else if (action === 'exportAttendeesData') {
-      out = exportAttendeesData();
+      out = e.parameter.limit
+        ? exportAttendeesPage(toNumber(e.parameter.offset), toNumber(e.parameter.limit))
+        : exportAttendeesData();
+    } else if (action === 'getAttendeesSnapshot') {
+      out = getAttendeesSnapshot(
+        toNumber(e.parameter.attendees_from),
+        toNumber(e.parameter.general_from),
+        toNumber(e.parameter.session_from)
+      );
+    } else if (action === 'getSyncDelta') {
+      out = getSyncDelta({
+        attendees: toNumber(e.parameter.attendees_from),
+        sessions: toNumber(e.parameter.sessions_from),
+        general: toNumber(e.parameter.general_from),
+        session: toNumber(e.parameter.session_from)
+      }, toNumber(e.parameter.edits_since), toNumber(e.parameter.limit));
     } else {
       out = { error: 'Acción GET no soportada.' };
     }
 
-    return jsonResponse(out);
+    return jsonResponse(out, timing);
   } catch (err) {
-    return jsonResponse({ error: String(err) });
+    return jsonResponse({ error: String(err) }, timing);
   }
 }
 
 function doPost(e) {
+  const started = Date.now();
+  let timing = null;
   try {
     const body = e.postData && e.postData.contents
       ? JSON.parse(e.postData.contents)
       : {};
     const action = (body.action || '').trim();
+    if (body.timing) timing = { action, started };
     let out;
 
+    // Reenvíos con la misma idempotency_key devuelven la respuesta original
+    const idemKey = body.idempotency_key ? 'idem:' + body.idempotency_key : null;
+    if (idemKey) {
+      const cached = CacheService.getScriptCache().get(idemKey);
+      if (cached) return jsonResponse(JSON.parse(cached), timing);
+    }
+
     if (action === 'registerGeneralAttendance') {
       out = registerGeneralAttendance(body.dni, body.timestamp || new Date().toISOString());
     } else if (action === 'registerSessionAttendance') {
@@ -61,13 +109,22 @@ function doPost(e) {
         body.session_id,
         body.timestamp || new Date().toISOString()
       );
+    } else if (action === 'checkin') {
+      out = checkin(body.dni, body.session_id, body.timestamp || new Date().toISOString());
+    } else if (action === 'registerGeneralAttendanceBatch') {
+      out = registerGeneralAttendanceBatch(body.items || []);
+    } else if (action === 'registerSessionAttendanceBatch') {
+      out = registerSessionAttendanceBatch(body.items || []);
     } else {
       out = { error: 'Acción POST no soportada.' };
     }
 
-    return jsonResponse(out);
+    if (idemKey && !out.error)
+      CacheService.getScriptCache().put(idemKey, JSON.stringify(out), IDEMPOTENCY_TTL_SECONDS);
+
+    return jsonResponse(out, timing);
   } catch (err) {
-    return jsonResponse({ error: String(err) });
+    return jsonResponse({ error: String(err) }, timing);
   }
 }
 
@@ -79,31 +136,20 @@ function getAttendeeByDNI(dni) {
   if (!dni || dni.length !== 8)
     return { error: 'dni inválido (8 dígitos)' };
 
-  const attendees = readSheetAsObjects(SHEET_ATTENDEES, HDR_ATTENDEES);
-  const att = attendees.find(r => String(r['DNI']).trim() === dni);
+  const att = attendeesByDni().get(dni);
 
   if (!att)
     return { error: 'DNI no encontrado.' };
 
-  const general = readSheetAsObjects(SHEET_GENERAL, HDR_GENERAL);
-  const asistencia_general = general.some(r => String(r['Doc. Identidad']).trim() === dni);
-
-  const sesAttn = readSheetAsObjects(SHEET_SESSION, HDR_SESSIONS_ATTN);
-  const sesiones = sesAttn
-    .filter(r => String(r['Doc. Identidad']).trim() === dni)
-    .map(r => String(r['Sesion ID']).trim());
-
-  const asistidasSet = new Set(sesiones);
-  const sessions = readSheetAsObjects(SHEET_SESSIONS, HDR_SESSIONS);
+  const asistidasSet = sessionAttendanceIndex().byDni.get(dni) || new Set();
 
   const result = {
     dni,
     nombre: (att['NOMBRES'] + ' ' + att['APELLIDOS']).trim(),
-    asistencia_general
+    asistencia_general: generalByDni().has(dni)
   };
 
-  sessions.forEach(s => {
-    const id = String(s['ID']).trim();
+  sessionsById().forEach((s, id) => {
     result[id] = asistidasSet.has(id);
   });
 
@@ -120,20 +166,12 @@ function getSessionsList() {
 }
 
 function getSessionsCapacity() {
-  const sessions = readSheetAsObjects(SHEET_SESSIONS, HDR_SESSIONS);
-  const sesAttn = readSheetAsObjects(SHEET_SESSION, HDR_SESSIONS_ATTN);
-
-  const countBySession = {};
-  sesAttn.forEach(r => {
-    const sid = r['Sesion ID'];
-    countBySession[sid] = (countBySession[sid] || 0) + 1;
-  });
+  const counts = capacityCounts().counts;
 
   const out = {};
-  sessions.forEach(s => {
-    const id = s['ID'];
+  sessionsById().forEach((s, id) => {
     const total = toNumber(s['Cupos totales']);
-    const registered = countBySession[id] || 0;
+    const registered = counts[id] || 0;
 
     out[id] = {
       available: Math.max(0, total - registered),
@@ -145,49 +183,177 @@ function getSessionsCapacity() {
   return out;
 }
 
+/**
+ * Agregados del evento que Flask usa como base de GET /api/v1/stats; entre
+ * una lectura y otra los mantiene él con cada registro que atiende.
+ * per_minute: [[inicio del minuto en segundos epoch, asistencias generales,
+ * registros en ponencias]] de los últimos `minutes` minutos.
+ */
+function getEventStats(minutes) {
+  const since = Date.now() - minutes * 60000;
+  const buckets = {};
+  const count = (timestamp, column) => {
+    const t = new Date(timestamp).getTime();
+    if (!(t >= since)) return;
+    const minute = Math.floor(t / 60000) * 60;
+    (buckets[minute] = buckets[minute] || [minute, 0, 0])[column]++;
+  };
+
+  const todayKey = dayKey(new Date());
+  const general = { attendees: 0, checkins: 0, today: 0, kits_delivered: 0 };
+  generalByDni().forEach(rows => {
+    general.attendees++;
+    if (rows.some(r => dayKey(new Date(r['Marca de tiempo'])) === todayKey)) general.today++;
+    rows.forEach(r => {
+      general.checkins++;
+      if (r['Kit Entregado'] === true) general.kits_delivered++;
+      count(r['Marca de tiempo'], 1);
+    });
+  });
+  readSheetAsObjects(SHEET_SESSION, HDR_SESSIONS_ATTN).forEach(r => count(r['Marca de tiempo'], 2));
+
+  return {
+    general,
+    per_minute: Object.keys(buckets).sort().map(minute => buckets[minute])
+  };
+}
+
 function exportAttendeesData() {
   const attendees = readSheetAsObjects(SHEET_ATTENDEES, HDR_ATTENDEES);
-  const general   = readSheetAsObjects(SHEET_GENERAL, HDR_GENERAL);
-  const sesAttn   = readSheetAsObjects(SHEET_SESSION, HDR_SESSIONS_ATTN);
-  const sessions  = readSheetAsObjects(SHEET_SESSIONS, HDR_SESSIONS);
+  const sessionsSorted = exportSessions();
+  const toRow = exportRowBuilder(sessionsSorted);
 
-  const generalSet = new Set(
-    general.map(r => String(r['Doc. Identidad']).trim())
-  );
+  const rows = [exportHeader(sessionsSorted)];
+  attendees.forEach(a => rows.push(toRow(a)));
 
-  const byDniSessions = {};
-  sesAttn.forEach(r => {
-    const dni = String(r['Doc. Identidad']).trim();
-    const sid = String(r['Sesion ID']).trim();
-    if (!byDniSessions[dni]) byDniSessions[dni] = new Set();
-    byDniSessions[dni].add(sid);
-  });
+  const csv = rows.map(r => r.map(csvCell).join(',')).join('\n');
 
-  const sessionsSorted = sessions.sort((a,b)=>
-    a['ID'].localeCompare(b['ID'])
-  );
+  return { csv_data: csv };
+}
+
+/**
+ * Página del export CSV para la descarga en streaming de Flask.
+ * Solo lee de Attendees las filas [offset, offset + limit); las hojas de
+ * asistencia se leen completas para indexarlas. next_offset es null en
+ * la última página.
+ */
+function exportAttendeesPage(offset, limit) {
+  const sessionsSorted = exportSessions();
+  const toRow = exportRowBuilder(sessionsSorted);
+  const page = readSheetRowsFrom(SHEET_ATTENDEES, HDR_ATTENDEES, offset, limit);
+  const next = offset + page.rows.length;
 
-  const header = ['DNI','Nombre','Asistencia General']
+  return {
+    header: exportHeader(sessionsSorted).map(csvCell).join(','),
+    csv_rows: page.rows.map(a => toRow(a).map(csvCell).join(',')).join('\n'),
+    offset: offset,
+    count: page.rows.length,
+    total: page.total,
+    next_offset: next < page.total ? next : null
+  };
+}
+
+function exportSessions() {
+  // Copia: el arreglo leído es compartido por toda la ejecución
+  return readSheetAsObjects(SHEET_SESSIONS, HDR_SESSIONS)
+    .slice()
+    .sort((a,b) => String(a['ID']).localeCompare(String(b['ID'])));
+}
+
+function exportHeader(sessionsSorted) {
+  return ['DNI','Nombre','Asistencia General']
     .concat(sessionsSorted.map(s => s['Tipo']));
+}
 
-  const rows = [header];
+/** Fila de Attendees -> celdas del CSV (DNI, nombre, general, una por sesión) */
+function exportRowBuilder(sessionsSorted) {
+  const generalMap = generalByDni();
+  const byDniSessions = sessionAttendanceIndex().byDni;
 
-  attendees.forEach(a => {
+  return a => {
     const dni = String(a['DNI']).trim();
     const nombre = (a['NOMBRES'] + ' ' + a['APELLIDOS']).trim();
-    const ag = generalSet.has(dni) ? 'Sí' : 'No';
-    const setSes = byDniSessions[dni] || new Set();
+    const ag = generalMap.has(dni) ? 'Sí' : 'No';
+    const setSes = byDniSessions.get(dni) || new Set();
 
     const sesFlags = sessionsSorted.map(s =>
-      setSes.has(s['ID']) ? 'Sí' : 'No'
+      setSes.has(String(s['ID']).trim()) ? 'Sí' : 'No'
     );
 
-    rows.push([dni, nombre, ag].concat(sesFlags));
-  });
+    return [dni, nombre, ag].concat(sesFlags);
+  };
+}
 
-  const csv = rows.map(r => r.map(csvCell).join(',')).join('\n');
+/**
+ * Volcado masivo para el índice local de la app Flask.
+ * Los parámetros *_from son offsets de fila (0 = primera fila de datos):
+ * solo se devuelven las filas a partir de ese offset, lo que permite
+ * refrescos incrementales sobre hojas que solo crecen por appendRow.
+ */
+function getAttendeesSnapshot(attendeesFrom, generalFrom, sessionFrom) {
+  const att = readSheetRowsFrom(SHEET_ATTENDEES, HDR_ATTENDEES, attendeesFrom);
+  const gen = readSheetRowsFrom(SHEET_GENERAL, HDR_GENERAL, generalFrom);
+  const ses = readSheetRowsFrom(SHEET_SESSION, HDR_SESSIONS_ATTN, sessionFrom);
 
-  return { csv_data: csv };
+  return {
+    sessions: Array.from(sessionsById().keys()),
+    attendees: {
+      from: attendeesFrom,
+      total: att.total,
+      rows: att.rows.map(r => [
+        String(r['DNI']).trim(),
+        (r['NOMBRES'] + ' ' + r['APELLIDOS']).trim()
+      ])
+    },
+    general: {
+      from: generalFrom,
+      total: gen.total,
+      rows: gen.rows.map(r => String(r['Doc. Identidad']).trim()),
+      // En paralelo a rows: cuándo fue cada asistencia y si entregó kit
+      timestamps: gen.rows.map(r => r['Marca de tiempo'] instanceof Date
+        ? r['Marca de tiempo'].toISOString() : String(r['Marca de tiempo'])),
+      kits: gen.rows.map(r => r['Kit Entregado'] === true)
+    },
+    session_attendance: {
+      from: sessionFrom,
+      total: ses.total,
+      rows: ses.rows.map(r => [
+        String(r['Doc. Identidad']).trim(),
+        String(r['Sesion ID']).trim()
+      ])
+    }
+  };
+}
+
+/**
+ * Cambios para la réplica local de la app Flask (STORAGE_BACKEND=sqlite).
+ * Igual que getAttendeesSnapshot, cada hoja se lee solo desde su offset
+ * (`limit` acota las filas de las hojas de asistencia) y las filas van
+ * completas, en el orden de la cabecera. En Attendees y Sessions además
+ * se devuelven, con su número de fila, las filas anteriores al offset
+ * editadas a mano después de la versión `editsSince`; `reset` indica que
+ * el registro de ediciones se desbordó y hay que releer la hoja entera.
+ */
+function getSyncDelta(from, editsSince, limit) {
+  const edits = readSyncEdits();
+
+  function part(name, headers, start, rowLimit) {
+    const res = readSheetValuesFrom(name, headers, start, rowLimit);
+    const out = { from: start, total: res.total, rows: res.values };
+    if (SYNC_TRACKED_SHEETS.indexOf(name) !== -1) {
+      out.reset = (edits.reset[name] || 0) > editsSince;
+      out.edited = out.reset ? [] : editedRows(name, headers, edits, editsSince, Math.min(start, res.total));
+    }
+    return out;
+  }
+
+  return {
+    edits_version: edits.version,
+    attendees: part(SHEET_ATTENDEES, HDR_ATTENDEES, from.attendees),
+    sessions: part(SHEET_SESSIONS, HDR_SESSIONS, from.sessions),
+    general: part(SHEET_GENERAL, HDR_GENERAL, from.general, limit),
+    session_attendance: part(SHEET_SESSION, HDR_SESSIONS_ATTN, from.session, limit)
+  };
 }
 
 function registerGeneralAttendance(dni, timestampISO) {
@@ -197,26 +363,14 @@ function registerGeneralAttendance(dni, timestampISO) {
   if (!existsAttendee(dni))
     return { error: "DNI no existe en Attendees." };
 
-  const general = readSheetAsObjects(SHEET_GENERAL, HDR_GENERAL);
-  
-  const today = new Date(timestampISO);
-  const todayDate = new Date(today.getFullYear(), today.getMonth(), today.getDate());
-  
-  const existingToday = general.find(r => {
-    if (String(r['Doc. Identidad']).trim() !== dni) return false;
-    
-    const recordDate = new Date(r['Marca de tiempo']);
-    const recordDateOnly = new Date(recordDate.getFullYear(), recordDate.getMonth(), recordDate.getDate());
-    
-    return recordDateOnly.getTime() === todayDate.getTime();
-  });
+  const mine = generalByDni().get(dni) || [];
+  const todayKey = dayKey(new Date(timestampISO));
+
+  const existingToday = mine.find(r => dayKey(new Date(r['Marca de tiempo'])) === todayKey);
 
   if (existingToday) {
-    const hasKit = general.some(r => 
-      String(r['Doc. Identidad']).trim() === dni && 
-      r['Kit Entregado'] === true
-    );
-    
+    const hasKit = mine.some(r => r['Kit Entregado'] === true);
+
     return {
       registered: true,
       dni,
@@ -226,14 +380,13 @@ function registerGeneralAttendance(dni, timestampISO) {
     };
   }
 
-  const isFirstTime = !general.some(r => String(r['Doc. Identidad']).trim() === dni);
-  
+  const isFirstTime = mine.length === 0;
+
   const lock = LockService.getScriptLock();
   lock.waitLock(2000);
 
   try {
-    const sh = getSheet(SHEET_GENERAL, HDR_GENERAL);
-    sh.appendRow([dni, timestampISO, isFirstTime ? true : false]);
+    appendRows(SHEET_GENERAL, HDR_GENERAL, [[dni, timestampISO, isFirstTime ? true : false]]);
   } finally {
     lock.releaseLock();
   }
@@ -254,39 +407,35 @@ function registerSessionAttendance(dni, sessionId, timestampISO) {
   if (!existsAttendee(dni))
     return { error: "DNI no existe" };
 
-  const sessions = readSheetAsObjects(SHEET_SESSIONS, HDR_SESSIONS);
-  const ses = sessions.find(s => String(s['ID']) === sessionId);
+  sessionId = String(sessionId).trim();
+  const sessions = sessionsById();
+  const ses = sessions.get(sessionId);
   if (!ses)
     return { error: "session_id no existe" };
 
-  const general = readSheetAsObjects(SHEET_GENERAL, HDR_GENERAL);
-  const hasGeneral = general.some(r => String(r['Doc. Identidad']) === dni);
-  if (!hasGeneral)
+  if (!generalByDni().has(dni))
     return { no_general_attendance: true, dni };
 
   // ⭐ VALIDACIÓN DE TIEMPO ELIMINADA - Permite registro en cualquier momento
 
-  const sesAttn = readSheetAsObjects(SHEET_SESSION, HDR_SESSIONS_ATTN);
+  const sesIdx = sessionAttendanceIndex();
 
   // Capacidad
   const totalCap = toNumber(ses['Cupos totales']);
-  const registeredCount = sesAttn.filter(r => String(r['Sesion ID']) === sessionId).length;
+  const noCapacity = {
+    no_capacity: true,
+    session_id: sessionId,
+    session_name: ses['Tipo'],
+    available_capacity: 0
+  };
 
-  if (registeredCount >= totalCap)
-    return {
-      no_capacity: true,
-      session_id: sessionId,
-      session_name: ses['Tipo'],
-      available_capacity: 0
-    };
+  if ((capacityCounts().counts[sessionId] || 0) >= totalCap)
+    return noCapacity;
 
   // Duplicado
-  const dup = sesAttn.some(r =>
-    String(r['Doc. Identidad']) === dni &&
-    String(r['Sesion ID']) === sessionId
-  );
+  const userSessions = sesIdx.byDni.get(dni) || new Set();
 
-  if (dup)
+  if (userSessions.has(sessionId))
     return {
       already_registered: true,
       dni,
@@ -295,29 +444,21 @@ function registerSessionAttendance(dni, sessionId, timestampISO) {
     };
 
   // Verificar solapamiento
-  const targetRange = sessionTimeRange(ses);
-  const userSessions = sesAttn.filter(r => String(r['Doc. Identidad']) === dni);
-
-  for (const r of userSessions) {
-    const s2 = sessions.find(s => s['ID'] === r['Sesion ID']);
-    if (s2) {
-      const r2 = sessionTimeRange(s2);
-      if (overlap(targetRange, r2)) {
-        return {
-          overlap: true,
-          conflict_with: s2['ID'],
-          conflict_name: s2['Tipo']
-        };
-      }
-    }
-  }
+  const s2 = conflictingSession(sessionId, userSessions);
+  if (s2)
+    return {
+      overlap: true,
+      conflict_with: s2['ID'],
+      conflict_name: s2['Tipo']
+    };
 
-  // Registrar
+  // Registrar (la capacidad se revalida con el contador vigente bajo el lock)
   const lock = LockService.getScriptLock();
   lock.waitLock(2000);
   try {
-    const sh = getSheet(SHEET_SESSION, HDR_SESSIONS_ATTN);
-    sh.appendRow([dni, sessionId, timestampISO]);
+    if ((currentCapacityState().counts[sessionId] || 0) >= totalCap)
+      return noCapacity;
+    appendRows(SHEET_SESSION, HDR_SESSIONS_ATTN, [[dni, sessionId, timestampISO]]);
   } finally {
     lock.releaseLock();
   }
@@ -331,54 +472,615 @@ function registerSessionAttendance(dni, sessionId, timestampISO) {
   };
 }
 
+/**
+ * Check-in en la puerta: búsqueda, asistencia general y, si se indica,
+ * registro en una ponencia en una sola ejecución. Los tres pasos
+ * comparten las hojas e índices ya leídos (appendRows los mantiene al
+ * día), así que cada hoja se lee una vez.
+ * Retorna { attendee, general, session? }: `attendee` con la forma de
+ * getAttendeeByDNI ya con los registros aplicados, y cada paso con la
+ * respuesta de su acción individual.
+ */
+function checkin(dni, sessionId, timestampISO) {
+  dni = String(dni || '').trim();
+  if (dni.length !== 8)
+    return { error: 'dni inválido' };
+  if (!existsAttendee(dni))
+    return { not_found: true, dni };
+
+  const out = { general: registerGeneralAttendance(dni, timestampISO) };
+  if (out.general.error)
+    return out.general;
+
+  if (sessionId)
+    out.session = registerSessionAttendance(dni, sessionId, timestampISO);
+
+  out.attendee = getAttendeeByDNI(dni);
+  return out;
+}
+
 /*******************************
- *         HELPERS
+ *     REGISTRO POR LOTES
  *******************************/
-function jsonResponse(obj) {
-  return ContentService
-    .createTextOutput(JSON.stringify(obj))
-    .setMimeType(ContentService.MimeType.JSON);
+
+/**
+ * Registra asistencia general para varios DNIs en una sola ejecución.
+ * items: [{dni, timestamp?, idempotency_key?}]
+ * Valida contra los índices de la capa de datos y escribe todas las
+ * filas aceptadas con un único setValues.
+ * Retorna { results: [...] } con una respuesta por item, en el mismo
+ * formato que registerGeneralAttendance.
+ */
+function registerGeneralAttendanceBatch(items) {
+  if (!Array.isArray(items))
+    return { error: 'items debe ser una lista' };
+
+  const lock = LockService.getScriptLock();
+  lock.waitLock(10000);
+
+  try {
+    const replayed = getIdempotentResults(items);
+    const attendees = attendeesByDni();
+
+    // dni -> { days: {dayKey: timestamp}, kit: boolean }
+    const byDni = {};
+    generalByDni().forEach((rows, dni) => {
+      const st = byDni[dni] = { days: {}, kit: false };
+      rows.forEach(r => {
+        const key = dayKey(new Date(r['Marca de tiempo']));
+        if (!st.days[key]) st.days[key] = r['Marca de tiempo'];
+        if (r['Kit Entregado'] === true) st.kit = true;
+      });
+    });
+
+    const newRows = [];
+    const results = items.map((item, i) => {
+      if (replayed[i]) return replayed[i];
+
+      const dni = String(item.dni || '').trim();
+      const timestampISO = item.timestamp || new Date().toISOString();
+
+      if (dni.length !== 8)
+        return { error: 'dni inválido', dni };
+      if (!attendees.has(dni))
+        return { error: 'DNI no existe en Attendees.', dni };
+
+      const st = byDni[dni];
+      const key = dayKey(new Date(timestampISO));
+
+      if (st && st.days[key]) {
+        return {
+          registered: true,
+          dni,
+          timestamp: st.days[key],
+          kit_entregado: st.kit,
+          already_registered_today: true
+        };
+      }
+
+      const isFirstTime = !st;
+      newRows.push([dni, timestampISO, isFirstTime]);
+
+      const state = st || (byDni[dni] = { days: {}, kit: false });
+      state.days[key] = timestampISO;
+      if (isFirstTime) state.kit = true;
+
+      return {
+        registered: true,
+        dni,
+        timestamp: timestampISO,
+        kit_entregado: isFirstTime
+      };
+    });
+
+    appendRows(SHEET_GENERAL, HDR_GENERAL, newRows);
+    storeIdempotentResults(items, results);
+
+    return { results };
+  } finally {
+    lock.releaseLock();
+  }
 }
 
+/**
+ * Registra asistencia a ponencias para varios pares (dni, session_id).
+ * items: [{dni, session_id, timestamp?, idempotency_key?}]
+ * Aplica las mismas reglas que registerSessionAttendance (asistencia
+ * general previa, capacidad, duplicado y solapamiento), considerando
+ * también los items aceptados antes dentro del mismo lote.
+ */
+function registerSessionAttendanceBatch(items) {
+  if (!Array.isArray(items))
+    return { error: 'items debe ser una lista' };
+
+  const lock = LockService.getScriptLock();
+  lock.waitLock(10000);
+
+  try {
+    const replayed = getIdempotentResults(items);
+    const attendees = attendeesByDni();
+    const general = generalByDni();
+    const sessions = sessionsById();
+    const sesIdx = sessionAttendanceIndex();
+
+    const newRows = [];
+    const results = items.map((item, i) => {
+      if (replayed[i]) return replayed[i];
+
+      const dni = String(item.dni || '').trim();
+      const sessionId = String(item.session_id || '').trim();
+      const timestampISO = item.timestamp || new Date().toISOString();
+
+      if (dni.length !== 8)
+        return { error: 'dni inválido', dni };
+      if (!sessionId)
+        return { error: 'session_id requerido', dni };
+      if (!attendees.has(dni))
+        return { error: 'DNI no existe', dni };
+
+      const ses = sessions.get(sessionId);
+      if (!ses)
+        return { error: 'session_id no existe', dni, session_id: sessionId };
+
+      if (!general.has(dni))
+        return { no_general_attendance: true, dni };
+
+      const registeredCount = sesIdx.countBySession.get(sessionId) || 0;
+      if (registeredCount >= toNumber(ses['Cupos totales']))
+        return {
+          no_capacity: true,
+          session_id: sessionId,
+          session_name: ses['Tipo'],
+          available_capacity: 0
+        };
+
+      const mine = sesIdx.byDni.get(dni) || new Set();
+      if (mine.has(sessionId))
+        return {
+          already_registered: true,
+          dni,
+          session_id: sessionId,
+          session_name: ses['Tipo']
+        };
+
+      const s2 = conflictingSession(sessionId, mine);
+      if (s2)
+        return {
+          overlap: true,
+          conflict_with: s2['ID'],
+          conflict_name: s2['Tipo']
+        };
+
+      // Se contabiliza ya en los índices para los siguientes items del lote
+      newRows.push([dni, sessionId, timestampISO]);
+      sesIdx.countBySession.set(sessionId, registeredCount + 1);
+      mine.add(sessionId);
+      sesIdx.byDni.set(dni, mine);
+
+      return {
+        registered: true,
+        dni,
+        session_id: sessionId,
+        session_name: ses['Tipo'],
+        timestamp: timestampISO
+      };
+    });
+
+    appendRows(SHEET_SESSION, HDR_SESSIONS_ATTN, newRows, { indexed: true });
+    storeIdempotentResults(items, results);
+
+    return { results };
+  } finally {
+    lock.releaseLock();
+  }
+}
+
+function getIdempotentResults(items) {
+  const keys = items
+    .filter(it => it && it.idempotency_key)
+    .map(it => 'idem:' + it.idempotency_key);
+  const cached = keys.length ? CacheService.getScriptCache().getAll(keys) : {};
+
+  return items.map(it =>
+    it && it.idempotency_key && cached['idem:' + it.idempotency_key]
+      ? JSON.parse(cached['idem:' + it.idempotency_key])
+      : null
+  );
+}
+
+function storeIdempotentResults(items, results) {
+  const values = {};
+  items.forEach((it, i) => {
+    if (it && it.idempotency_key && !results[i].error)
+      values['idem:' + it.idempotency_key] = JSON.stringify(results[i]);
+  });
+  if (Object.keys(values).length)
+    CacheService.getScriptCache().putAll(values, IDEMPOTENCY_TTL_SECONDS);
+}
+
+/*******************************
+ *        CAPA DE DATOS
+ *  Cada ejecución del Web App parte con un entorno global nuevo, así
+ *  que estas cachés viven solo durante una petición: cada hoja se lee
+ *  como máximo una vez (cabeceras y datos en la misma llamada) y los
+ *  índices se construyen bajo demanda sobre esas filas.
+ *******************************/
+
+const _sheets = {};   // nombre -> Sheet con cabeceras ya validadas
+const _rows = {};     // nombre -> filas como objetos
+const _indexes = {};  // 'hoja:índice' -> Map
+
 function getSheet(name, expectedHeaders) {
+  if (_sheets[name]) return _sheets[name];
+
   const ss = SpreadsheetApp.getActiveSpreadsheet();
   const sh = ss.getSheetByName(name);
   if (!sh) throw new Error('No existe hoja: ' + name);
 
   const headers = sh.getRange(1,1,1,sh.getLastColumn())
-    .getValues()[0]
-    .map(h => String(h).trim());
+    .getValues()[0];
+
+  validateHeaders(name, headers, expectedHeaders);
 
+  _sheets[name] = sh;
+  return sh;
+}
+
+function validateHeaders(name, headers, expectedHeaders) {
+  const have = headers.map(h => String(h).trim());
   const want = expectedHeaders.map(h => h.trim());
 
-  const match = headers.length === want.length &&
-                headers.every((h,i) => h === want[i]);
+  const match = have.length === want.length &&
+                have.every((h,i) => h === want[i]);
 
   if (!match)
     throw new Error('Cabeceras inválidas en hoja "'+name+'"');
-
-  return sh;
 }
 
 function readSheetAsObjects(name, headers) {
+  if (_rows[name]) return _rows[name];
+
+  const ss = SpreadsheetApp.getActiveSpreadsheet();
+  const sh = ss.getSheetByName(name);
+  if (!sh) throw new Error('No existe hoja: ' + name);
+
+  // Una sola llamada trae cabecera y datos
+  const values = sh.getDataRange().getValues();
+  validateHeaders(name, values[0] || [], headers);
+  _sheets[name] = sh;
+
+  _rows[name] = values.slice(1).map(row => rowToObject(headers, row));
+  return _rows[name];
+}
+
+function rowToObject(headers, row) {
+  const obj = {};
+  headers.forEach((h,i) => obj[h] = row[i]);
+  return obj;
+}
+
+function memoIndex(sheetName, indexName, build) {
+  const key = sheetName + ':' + indexName;
+  if (!_indexes[key]) _indexes[key] = build();
+  return _indexes[key];
+}
+
+/** DNI -> fila de Attendees */
+function attendeesByDni() {
+  return memoIndex(SHEET_ATTENDEES, 'byDni', () => {
+    const map = new Map();
+    readSheetAsObjects(SHEET_ATTENDEES, HDR_ATTENDEES).forEach(r => {
+      const dni = String(r['DNI']).trim();
+      if (!map.has(dni)) map.set(dni, r);
+    });
+    return map;
+  });
+}
+
+/** ID de sesión -> fila de Sessions (en el orden de la hoja) */
+function sessionsById() {
+  return memoIndex(SHEET_SESSIONS, 'byId', () => {
+    const map = new Map();
+    readSheetAsObjects(SHEET_SESSIONS, HDR_SESSIONS).forEach(s => {
+      map.set(String(s['ID']).trim(), s);
+    });
+    return map;
+  });
+}
+
+/** DNI -> filas de GeneralAttendance */
+function generalByDni() {
+  return memoIndex(SHEET_GENERAL, 'byDni', () => {
+    const map = new Map();
+    readSheetAsObjects(SHEET_GENERAL, HDR_GENERAL).forEach(r => {
+      const dni = String(r['Doc. Identidad']).trim();
+      if (!map.has(dni)) map.set(dni, []);
+      map.get(dni).push(r);
+    });
+    return map;
+  });
+}
+
+/** { countBySession: Map(id -> n), byDni: Map(dni -> Set(id)) } */
+function sessionAttendanceIndex() {
+  return memoIndex(SHEET_SESSION, 'attendance', () => {
+    const countBySession = new Map();
+    const byDni = new Map();
+    readSheetAsObjects(SHEET_SESSION, HDR_SESSIONS_ATTN).forEach(r => {
+      const dni = String(r['Doc. Identidad']).trim();
+      const sid = String(r['Sesion ID']).trim();
+      countBySession.set(sid, (countBySession.get(sid) || 0) + 1);
+      if (!byDni.has(dni)) byDni.set(dni, new Set());
+      byDni.get(dni).add(sid);
+    });
+    return { countBySession, byDni };
+  });
+}
+
+/**
+ * Agrega filas con un único setValues y mantiene coherentes las cachés
+ * de la ejecución. Con opts.indexed el llamador ya actualizó los índices
+ * de la hoja; si no, se descartan para reconstruirlos al próximo uso.
+ */
+function appendRows(name, headers, rows, opts) {
+  if (!rows.length) return;
   const sh = getSheet(name, headers);
-  const lastRow = sh.getLastRow();
-  const lastCol = sh.getLastColumn();
+  sh.getRange(sh.getLastRow() + 1, 1, rows.length, rows[0].length).setValues(rows);
+
+  if (_rows[name])
+    rows.forEach(row => _rows[name].push(rowToObject(headers, row)));
+
+  if (name === SHEET_SESSION)
+    recordSessionRegistrations(rows);
+
+  if (!(opts && opts.indexed))
+    Object.keys(_indexes)
+      .filter(key => key.indexOf(name + ':') === 0)
+      .forEach(key => delete _indexes[key]);
+}
+
+/*******************************
+ *    CONTADORES DE CAPACIDAD
+ *  Estado: { counts: {sessionId: inscritos}, rows: filas contadas }.
+ *  Vive en CacheService (rápido) con copia durable en PropertiesService.
+ *  Solo se recalcula desde SessionAttendance en arranque en frío o cuando
+ *  `rows` no coincide con las filas reales de la hoja (edición manual,
+ *  escrituras fuera de este script, etc.).
+ *******************************/
 
-  if (lastRow < 2) return [];
+let _capacity = null;
 
-  const values = sh.getRange(2,1,lastRow-1,lastCol).getValues();
+/** Estado de contadores para lecturas (memoizado en la ejecución) */
+function capacityCounts() {
+  if (!_capacity) _capacity = currentCapacityState();
+  return _capacity;
+}
+
+/** Estado vigente sin memo: usar bajo el lock antes de escribir */
+function currentCapacityState() {
+  const state = readCapacityState();
+  if (state && state.rows === sessionAttendanceRowCount()) return state;
+  return rebuildCapacityCounters();
+}
+
+function readCapacityState() {
+  const cache = CacheService.getScriptCache();
+  const cached = cache.get(CAPACITY_STATE_KEY);
+  if (cached) return JSON.parse(cached);
+
+  const stored = PropertiesService.getScriptProperties().getProperty(CAPACITY_STATE_KEY);
+  if (!stored) return null;
+
+  cache.put(CAPACITY_STATE_KEY, stored, CAPACITY_CACHE_TTL_SECONDS);
+  return JSON.parse(stored);
+}
+
+function writeCapacityState(state) {
+  const json = JSON.stringify(state);
+  CacheService.getScriptCache().put(CAPACITY_STATE_KEY, json, CAPACITY_CACHE_TTL_SECONDS);
+  PropertiesService.getScriptProperties().setProperty(CAPACITY_STATE_KEY, json);
+  _capacity = state;
+}
+
+/** Recontar desde la hoja. También puede ejecutarse a mano desde el editor. */
+function rebuildCapacityCounters() {
+  const counts = {};
+  sessionAttendanceIndex().countBySession.forEach((n, sid) => { counts[sid] = n; });
+
+  const state = {
+    counts,
+    rows: readSheetAsObjects(SHEET_SESSION, HDR_SESSIONS_ATTN).length
+  };
+  writeCapacityState(state);
+  return state;
+}
+
+/** Filas de datos en SessionAttendance sin leer su contenido */
+function sessionAttendanceRowCount() {
+  const sh = SpreadsheetApp.getActiveSpreadsheet().getSheetByName(SHEET_SESSION);
+  if (!sh) throw new Error('No existe hoja: ' + SHEET_SESSION);
+  return Math.max(0, sh.getLastRow() - 1);
+}
 
-  return values.map(row => {
-    const obj = {};
-    headers.forEach((h,i) => obj[h] = row[i]);
-    return obj;
+/** Sumar filas recién agregadas a SessionAttendance (se llama bajo el lock) */
+function recordSessionRegistrations(rows) {
+  const state = readCapacityState();
+
+  if (!state || state.rows + rows.length !== sessionAttendanceRowCount()) {
+    rebuildCapacityCounters();
+    return;
+  }
+
+  rows.forEach(r => {
+    const sid = String(r[1]).trim();
+    state.counts[sid] = (state.counts[sid] || 0) + 1;
+  });
+  state.rows += rows.length;
+  writeCapacityState(state);
+}
+
+/*******************************
+ *      CRUCES DE HORARIO
+ *  Matriz { rows, conflicts: {sessionId: [ids que se solapan]} } compilada
+ *  desde Sessions una sola vez: onEdit la descarta al editar la hoja y
+ *  `rows` detecta filas agregadas o borradas. Así el control de
+ *  solapamiento es una intersección de conjuntos, sin parsear horarios.
+ *******************************/
+
+let _conflicts = null;
+
+/** sessionId -> [ids de las sesiones que se cruzan con ella] (memoizado en la ejecución) */
+function sessionConflicts() {
+  if (_conflicts) return _conflicts;
+
+  const cached = CacheService.getScriptCache().get(CONFLICTS_STATE_KEY);
+  const state = cached && JSON.parse(cached);
+  if (state && state.rows === readSheetAsObjects(SHEET_SESSIONS, HDR_SESSIONS).length) {
+    _conflicts = state.conflicts;
+    return _conflicts;
+  }
+  return rebuildSessionConflicts();
+}
+
+/** Compilar la matriz desde Sessions. También puede ejecutarse a mano desde el editor. */
+function rebuildSessionConflicts() {
+  const ranges = [];
+  sessionsById().forEach((s, id) => ranges.push({ id, range: sessionTimeRange(s) }));
+
+  const conflicts = {};
+  ranges.forEach(a => {
+    conflicts[a.id] = ranges
+      .filter(b => b.id !== a.id && overlap(a.range, b.range))
+      .map(b => b.id);
   });
+
+  const state = { rows: readSheetAsObjects(SHEET_SESSIONS, HDR_SESSIONS).length, conflicts };
+  CacheService.getScriptCache().put(CONFLICTS_STATE_KEY, JSON.stringify(state), CONFLICTS_CACHE_TTL_SECONDS);
+  _conflicts = conflicts;
+  return conflicts;
+}
+
+/** Primera sesión de `userSessions` que se cruza con `sessionId`, o null */
+function conflictingSession(sessionId, userSessions) {
+  const conflicts = new Set(sessionConflicts()[sessionId] || []);
+  for (const sid of userSessions)
+    if (conflicts.has(sid)) return sessionsById().get(sid);
+  return null;
+}
+
+/*******************************
+ *   SINCRONIZACIÓN CON LA APP
+ *  Estado: { version, reset: {hoja: versión}, rows: {hoja: {fila: versión}} }.
+ *  Las escrituras del propio script no disparan onEdit: esas filas
+ *  llegan a la app por los offsets de filas agregadas de getSyncDelta.
+ *******************************/
+
+/**
+ * Disparador simple: anota con una versión creciente las filas editadas
+ * a mano en Attendees y Sessions. Si no consigue el lock la edición no
+ * se anota; la app relee esas hojas completas cada cierto tiempo.
+ */
+function onEdit(e) {
+  const name = e.range.getSheet().getName();
+  if (SYNC_TRACKED_SHEETS.indexOf(name) === -1) return;
+
+  // Un horario editado invalida la matriz de cruces aunque no se consiga el lock
+  if (name === SHEET_SESSIONS)
+    CacheService.getScriptCache().remove(CONFLICTS_STATE_KEY);
+
+  const lock = LockService.getScriptLock();
+  if (!lock.tryLock(5000)) return;
+
+  try {
+    const edits = readSyncEdits();
+    edits.version += 1;
+
+    const rows = edits.rows[name] = edits.rows[name] || {};
+    const first = e.range.getRow();
+    for (let r = first; r < first + e.range.getNumRows(); r++)
+      rows[r] = edits.version;
+
+    if (Object.keys(rows).length > SYNC_EDITS_MAX_ROWS) {
+      edits.reset[name] = edits.version;
+      edits.rows[name] = {};
+    }
+
+    PropertiesService.getScriptProperties().setProperty(SYNC_EDITS_KEY, JSON.stringify(edits));
+  } finally {
+    lock.releaseLock();
+  }
+}
+
+function readSyncEdits() {
+  const stored = PropertiesService.getScriptProperties().getProperty(SYNC_EDITS_KEY);
+  return stored ? JSON.parse(stored) : { version: 0, reset: {}, rows: {} };
+}
+
+/** [[fila, ...valores]] de las filas de datos anteriores a `upTo` editadas tras `since` */
+function editedRows(name, headers, edits, since, upTo) {
+  const marks = edits.rows[name] || {};
+  const rows = Object.keys(marks)
+    .filter(r => marks[r] > since)
+    .map(Number)
+    .filter(r => r >= 2 && r - 2 < upTo)
+    .sort((a, b) => a - b);
+
+  if (!rows.length) return [];
+
+  // Un único getRange que cubre todas las filas editadas
+  const first = rows[0];
+  const values = getSheet(name, headers)
+    .getRange(first, 1, rows[rows.length - 1] - first + 1, headers.length)
+    .getValues();
+
+  return rows.map(r => [r].concat(values[r - first]));
+}
+
+/*******************************
+ *         HELPERS
+ *******************************/
+/**
+ * Si la app pidió `timing`, la respuesta va envuelta como
+ * { result, timing: { action, script_ms } }: así separa el tiempo de
+ * red del tiempo de ejecución del script.
+ */
+function jsonResponse(obj, timing) {
+  const payload = timing
+    ? { result: obj, timing: { action: timing.action, script_ms: Date.now() - timing.started } }
+    : obj;
+  return ContentService
+    .createTextOutput(JSON.stringify(payload))
+    .setMimeType(ContentService.MimeType.JSON);
+}
+
+function readSheetRowsFrom(name, headers, from, limit) {
+  const res = readSheetValuesFrom(name, headers, from, limit);
+  return {
+    total: res.total,
+    rows: res.values.map(row => rowToObject(headers, row))
+  };
+}
+
+function readSheetValuesFrom(name, headers, from, limit) {
+  const sh = getSheet(name, headers);
+  const total = Math.max(0, sh.getLastRow() - 1);
+  const start = Math.max(0, from || 0);
+
+  if (start >= total) return { total, values: [] };
+
+  const count = limit > 0 ? Math.min(limit, total - start) : total - start;
+  return {
+    total,
+    values: sh.getRange(2 + start, 1, count, sh.getLastColumn()).getValues()
+  };
+}
+
+function dayKey(d) {
+  return d.getFullYear() + '-' + d.getMonth() + '-' + d.getDate();
 }
 
 function existsAttendee(dni) {
-  return readSheetAsObjects(SHEET_ATTENDEES, HDR_ATTENDEES)
-    .some(r => String(r['DNI']).trim() === dni);
+  return attendeesByDni().has(dni);
 }
 
 function toNumber(v) {
@@ -1,11 +1,37 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, Response, g
+from werkzeug.http import parse_accept_header
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 from dotenv import load_dotenv
 import json
-from datetime import datetime
-import io
+from datetime import datetime, timedelta
+import threading
+import time
+import sqlite3
+import uuid
+import queue
+import asyncio
+import csv
+from array import array
+import gzip
+import mmap
+import struct
+import copy
+import re
+import random
+import atexit
+import bisect
+import collections
+import math
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse, parse_qs
+import click
 
 # Load environment variables
 load_dotenv()
@@ -16,41 +42,649 @@ CORS(app)
 # Configuration 
 APPSCRIPT_BASE_URL = os.getenv('APPSCRIPT_BASE_URL', 'https://script.google.com/macros/s/AKfycbxW0qZqvpGkURaRONQwsP4kQ1APVdhAY82czr9E6gk38zY_xoauKdyg1KCGt0sdrb4d/exec')
 
-class AppScriptAPI:
+# Backend de almacenamiento: 'appscript' (Google Sheets) o 'sqlite' (base local)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'appscript')
+SQLITE_DB_PATH = os.getenv('SQLITE_DB_PATH', 'asistencia.db')
+
+# Pool de conexiones HTTP hacia Apps Script (keep-alive)
+APPSCRIPT_POOL_SIZE = int(os.getenv('APPSCRIPT_POOL_SIZE', '10'))
+APPSCRIPT_MAX_RETRIES = int(os.getenv('APPSCRIPT_MAX_RETRIES', '2'))
+APPSCRIPT_BACKOFF_FACTOR = float(os.getenv('APPSCRIPT_BACKOFF_FACTOR', '0.3'))
+APPSCRIPT_CONNECT_TIMEOUT = float(os.getenv('APPSCRIPT_CONNECT_TIMEOUT', '5'))
+APPSCRIPT_READ_TIMEOUT = float(os.getenv('APPSCRIPT_READ_TIMEOUT', '10'))
+
+# Timeout de lectura por acción de Apps Script; APPSCRIPT_ACTION_TIMEOUTS
+# ("accion=segundos,...") sobrescribe estos valores (se lee tras configurar el log,
+# ver _parse_action_timeouts). El resto usa APPSCRIPT_READ_TIMEOUT
+APPSCRIPT_ACTION_TIMEOUTS = {
+    'getAttendeeByDNI': 5, 'getSessionsList': 5, 'getSessionsCapacity': 5, 'getSessionConflicts': 5,
+    'registerGeneralAttendance': 15, 'registerSessionAttendance': 15, 'checkin': 15,
+    'registerGeneralAttendanceBatch': 30, 'registerSessionAttendanceBatch': 30,
+    'exportAttendeesData': 30, 'getAttendeesSnapshot': 30, 'getSyncDelta': 30,
+}
+
+# Cortocircuito por acción: se abre si en la ventana fallan al menos la
+# fracción indicada de las llamadas, y deja pasar una de prueba tras el enfriamiento
+APPSCRIPT_BREAKER_ENABLED = os.getenv('APPSCRIPT_BREAKER_ENABLED', '1') == '1'
+APPSCRIPT_BREAKER_WINDOW = float(os.getenv('APPSCRIPT_BREAKER_WINDOW', '30'))
+APPSCRIPT_BREAKER_MIN_CALLS = int(os.getenv('APPSCRIPT_BREAKER_MIN_CALLS', '10'))
+APPSCRIPT_BREAKER_FAILURE_RATIO = float(os.getenv('APPSCRIPT_BREAKER_FAILURE_RATIO', '0.5'))
+APPSCRIPT_BREAKER_COOLDOWN = float(os.getenv('APPSCRIPT_BREAKER_COOLDOWN', '15'))
+
+# Peticiones de respaldo (hedging) para lecturas: si la primera no respondió
+# en APPSCRIPT_HEDGE_AFTER segundos se lanza otra y gana la primera que llegue.
+# 0 lo desactiva (cada respaldo es una ejecución más contra la cuota de Apps Script)
+APPSCRIPT_HEDGE_AFTER = float(os.getenv('APPSCRIPT_HEDGE_AFTER', '0'))
+APPSCRIPT_HEDGE_ACTIONS = set(os.getenv(
+    'APPSCRIPT_HEDGE_ACTIONS', 'getAttendeeByDNI,getSessionsList,getSessionsCapacity,getSessionConflicts').split(','))
+
+# Índice local de asistentes (búsqueda por DNI sin ir a Apps Script)
+# Con el backend SQLite no hace falta: la consulta ya es local
+ATTENDEE_INDEX_ENABLED = os.getenv('ATTENDEE_INDEX_ENABLED', '0' if STORAGE_BACKEND == 'sqlite' else '1') == '1'
+ATTENDEE_INDEX_REFRESH_SECONDS = float(os.getenv('ATTENDEE_INDEX_REFRESH_SECONDS', '30'))
+ATTENDEE_INDEX_FULL_RELOAD_EVERY = int(os.getenv('ATTENDEE_INDEX_FULL_RELOAD_EVERY', '20'))
+
+# Caché de respuestas de Apps Script (lista y capacidad de ponencias)
+SESSIONS_CACHE_TTL = float(os.getenv('SESSIONS_CACHE_TTL', '300'))
+CAPACITY_CACHE_TTL = float(os.getenv('CAPACITY_CACHE_TTL', '10'))
+CACHE_MAX_STALE_SECONDS = float(os.getenv('CACHE_MAX_STALE_SECONDS', '300'))
+ROSTER_CACHE_TTL = float(os.getenv('ROSTER_CACHE_TTL', '60'))
+
+# Caché compartida entre workers: uno refresca y escribe instantáneas en este
+# directorio y el resto las lee por mmap (vacío = cada worker va a Apps Script)
+SHARED_CACHE_DIR = os.getenv('SHARED_CACHE_DIR', '')
+SHARED_CACHE_POLL_SECONDS = float(os.getenv('SHARED_CACHE_POLL_SECONDS', '1'))
+
+# Estadísticas del evento (GET /api/v1/stats): cada cuánto se relee la base
+# de Apps Script y cuántos minutos cubre la serie de registros por minuto
+STATS_RESYNC_SECONDS = float(os.getenv('STATS_RESYNC_SECONDS', '300'))
+STATS_WINDOW_MINUTES = int(os.getenv('STATS_WINDOW_MINUTES', '60'))
+
+# Reserva de cupos en memoria antes de registrar en una ponencia (ver SeatLedger)
+CAPACITY_LEASES_ENABLED = os.getenv('CAPACITY_LEASES_ENABLED', '1') == '1'
+CAPACITY_LEASE_TTL = float(os.getenv('CAPACITY_LEASE_TTL', '30'))
+CAPACITY_LEASE_WAIT_SECONDS = float(os.getenv('CAPACITY_LEASE_WAIT_SECONDS', '2'))
+
+# Escaneos repetidos del mismo DNI: ventana en la que comparten resultado (s, 0 = desactivado)
+SCAN_DEDUP_WINDOW = float(os.getenv('SCAN_DEDUP_WINDOW', '5'))
+SCAN_DEDUP_MAX_ENTRIES = int(os.getenv('SCAN_DEDUP_MAX_ENTRIES', '10000'))
+
+# Modo de registro: 'sync' (espera a Apps Script) o 'write_behind' (journal local)
+REGISTRATION_MODE = os.getenv('REGISTRATION_MODE', 'sync')
+JOURNAL_PATH = os.getenv('JOURNAL_PATH', 'registration_journal.db')
+JOURNAL_BATCH_SIZE = int(os.getenv('JOURNAL_BATCH_SIZE', '20'))
+JOURNAL_DRAIN_INTERVAL = float(os.getenv('JOURNAL_DRAIN_INTERVAL', '1'))
+JOURNAL_MAX_ATTEMPTS = int(os.getenv('JOURNAL_MAX_ATTEMPTS', '8'))
+JOURNAL_RETRY_BASE_SECONDS = float(os.getenv('JOURNAL_RETRY_BASE_SECONDS', '2'))
+JOURNAL_STATUS_LIMIT = int(os.getenv('JOURNAL_STATUS_LIMIT', '50'))
+
+# Canal SSE de capacidad en vivo
+CAPACITY_STREAM_HEARTBEAT = float(os.getenv('CAPACITY_STREAM_HEARTBEAT', '15'))
+CAPACITY_STREAM_QUEUE_SIZE = int(os.getenv('CAPACITY_STREAM_QUEUE_SIZE', '50'))
+
+# Respuestas JSON comprimidas con gzip desde este tamaño en bytes (0 = nunca)
+GZIP_MIN_BYTES = int(os.getenv('GZIP_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+
+# Máximo de items aceptados por los endpoints de registro por lotes
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '200'))
+
+# Asistentes por página al transmitir el export CSV
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+
+# Sincronización del backend SQLite con Google Sheets (que sigue siendo la fuente de verdad)
+SHEETS_SYNC_ENABLED = os.getenv('SHEETS_SYNC_ENABLED', '0') == '1'
+SHEETS_SYNC_INTERVAL = float(os.getenv('SHEETS_SYNC_INTERVAL', '5'))
+SHEETS_SYNC_BATCH_SIZE = int(os.getenv('SHEETS_SYNC_BATCH_SIZE', '100'))
+SHEETS_SYNC_PULL_LIMIT = int(os.getenv('SHEETS_SYNC_PULL_LIMIT', '5000'))
+SHEETS_SYNC_FULL_PULL_EVERY = int(os.getenv('SHEETS_SYNC_FULL_PULL_EVERY', '120'))
+
+# Logging estructurado: una línea JSON por evento, escrita a stderr desde un hilo de fondo
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1'))
+LOG_REDACT_PII = os.getenv('LOG_REDACT_PII', '1') == '1'
+
+class JsonLogFormatter(logging.Formatter):
+    """Un objeto JSON por línea: ts, level, logger, msg y los campos pasados en `extra`"""
+
+    STANDARD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in self.STANDARD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+_DNI_PATTERN = re.compile(r'(?<!\d)(\d{2})\d{4}(\d{2})(?!\d)')
+_EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+(\.[\w-]+)+')
+
+def _redact(value):
+    """Enmascarar DNIs (12****78) y correos en un texto"""
+    return _EMAIL_PATTERN.sub('<email>', _DNI_PATTERN.sub(r'\1****\2', value))
+
+class _RedactPII(logging.Filter):
+    """Enmascara DNIs y correos en el mensaje y los campos de texto (corre en el hilo del listener)"""
+
+    def filter(self, record):
+        record.msg = _redact(record.getMessage())
+        record.args = None
+        if record.exc_text:
+            record.exc_text = _redact(record.exc_text)
+        for key, value in vars(record).items():
+            if isinstance(value, str) and key not in JsonLogFormatter.STANDARD_FIELDS:
+                setattr(record, key, _redact(value))
+        return True
+
+class _SampleDebug(logging.Filter):
+    """Deja pasar solo una fracción de los eventos DEBUG (los de mayor volumen)"""
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < LOG_DEBUG_SAMPLE_RATE
+
+class _DroppingQueueHandler(QueueHandler):
+    """Con la cola llena se descarta el evento en vez de bloquear la petición"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Como en QueueHandler, el traceback se formatea aquí; el JSON y el enmascarado, en el listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def _setup_logging():
+    """
+    Logger 'asistencia': el hilo de la petición solo filtra y encola el
+    evento; el formateo JSON, el enmascarado y la escritura a stderr
+    ocurren en el hilo del QueueListener.
+    """
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonLogFormatter())
+    if LOG_REDACT_PII:
+        stream.addFilter(_RedactPII())
+
+    handler = _DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(_SampleDebug())
+    listener = QueueListener(handler.queue, stream)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger('asistencia')
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(handler)
+    logger.propagate = False
+    return logger
+
+log = _setup_logging()
+
+def _parse_action_timeouts(raw):
+    """Leer APPSCRIPT_ACTION_TIMEOUTS ("accion=segundos,..."); las entradas inválidas se ignoran con un aviso"""
+    timeouts = {}
+    for item in raw.split(','):
+        if not item.strip():
+            continue
+        action, _, seconds = item.partition('=')
+        try:
+            value = float(seconds)
+        except ValueError:
+            value = None
+        if not action.strip() or value is None or value <= 0:
+            log.warning("Entrada inválida en APPSCRIPT_ACTION_TIMEOUTS, se ignora",
+                        extra={"entry": item.strip()})
+            continue
+        timeouts[action.strip()] = value
+    return timeouts
+
+APPSCRIPT_ACTION_TIMEOUTS.update(_parse_action_timeouts(os.getenv('APPSCRIPT_ACTION_TIMEOUTS', '')))
+
+# Métricas (GET /metrics, formato de texto de Prometheus)
+METRICS_BUCKETS = tuple(float(b) for b in os.getenv(
+    'METRICS_BUCKETS', '0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10').split(','))
+
+class Metrics:
+    """
+    Contadores, gauges e histogramas en memoria con etiquetas, expuestos en
+    el formato de texto de Prometheus.
+
+    Cada proceso lleva los suyos: con varios workers de gunicorn un scrape
+    ve solo al worker que lo atiende.
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._families = {}
+        self._collectors = []
+
+    def define(self, name, kind, help_text):
+        """Declarar una familia ('counter', 'gauge' o 'histogram')"""
+        self._families[name] = (kind, help_text, {})
+
+    def inc(self, name, value=1, **labels):
+        """Sumar a un contador o gauge (valores negativos para bajar un gauge)"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._families[name][2]
+            values[key] = values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Registrar una observación en un histograma"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._families[name][2]
+            counts = values.get(key)
+            if counts is None:
+                # Un contador por bucket (el último es +Inf) y la suma al final
+                counts = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def track(self, prefix, **labels):
+        """Medir un bloque: gauge `<prefix>_in_flight` e histograma `<prefix>_duration_seconds`"""
+        self.inc(f'{prefix}_in_flight', **labels)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f'{prefix}_duration_seconds', time.perf_counter() - started, **labels)
+            self.inc(f'{prefix}_in_flight', -1, **labels)
+
+    def collector(self, fn):
+        """Registrar `fn()` -> [(nombre, tipo, ayuda, etiquetas, valor)], leído en cada scrape"""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        with self._lock:
+            families = {name: (kind, help_text, {key: list(value) if isinstance(value, list) else value
+                                                 for key, value in values.items()})
+                        for name, (kind, help_text, values) in self._families.items()}
+        for fn in self._collectors:
+            for name, kind, help_text, labels, value in fn():
+                families.setdefault(name, (kind, help_text, {}))[2][tuple(sorted(labels.items()))] = value
+
+        lines = []
+        for name, (kind, help_text, values) in sorted(families.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(values.items()):
+                if kind != 'histogram':
+                    lines.append(f"{name}{self._labels(key)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), value):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else repr(bound)
+                    lines.append(f"{name}_bucket{self._labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(key)} {value[-1]}")
+                lines.append(f"{name}_count{self._labels(key)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(key):
+        if not key:
+            return ''
+        escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), chr(92) + "n")}"'
+                   for k, v in key)
+        return '{' + ','.join(escaped) + '}'
+
+metrics = Metrics()
+metrics.define('asistencia_http_requests_total', 'counter', 'Peticiones HTTP atendidas por endpoint y estado')
+metrics.define('asistencia_http_in_flight', 'gauge', 'Peticiones HTTP en curso por endpoint')
+metrics.define('asistencia_http_duration_seconds', 'histogram', 'Latencia de cada endpoint (hasta el primer byte)')
+metrics.define('asistencia_upstream_in_flight', 'gauge', 'Llamadas a Apps Script en curso por acción')
+metrics.define('asistencia_upstream_duration_seconds', 'histogram', 'Ida y vuelta de cada llamada a Apps Script (red + script)')
+metrics.define('asistencia_upstream_script_seconds', 'histogram', 'Tiempo de ejecución reportado por Apps Script')
+metrics.define('asistencia_upstream_errors_total', 'counter', 'Errores de Apps Script por acción y motivo')
+metrics.define('asistencia_upstream_hedges_total', 'counter', 'Peticiones de respaldo lanzadas por acción')
+
+def _unwrap_timing(action, payload):
+    """Quitar el sobre { result, timing } de Apps Script y registrar su tiempo de ejecución"""
+    if isinstance(payload, dict) and 'timing' in payload and 'result' in payload:
+        metrics.observe('asistencia_upstream_script_seconds',
+                        payload['timing'].get('script_ms', 0) / 1000, action=action)
+        payload = payload['result']
+    if isinstance(payload, dict) and 'error' in payload:
+        metrics.inc('asistencia_upstream_errors_total', action=action, reason='script')
+    return payload
+
+@contextmanager
+def _track_upstream(action):
+    """Medir una llamada a Apps Script; las excepciones cuentan como error con su tipo"""
+    try:
+        with metrics.track('asistencia_upstream', action=action):
+            yield
+    except Exception as e:
+        metrics.inc('asistencia_upstream_errors_total', action=action, reason=type(e).__name__)
+        raise
+
+class StorageBackend:
+    """
+    Operaciones de almacenamiento que usan las rutas, el índice y el journal.
+
+    Cada método retorna lo mismo que la acción homónima de
+    APPSCRIPT_FINAL.gs (los errores como {"error": ...}), así que las
+    rutas no dependen de dónde viven los datos.
+    """
+
+    def get_attendee_by_dni(self, dni):
+        raise NotImplementedError
+
+    def register_general_attendance(self, dni, timestamp=None, idempotency_key=None):
+        raise NotImplementedError
+
+    def get_sessions_list(self):
+        raise NotImplementedError
+
+    def get_sessions_capacity(self):
+        raise NotImplementedError
+
+    def get_session_conflicts(self):
+        raise NotImplementedError
+
+    def get_event_stats(self, minutes=STATS_WINDOW_MINUTES):
+        raise NotImplementedError
+
+    def register_session_attendance(self, dni, session_id, timestamp=None, idempotency_key=None):
+        raise NotImplementedError
+
+    def checkin(self, dni, session_id=None, timestamp=None, idempotency_key=None):
+        raise NotImplementedError
+
+    def export_attendees_data(self):
+        raise NotImplementedError
+
+    def export_attendees_page(self, offset=0, limit=EXPORT_PAGE_SIZE):
+        raise NotImplementedError
+
+    def register_general_attendance_batch(self, items):
+        raise NotImplementedError
+
+    def register_session_attendance_batch(self, items):
+        raise NotImplementedError
+
+    def get_attendees_snapshot(self, attendees_from=0, general_from=0, session_from=0):
+        raise NotImplementedError
+
+def _response_fields(response, **fields):
+    """Campos de log de una respuesta de Apps Script (sin el cuerpo, que trae datos personales)"""
+    return {
+        "status": response.status_code,
+        "bytes": len(response.content),
+        "elapsed_ms": round(response.elapsed.total_seconds() * 1000, 1),
+        **fields
+    }
+
+class CircuitOpenError(Exception):
+    """Llamada rechazada sin ir a Apps Script porque el circuito de su acción está abierto"""
+
+class _Circuit:
+    """Estado del cortocircuito de una acción"""
+
+    def __init__(self):
+        self.state = 'closed'
+        self.outcomes = collections.deque()
+        self.opened_at = 0.0
+        self.probing = False
+
+class CircuitBreaker:
+    """
+    Cortocircuito por acción de Apps Script.
+
+    - closed: las llamadas pasan y se anota si fallaron (excepción, 429 o
+      5xx; los {"error": ...} del script son respuestas válidas).
+    - open: en cuanto fallan `failure_ratio` de al menos `min_calls`
+      llamadas dentro de `window` segundos, las siguientes se rechazan
+      al instante con CircuitOpenError durante `cooldown` segundos.
+    - half_open: pasado el enfriamiento se deja pasar una sola llamada de
+      prueba; si funciona se cierra, si no se vuelve a abrir.
+
+    Así un Apps Script lento o limitado por cuota no retiene un hilo por
+    kiosko hasta el timeout.
+    """
+
+    def __init__(self, window=APPSCRIPT_BREAKER_WINDOW, min_calls=APPSCRIPT_BREAKER_MIN_CALLS,
+                 failure_ratio=APPSCRIPT_BREAKER_FAILURE_RATIO, cooldown=APPSCRIPT_BREAKER_COOLDOWN,
+                 enabled=APPSCRIPT_BREAKER_ENABLED):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def allow(self, action):
+        """Lanzar CircuitOpenError si `action` no debe llamar a Apps Script ahora"""
+        if not self.enabled:
+            return
+        with self._lock:
+            circuit = self._circuits.setdefault(action, _Circuit())
+            if circuit.state == 'open':
+                remaining = circuit.opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(f"Apps Script no disponible para {action}, "
+                                           f"reintento en {math.ceil(remaining)} s")
+                circuit.state = 'half_open'
+            if circuit.state == 'half_open':
+                if circuit.probing:
+                    raise CircuitOpenError(f"Apps Script no disponible para {action}, llamada de prueba en curso")
+                circuit.probing = True
+
+    def record(self, action, ok):
+        """Anotar el resultado de una llamada que allow() dejó pasar"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuits.setdefault(action, _Circuit())
+            if circuit.state == 'half_open':
+                circuit.probing = False
+                if ok:
+                    circuit.state = 'closed'
+                    circuit.outcomes.clear()
+                    log.info("Circuito cerrado", extra={"action": action})
+                else:
+                    circuit.state = 'open'
+                    circuit.opened_at = now
+                return
+            if circuit.state == 'open':
+                return
+
+            circuit.outcomes.append((now, ok))
+            while circuit.outcomes[0][0] < now - self.window:
+                circuit.outcomes.popleft()
+            failures = sum(1 for _, success in circuit.outcomes if not success)
+            if len(circuit.outcomes) >= self.min_calls and failures >= self.failure_ratio * len(circuit.outcomes):
+                circuit.state = 'open'
+                circuit.opened_at = now
+                circuit.outcomes.clear()
+                log.warning("Circuito abierto", extra={"action": action, "failures": failures,
+                                                       "window_seconds": self.window})
+
+    def states(self):
+        with self._lock:
+            return {action: circuit.state for action, circuit in self._circuits.items()}
+
+circuit_breaker = CircuitBreaker()
+
+def _upstream_failed(status):
+    """Respuestas que cuentan como fallo para el cortocircuito"""
+    return status == 429 or status >= 500
+
+class _UpstreamSession(requests.Session):
+    """
+    Sesión HTTP por la que pasan todas las llamadas a Apps Script:
+
+    - aplica el timeout de lectura de la acción (APPSCRIPT_ACTION_TIMEOUTS);
+    - consulta el cortocircuito antes de llamar y le anota el resultado (con
+      el circuito abierto responde un 503 local sin salir a la red);
+    - con APPSCRIPT_HEDGE_AFTER, lanza una petición de respaldo para las
+      lecturas lentas de APPSCRIPT_HEDGE_ACTIONS;
+    - mide cada llamada por acción y le pide su tiempo de ejecución. La
+      respuesta ya desenvuelta queda en response.json(), así los métodos de
+      AppScriptAPI no cambian.
+    """
+
+    # Los hilos se crean recién con el primer respaldo
+    _hedge_pool = ThreadPoolExecutor(max_workers=APPSCRIPT_POOL_SIZE * 2, thread_name_prefix='hedge')
+
+    def request(self, method, url, params=None, json=None, **kwargs):
+        if json is not None:
+            action = json.get('action', '')
+            json = {**json, "timing": True}
+        else:
+            params = dict(params or {})
+            action = params.get('action') or parse_qs(urlparse(url).query).get('action', [''])[0]
+            params['timing'] = '1'
+        if action in APPSCRIPT_ACTION_TIMEOUTS:
+            connect_timeout = kwargs['timeout'][0] if isinstance(kwargs.get('timeout'), tuple) else APPSCRIPT_CONNECT_TIMEOUT
+            kwargs['timeout'] = (connect_timeout, APPSCRIPT_ACTION_TIMEOUTS[action])
+
+        try:
+            circuit_breaker.allow(action)
+        except CircuitOpenError as e:
+            metrics.inc('asistencia_upstream_errors_total', action=action, reason='circuit_open')
+            return self._unavailable(url, str(e))
+
+        def send():
+            return super(_UpstreamSession, self).request(method, url, params=params, json=json, **kwargs)
+
+        ok = False
+        try:
+            with _track_upstream(action):
+                if APPSCRIPT_HEDGE_AFTER > 0 and method == 'GET' and action in APPSCRIPT_HEDGE_ACTIONS:
+                    response = self._hedged(action, send)
+                else:
+                    response = send()
+            ok = not _upstream_failed(response.status_code)
+        finally:
+            circuit_breaker.record(action, ok)
+
+        if response.status_code != 200:
+            metrics.inc('asistencia_upstream_errors_total', action=action, reason=f'http_{response.status_code}')
+            return response
+        try:
+            result = _unwrap_timing(action, response.json())
+        except ValueError:
+            metrics.inc('asistencia_upstream_errors_total', action=action, reason='invalid_json')
+            return response
+        response.json = lambda **_: result
+        return response
+
+    @staticmethod
+    def _unavailable(url, message):
+        """Respuesta 503 local, para que los métodos de AppScriptAPI la traten como cualquier error HTTP"""
+        response = requests.Response()
+        response.status_code = 503
+        response.url = url
+        response.encoding = 'utf-8'
+        response._content = message.encode('utf-8')
+        response.elapsed = timedelta(0)
+        return response
+
+    def _hedged(self, action, send):
+        """Primera respuesta válida entre la original y una de respaldo lanzada tras APPSCRIPT_HEDGE_AFTER"""
+        pending = {self._hedge_pool.submit(send)}
+        done, _ = wait(pending, timeout=APPSCRIPT_HEDGE_AFTER)
+        if done:
+            return done.pop().result()
+        metrics.inc('asistencia_upstream_hedges_total', action=action)
+        pending.add(self._hedge_pool.submit(send))
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # Si la otra sigue en curso, un fallo se descarta y se espera a esa
+            good = [f for f in done if f.exception() is None and not _upstream_failed(f.result().status_code)]
+            if good or not pending:
+                return (good or list(done))[0].result()
+
+class AppScriptAPI(StorageBackend):
     """Clase para manejar las llamadas a Google Apps Script"""
     
-    def __init__(self, base_url):
+    def __init__(self, base_url, pool_size=APPSCRIPT_POOL_SIZE,
+                 max_retries=APPSCRIPT_MAX_RETRIES,
+                 backoff_factor=APPSCRIPT_BACKOFF_FACTOR,
+                 connect_timeout=APPSCRIPT_CONNECT_TIMEOUT,
+                 read_timeout=APPSCRIPT_READ_TIMEOUT):
         self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = self._build_session(pool_size, max_retries, backoff_factor)
+
+    @staticmethod
+    def _build_session(pool_size, max_retries, backoff_factor):
+        """
+        Crear una sesión HTTP compartida con pool de conexiones keep-alive.
+
+        La sesión reutiliza las conexiones TCP/TLS hacia script.google.com
+        entre escaneos. Los POST solo se reintentan ante errores de conexión
+        (la petición no llegó a enviarse), nunca ante respuestas del servidor,
+        para no duplicar registros.
+        """
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        session = _UpstreamSession()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
     
     def get_attendee_by_dni(self, dni):
         """Buscar asistente por DNI"""
         try:
             url = f"{self.base_url}?action=getAttendeeByDNI&dni={dni}"
-            print(f"[DEBUG] Buscando DNI: {dni}")
-            print(f"[DEBUG] URL completa: {url}")
-            response = requests.get(url, timeout=10)
-            print(f"[DEBUG] Status: {response.status_code}")
-            print(f"[DEBUG] Respuesta completa: {response.text}")
+            response = self.session.get(url, timeout=self.timeout)
+            log.debug("Apps Script getAttendeeByDNI", extra=_response_fields(response, dni=dni))
             if response.status_code == 200:
-                data = response.json()
-                print(f"[DEBUG] JSON parseado: {data}")
-                return data
+                return response.json()
             else:
-                print(f"[ERROR] HTTP error: {response.status_code}")
+                log.error("Apps Script getAttendeeByDNI HTTP %s", response.status_code, extra={"dni": dni})
                 return {"error": f"HTTP {response.status_code}: {response.text}"}
         except Exception as e:
-            print(f"[ERROR] Exception en get_attendee_by_dni: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Exception en get_attendee_by_dni", extra={"dni": dni})
             return {"error": str(e)}
     
-    def register_general_attendance(self, dni):
+    def register_general_attendance(self, dni, timestamp=None, idempotency_key=None):
         """Registrar asistencia general"""
         try:
-            response = requests.post(f"{self.base_url}", json={
+            response = self.session.post(f"{self.base_url}", timeout=self.timeout, json={
                 "action": "registerGeneralAttendance",
                 "dni": dni,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": timestamp or datetime.now().isoformat(),
+                "idempotency_key": idempotency_key
             })
             if response.status_code == 200:
                 return response.json()
@@ -63,42 +697,86 @@ class AppScriptAPI:
         """Obtener lista de ponencias disponibles"""
         try:
             url = f"{self.base_url}?action=getSessionsList"
-            print(f"[DEBUG] Llamando a: {url}")
-            response = requests.get(url, timeout=10)
-            print(f"[DEBUG] Status: {response.status_code}")
-            print(f"[DEBUG] Respuesta: {response.text[:500]}")
+            response = self.session.get(url, timeout=self.timeout)
+            log.debug("Apps Script getSessionsList", extra=_response_fields(response))
             if response.status_code == 200:
                 return response.json()
             else:
                 return {"error": f"HTTP {response.status_code}: {response.text}"}
         except Exception as e:
-            print(f"[ERROR] Exception en get_sessions_list: {str(e)}")
+            log.exception("Exception en get_sessions_list")
             return {"error": str(e)}
     
     def get_sessions_capacity(self):
         """Obtener capacidad de todas las ponencias"""
         try:
             url = f"{self.base_url}?action=getSessionsCapacity"
-            print(f"[DEBUG] Llamando a: {url}")
-            response = requests.get(url, timeout=10)
-            print(f"[DEBUG] Status: {response.status_code}")
-            print(f"[DEBUG] Respuesta: {response.text[:500]}")
+            response = self.session.get(url, timeout=self.timeout)
+            log.debug("Apps Script getSessionsCapacity", extra=_response_fields(response))
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": f"HTTP {response.status_code}: {response.text}"}
+        except Exception as e:
+            log.exception("Exception en get_sessions_capacity")
+            return {"error": str(e)}
+    
+    def get_session_conflicts(self):
+        """Obtener la matriz de cruces de horario entre ponencias"""
+        try:
+            url = f"{self.base_url}?action=getSessionConflicts"
+            response = self.session.get(url, timeout=self.timeout)
+            log.debug("Apps Script getSessionConflicts", extra=_response_fields(response))
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": f"HTTP {response.status_code}: {response.text}"}
+        except Exception as e:
+            log.exception("Exception en get_session_conflicts")
+            return {"error": str(e)}
+
+    def get_event_stats(self, minutes=STATS_WINDOW_MINUTES):
+        """Agregados de asistencia general y registros por minuto de los últimos `minutes` minutos"""
+        try:
+            response = self.session.get(self.base_url, timeout=self.timeout, params={
+                "action": "getEventStats",
+                "minutes": minutes
+            })
+            log.debug("Apps Script getEventStats", extra=_response_fields(response))
             if response.status_code == 200:
                 return response.json()
             else:
                 return {"error": f"HTTP {response.status_code}: {response.text}"}
         except Exception as e:
-            print(f"[ERROR] Exception en get_sessions_capacity: {str(e)}")
+            log.exception("Exception en get_event_stats")
             return {"error": str(e)}
     
-    def register_session_attendance(self, dni, session_id):
+    def register_session_attendance(self, dni, session_id, timestamp=None, idempotency_key=None):
         """Registrar asistencia a ponencia"""
         try:
-            response = requests.post(f"{self.base_url}", json={
+            response = self.session.post(f"{self.base_url}", timeout=self.timeout, json={
                 "action": "registerSessionAttendance",
                 "dni": dni,
                 "session_id": session_id,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": timestamp or datetime.now().isoformat(),
+                "idempotency_key": idempotency_key
+            })
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": f"HTTP {response.status_code}: {response.text}"}
+        except Exception as e:
+            return {"error": str(e)}
+    
+    def checkin(self, dni, session_id=None, timestamp=None, idempotency_key=None):
+        """Búsqueda, asistencia general y registro opcional en ponencia en una sola ejecución"""
+        try:
+            response = self.session.post(f"{self.base_url}", timeout=self.timeout, json={
+                "action": "checkin",
+                "dni": dni,
+                "session_id": session_id,
+                "timestamp": timestamp or datetime.now().isoformat(),
+                "idempotency_key": idempotency_key
             })
             if response.status_code == 200:
                 return response.json()
@@ -110,7 +788,81 @@ class AppScriptAPI:
     def export_attendees_data(self):
         """Exportar datos de asistentes"""
         try:
-            response = requests.get(f"{self.base_url}?action=exportAttendeesData")
+            response = self.session.get(f"{self.base_url}?action=exportAttendeesData", timeout=self.timeout)
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": f"HTTP {response.status_code}: {response.text}"}
+        except Exception as e:
+            return {"error": str(e)}
+
+    def export_attendees_page(self, offset=0, limit=EXPORT_PAGE_SIZE):
+        """Página [offset, offset + limit) del export CSV (sin la cabecera en csv_rows)"""
+        try:
+            response = self.session.get(self.base_url, timeout=self.timeout, params={
+                "action": "exportAttendeesData",
+                "offset": offset,
+                "limit": limit
+            })
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": f"HTTP {response.status_code}: {response.text}"}
+        except Exception as e:
+            return {"error": str(e)}
+
+    def register_general_attendance_batch(self, items):
+        """Registrar asistencia general de varios DNIs en una sola ejecución"""
+        return self._post_batch("registerGeneralAttendanceBatch", items)
+    
+    def register_session_attendance_batch(self, items):
+        """Registrar varios pares (dni, session_id) en una sola ejecución"""
+        return self._post_batch("registerSessionAttendanceBatch", items)
+    
+    def _post_batch(self, action, items):
+        try:
+            response = self.session.post(f"{self.base_url}", timeout=self.timeout, json={
+                "action": action,
+                "items": items
+            })
+            if response.status_code != 200:
+                return {"error": f"HTTP {response.status_code}: {response.text}"}
+            result = response.json()
+            if 'error' not in result and len(result.get('results', [])) != len(items):
+                return {"error": f"{action} devolvió {len(result.get('results', []))} resultados para {len(items)} items"}
+            return result
+        except Exception as e:
+            return {"error": str(e)}
+    
+    def get_attendees_snapshot(self, attendees_from=0, general_from=0, session_from=0):
+        """Volcado masivo (o incremental desde los offsets dados) para el índice local"""
+        try:
+            response = self.session.get(self.base_url, timeout=self.timeout, params={
+                "action": "getAttendeesSnapshot",
+                "attendees_from": attendees_from,
+                "general_from": general_from,
+                "session_from": session_from
+            })
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": f"HTTP {response.status_code}: {response.text}"}
+        except Exception as e:
+            return {"error": str(e)}
+    
+    def get_sync_delta(self, attendees_from=0, sessions_from=0, general_from=0, session_from=0,
+                       edits_since=0, limit=0):
+        """Filas agregadas desde cada offset y filas editadas a mano tras `edits_since`"""
+        try:
+            response = self.session.get(self.base_url, timeout=self.timeout, params={
+                "action": "getSyncDelta",
+                "attendees_from": attendees_from,
+                "sessions_from": sessions_from,
+                "general_from": general_from,
+                "session_from": session_from,
+                "edits_since": edits_since,
+                "limit": limit
+            })
             if response.status_code == 200:
                 return response.json()
             else:
@@ -118,10 +870,3144 @@ class AppScriptAPI:
         except Exception as e:
             return {"error": str(e)}
 
-# Initialize API client
-api_client = AppScriptAPI(APPSCRIPT_BASE_URL)
+# Reglas de APPSCRIPT_FINAL.gs replicadas para el backend SQLite
+_MONTHS = {'ene': 1, 'feb': 2, 'mar': 3, 'abr': 4, 'may': 5, 'jun': 6, 'jul': 7,
+           'ago': 8, 'sep': 9, 'set': 9, 'oct': 10, 'nov': 11, 'dic': 12}
+
+def _to_number(value):
+    """toNumber(): número o 0"""
+    try:
+        n = float(value)
+    except (TypeError, ValueError):
+        return 0
+    return int(n) if n.is_integer() else n
+
+def _per_minute(general_times, session_times, minutes):
+    """Filas [minuto epoch, generales, ponencias] de los últimos `minutes` minutos, como getEventStats"""
+    since = time.time() - minutes * 60
+    buckets = {}
+    for column, rows in ((1, general_times), (2, session_times)):
+        for (timestamp,) in rows:
+            try:
+                t = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                continue
+            if t >= since:
+                minute = int(t // 60) * 60
+                buckets.setdefault(minute, [minute, 0, 0])[column] += 1
+    return [buckets[minute] for minute in sorted(buckets)]
+
+def _day_key(timestamp):
+    """dayKey(): fecha local del timestamp (ISO, o dd/mm/aaaa del CSV de Sheets)"""
+    text = str(timestamp).strip()
+    try:
+        dt = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            dt = datetime.strptime(text.split(' ')[0], '%d/%m/%Y')
+        except ValueError:
+            return text[:10]
+    if dt.tzinfo:
+        dt = dt.astimezone()
+    return dt.date().isoformat()
+
+def _day_ordinal(timestamp):
+    """Día local del timestamp como ordinal de fecha (0 si no se puede leer)"""
+    try:
+        return datetime.fromisoformat(_day_key(timestamp)).toordinal()
+    except ValueError:
+        return 0
+
+def _age_seconds(timestamp):
+    """Segundos transcurridos desde un timestamp ISO (0 si no se puede leer)"""
+    try:
+        dt = datetime.fromisoformat(str(timestamp).strip().replace('Z', '+00:00'))
+    except ValueError:
+        return 0
+    return max(0.0, round((datetime.now(dt.tzinfo) - dt).total_seconds(), 1))
+
+def _parse_hour(hhmm):
+    """parseHour(): 'HH:MM' con am/pm opcional -> (h, m)"""
+    text = str(hhmm).lower()
+    pm = 'pm' in text
+    h, m = [int(part) for part in text.replace('am', '').replace('pm', '').strip().split(':')[:2]]
+    if pm and h < 12:
+        h += 12
+    if not pm and h == 12:
+        h = 0
+    return h, m
+
+def _convert_day(dia):
+    """convertDay(): 'DD-mes' -> (día, mes); vacío o sin guion -> hoy"""
+    text = str(dia or '').strip()
+    if '-' not in text:
+        today = datetime.now()
+        return today.day, today.month
+    day, month = text.split('-')[:2]
+    return _to_number(day), _MONTHS.get(month.lower())
+
+def _session_time_range(dia, start, end):
+    """sessionTimeRange(): (inicio, fin) en 2025, o None si la fecha no es válida"""
+    day, month = _convert_day(dia)
+    try:
+        base = datetime(2025, month, int(day))
+        h1, m1 = _parse_hour(start)
+        h2, m2 = _parse_hour(end)
+    except (TypeError, ValueError):
+        return None
+    return (base + timedelta(hours=h1, minutes=m1), base + timedelta(hours=h2, minutes=m2))
+
+def _overlap(a, b):
+    """overlap(): con fechas inválidas (NaN en Apps Script) nunca hay solapamiento"""
+    return a is not None and b is not None and a[0] < b[1] and b[0] < a[1]
+
+def _session_conflicts(sessions):
+    """rebuildSessionConflicts(): [(id, dia, inicio, fin)] en orden de hoja -> {id: [ids que se solapan]}"""
+    ranges = [(sid, _session_time_range(dia, start, end)) for sid, dia, start, end in sessions]
+    return {a: [b for b, range_b in ranges if b != a and _overlap(range_a, range_b)]
+            for a, range_a in ranges}
+
+def _csv_cell(value):
+    """csvCell()"""
+    text = '' if value is None else str(value)
+    if '"' in text or ',' in text or '\n' in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+def _full_name(nombres, apellidos):
+    return f"{nombres or ''} {apellidos or ''}".strip()
+
+class SQLiteStorage(StorageBackend):
+    """
+    Backend local sobre SQLite con las mismas reglas que APPSCRIPT_FINAL.gs.
+
+    Cada registro corre en una transacción BEGIN IMMEDIATE: los cupos se
+    descuentan con un UPDATE condicional sobre el contador de la sesión y
+    UNIQUE(dni, session_id) impide duplicados, también entre procesos que
+    comparten el archivo (varios workers). Las hojas se cargan con
+    `flask import-sheets` desde los CSV descargados de cada pestaña.
+
+    Como réplica de Google Sheets (ver SheetsSync) cada fila de asistencia
+    lleva `sync_state`: 'pending' (registrada aquí, sin enviar), 'pushed'
+    (aceptada por Sheets, aún no vista en el pull) o 'synced' (presente en
+    la hoja). Attendees y Sessions guardan su número de fila en la hoja.
+    """
+
+    # Mismas cabeceras que valida Apps Script en cada hoja
+    SHEET_HEADERS = {
+        'Attendees': ['NOMBRES', 'APELLIDOS', 'E-MAIL', 'CELULAR', 'DNI'],
+        'Sessions': ['ID', 'Ponente', 'Tipo', 'Eje', 'Cupos totales',
+                     'Dia', 'Duracion', 'Tiempo Inicio', 'Tiempo Fin', 'Horas'],
+        'GeneralAttendance': ['Doc. Identidad', 'Marca de tiempo', 'Kit Entregado'],
+        'SessionAttendance': ['Doc. Identidad', 'Sesion ID', 'Marca de tiempo'],
+    }
+
+    # CacheService admite como máximo 6 horas; se mantiene la misma ventana
+    IDEMPOTENCY_TTL_SECONDS = 21600
+
+    # Watermark de sync_meta -> parte de getSyncDelta, y hoja -> watermark
+    SYNC_PARTS = {
+        'attendees_from': 'attendees',
+        'sessions_from': 'sessions',
+        'general_from': 'general',
+        'session_from': 'session_attendance',
+    }
+    SYNC_SHEETS = {
+        'Attendees': 'attendees_from',
+        'Sessions': 'sessions_from',
+        'GeneralAttendance': 'general_from',
+        'SessionAttendance': 'session_from',
+    }
+
+    # Columnas agregadas después de la primera versión del esquema
+    MIGRATIONS = [
+        ('attendees', 'sheet_row', 'INTEGER'),
+        ('sessions', 'sheet_row', 'INTEGER'),
+        ('general_attendance', 'sync_state', "TEXT NOT NULL DEFAULT 'pending'"),
+        ('general_attendance', 'push_key', 'TEXT'),
+        ('session_attendance', 'sync_state', "TEXT NOT NULL DEFAULT 'pending'"),
+        ('session_attendance', 'push_key', 'TEXT'),
+    ]
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            compile_conflicts = not conn.execute("SELECT 1 FROM sqlite_master "
+                                                 "WHERE name = 'session_conflicts'").fetchone()
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS attendees (
+                    pos INTEGER PRIMARY KEY,
+                    dni TEXT NOT NULL UNIQUE,
+                    nombres TEXT,
+                    apellidos TEXT,
+                    email TEXT,
+                    celular TEXT
+                );
+                CREATE TABLE IF NOT EXISTS sessions (
+                    pos INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    ponente TEXT,
+                    tipo TEXT,
+                    eje TEXT,
+                    cupos_totales NUMERIC NOT NULL DEFAULT 0,
+                    dia TEXT,
+                    duracion TEXT,
+                    tiempo_inicio TEXT,
+                    tiempo_fin TEXT,
+                    horas TEXT,
+                    registered INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS session_conflicts (
+                    session_id TEXT NOT NULL,
+                    conflict_id TEXT NOT NULL,
+                    PRIMARY KEY (session_id, conflict_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS general_attendance (
+                    id INTEGER PRIMARY KEY,
+                    dni TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    kit_entregado INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_general_dni_day ON general_attendance (dni, day);
+                CREATE TABLE IF NOT EXISTS session_attendance (
+                    id INTEGER PRIMARY KEY,
+                    dni TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    UNIQUE (dni, session_id)
+                );
+                CREATE TABLE IF NOT EXISTS idempotency (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS sync_meta (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS sync_conflicts (
+                    id INTEGER PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    dni TEXT NOT NULL,
+                    session_id TEXT,
+                    timestamp TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+            """)
+            for table, column, decl in self.MIGRATIONS:
+                if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_general_sync ON general_attendance (sync_state, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_session_sync ON session_attendance (sync_state, id)")
+            if compile_conflicts:
+                # Base creada antes de la matriz de cruces
+                conn.execute("BEGIN IMMEDIATE")
+                self._compile_conflicts(conn)
+                conn.execute("COMMIT")
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _replayed(self, conn, key):
+        """Respuesta original de un reenvío con la misma idempotency_key"""
+        if not key:
+            return None
+        row = conn.execute("SELECT result FROM idempotency WHERE key = ? AND created_at > ?",
+                           (key, time.time() - self.IDEMPOTENCY_TTL_SECONDS)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _remember(self, conn, key, result):
+        if key and 'error' not in result:
+            conn.execute("INSERT OR REPLACE INTO idempotency (key, result, created_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(result), time.time()))
+
+    def get_attendee_by_dni(self, dni):
+        """Buscar asistente por DNI"""
+        if not dni or len(dni) != 8:
+            return {"error": "dni inválido (8 dígitos)"}
+        try:
+            with self._lock:
+                result = self._attendee_state(self._connect(), dni)
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+        return result if result is not None else {"error": "DNI no encontrado."}
+
+    def _attendee_state(self, conn, dni):
+        """Estado del asistente con la forma de getAttendeeByDNI (None si no existe)"""
+        att = conn.execute("SELECT nombres, apellidos FROM attendees WHERE dni = ?", (dni,)).fetchone()
+        if not att:
+            return None
+        general = conn.execute("SELECT 1 FROM general_attendance WHERE dni = ? LIMIT 1", (dni,)).fetchone()
+        mine = {row[0] for row in conn.execute("SELECT session_id FROM session_attendance WHERE dni = ?", (dni,))}
+
+        result = {
+            "dni": dni,
+            "nombre": _full_name(*att),
+            "asistencia_general": general is not None
+        }
+        for (session_id,) in conn.execute("SELECT id FROM sessions ORDER BY pos"):
+            result[session_id] = session_id in mine
+        return result
+
+    def _register_general(self, conn, dni, timestamp):
+        if not dni or len(dni) != 8:
+            return {"error": "dni inválido"}
+        if not conn.execute("SELECT 1 FROM attendees WHERE dni = ?", (dni,)).fetchone():
+            return {"error": "DNI no existe en Attendees."}
+
+        day = _day_key(timestamp)
+        today = conn.execute("SELECT timestamp FROM general_attendance WHERE dni = ? AND day = ? ORDER BY id LIMIT 1",
+                             (dni, day)).fetchone()
+        if today:
+            has_kit = conn.execute("SELECT 1 FROM general_attendance WHERE dni = ? AND kit_entregado = 1 LIMIT 1",
+                                   (dni,)).fetchone()
+            return {
+                "registered": True,
+                "dni": dni,
+                "timestamp": today[0],
+                "kit_entregado": has_kit is not None,
+                "already_registered_today": True
+            }
+
+        first_time = not conn.execute("SELECT 1 FROM general_attendance WHERE dni = ? LIMIT 1", (dni,)).fetchone()
+        conn.execute("INSERT INTO general_attendance (dni, timestamp, day, kit_entregado) VALUES (?, ?, ?, ?)",
+                     (dni, timestamp, day, int(first_time)))
+        return {
+            "registered": True,
+            "dni": dni,
+            "timestamp": timestamp,
+            "kit_entregado": first_time
+        }
+
+    def _register_session(self, conn, dni, session_id, timestamp):
+        if not dni or len(dni) != 8:
+            return {"error": "dni inválido"}
+        if not session_id:
+            return {"error": "session_id requerido"}
+        if not conn.execute("SELECT 1 FROM attendees WHERE dni = ?", (dni,)).fetchone():
+            return {"error": "DNI no existe"}
+
+        session_id = str(session_id).strip()
+        ses = conn.execute("SELECT tipo, cupos_totales, registered FROM sessions WHERE id = ?",
+                           (session_id,)).fetchone()
+        if not ses:
+            return {"error": "session_id no existe"}
+        name, total, registered = ses[0], ses[1], ses[2]
+
+        if not conn.execute("SELECT 1 FROM general_attendance WHERE dni = ? LIMIT 1", (dni,)).fetchone():
+            return {"no_general_attendance": True, "dni": dni}
+
+        no_capacity = {
+            "no_capacity": True,
+            "session_id": session_id,
+            "session_name": name,
+            "available_capacity": 0
+        }
+        if registered >= total:
+            return no_capacity
+
+        if conn.execute("SELECT 1 FROM session_attendance WHERE dni = ? AND session_id = ?",
+                        (dni, session_id)).fetchone():
+            return {
+                "already_registered": True,
+                "dni": dni,
+                "session_id": session_id,
+                "session_name": name
+            }
+
+        # Solapamiento: primera ponencia del asistente (en orden de registro) en la matriz de cruces
+        conflict = conn.execute("SELECT s.id, s.tipo FROM session_attendance a "
+                                "JOIN session_conflicts c ON c.session_id = ? AND c.conflict_id = a.session_id "
+                                "JOIN sessions s ON s.id = a.session_id "
+                                "WHERE a.dni = ? ORDER BY a.id LIMIT 1", (session_id, dni)).fetchone()
+        if conflict:
+            return {
+                "overlap": True,
+                "conflict_with": conflict[0],
+                "conflict_name": conflict[1]
+            }
+
+        # El cupo se toma con un UPDATE condicional dentro de la transacción
+        taken = conn.execute("UPDATE sessions SET registered = registered + 1 "
+                             "WHERE id = ? AND registered < cupos_totales", (session_id,)).rowcount
+        if not taken:
+            return no_capacity
+        conn.execute("INSERT INTO session_attendance (dni, session_id, timestamp) VALUES (?, ?, ?)",
+                     (dni, session_id, timestamp))
+        return {
+            "registered": True,
+            "dni": dni,
+            "session_id": session_id,
+            "session_name": name,
+            "timestamp": timestamp
+        }
+
+    def register_general_attendance(self, dni, timestamp=None, idempotency_key=None):
+        """Registrar asistencia general"""
+        try:
+            with self._transaction() as conn:
+                result = self._replayed(conn, idempotency_key)
+                if result is None:
+                    result = self._register_general(conn, dni, timestamp or datetime.now().isoformat())
+                    self._remember(conn, idempotency_key, result)
+            return result
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+
+    def register_session_attendance(self, dni, session_id, timestamp=None, idempotency_key=None):
+        """Registrar asistencia a ponencia"""
+        try:
+            with self._transaction() as conn:
+                result = self._replayed(conn, idempotency_key)
+                if result is None:
+                    result = self._register_session(conn, dni, session_id, timestamp or datetime.now().isoformat())
+                    self._remember(conn, idempotency_key, result)
+            return result
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+
+    def checkin(self, dni, session_id=None, timestamp=None, idempotency_key=None):
+        """Búsqueda, asistencia general y registro opcional en ponencia en una sola transacción"""
+        dni = str(dni or '').strip()
+        if len(dni) != 8:
+            return {"error": "dni inválido"}
+        timestamp = timestamp or datetime.now().isoformat()
+        try:
+            with self._transaction() as conn:
+                result = self._replayed(conn, idempotency_key)
+                if result is None:
+                    result = self._checkin(conn, dni, session_id, timestamp)
+                    self._remember(conn, idempotency_key, result)
+            return result
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+
+    def _checkin(self, conn, dni, session_id, timestamp):
+        if not conn.execute("SELECT 1 FROM attendees WHERE dni = ?", (dni,)).fetchone():
+            return {"not_found": True, "dni": dni}
+
+        result = {"general": self._register_general(conn, dni, timestamp)}
+        if 'error' in result['general']:
+            return result['general']
+        if session_id:
+            result['session'] = self._register_session(conn, dni, session_id, timestamp)
+        result['attendee'] = self._attendee_state(conn, dni)
+        return result
+
+    def register_general_attendance_batch(self, items):
+        """Registrar asistencia general de varios DNIs en una sola transacción"""
+        try:
+            with self._transaction() as conn:
+                # Como en Apps Script, los reenvíos se resuelven antes de procesar el lote
+                results = [self._replayed(conn, item.get('idempotency_key')) for item in items]
+                for i, item in enumerate(items):
+                    if results[i] is None:
+                        dni = str(item.get('dni') or '').strip()
+                        results[i] = self._register_general(conn, dni, item.get('timestamp') or datetime.now().isoformat())
+                        if 'error' in results[i]:
+                            results[i]['dni'] = dni
+                for item, result in zip(items, results):
+                    self._remember(conn, item.get('idempotency_key'), result)
+            return {"results": results}
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+
+    def register_session_attendance_batch(self, items):
+        """Registrar varios pares (dni, session_id) en una sola transacción"""
+        try:
+            with self._transaction() as conn:
+                results = [self._replayed(conn, item.get('idempotency_key')) for item in items]
+                for i, item in enumerate(items):
+                    if results[i] is None:
+                        dni = str(item.get('dni') or '').strip()
+                        session_id = str(item.get('session_id') or '').strip()
+                        results[i] = self._register_session(conn, dni, session_id,
+                                                            item.get('timestamp') or datetime.now().isoformat())
+                        if 'error' in results[i]:
+                            results[i]['dni'] = dni
+                            if results[i]['error'] == 'session_id no existe':
+                                results[i]['session_id'] = session_id
+                for item, result in zip(items, results):
+                    self._remember(conn, item.get('idempotency_key'), result)
+            return {"results": results}
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+
+    def get_sessions_list(self):
+        """Obtener lista de ponencias disponibles"""
+        try:
+            rows = self._query("SELECT id, tipo, eje FROM sessions ORDER BY pos")
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+        return [{"id": sid, "name": name, "description": eje} for sid, name, eje in rows]
+
+    def get_sessions_capacity(self):
+        """Obtener capacidad de todas las ponencias"""
+        try:
+            rows = self._query("SELECT id, tipo, cupos_totales, registered FROM sessions ORDER BY pos")
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+        return {
+            sid: {"available": max(0, total - registered), "total": total, "name": name}
+            for sid, name, total, registered in rows
+        }
+
+    def get_session_conflicts(self):
+        """Obtener la matriz de cruces de horario entre ponencias"""
+        try:
+            rows = self._query("SELECT s.id, c.conflict_id FROM sessions s "
+                               "LEFT JOIN session_conflicts c ON c.session_id = s.id "
+                               "LEFT JOIN sessions o ON o.id = c.conflict_id ORDER BY s.pos, o.pos")
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+        conflicts = {}
+        for sid, conflict_id in rows:
+            conflicts.setdefault(sid, [])
+            if conflict_id is not None:
+                conflicts[sid].append(conflict_id)
+        return conflicts
+
+    def get_event_stats(self, minutes=STATS_WINDOW_MINUTES):
+        """getEventStats(): agregados de asistencia general y registros por minuto"""
+        try:
+            attendees, checkins, kits, today = self._query(
+                "SELECT COUNT(DISTINCT dni), COUNT(*), COALESCE(SUM(kit_entregado), 0), "
+                "COUNT(DISTINCT CASE WHEN day = ? THEN dni END) FROM general_attendance",
+                (_day_key(datetime.now().isoformat()),))[0]
+            general_times = self._query("SELECT timestamp FROM general_attendance")
+            session_times = self._query("SELECT timestamp FROM session_attendance")
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+        return {
+            "general": {"attendees": attendees, "checkins": checkins, "today": today, "kits_delivered": kits},
+            "per_minute": _per_minute(general_times, session_times, minutes)
+        }
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def _export_rows(self, offset=0, limit=-1):
+        """(cabecera, filas) del CSV; columnas de ponencias ordenadas por ID"""
+        sessions = self._query("SELECT id, tipo FROM sessions ORDER BY id")
+        header = ['DNI', 'Nombre', 'Asistencia General'] + [name for _, name in sessions]
+        attendees = self._query("""
+            SELECT a.dni, a.nombres, a.apellidos,
+                   EXISTS (SELECT 1 FROM general_attendance g WHERE g.dni = a.dni),
+                   (SELECT group_concat(s.session_id, char(31)) FROM session_attendance s WHERE s.dni = a.dni)
+            FROM attendees a ORDER BY a.pos LIMIT ? OFFSET ?
+        """, (limit, offset))
+        rows = []
+        for dni, nombres, apellidos, general, mine in attendees:
+            mine = set(mine.split('\x1f')) if mine else set()
+            rows.append([dni, _full_name(nombres, apellidos), 'Sí' if general else 'No']
+                        + ['Sí' if sid in mine else 'No' for sid, _ in sessions])
+        return header, rows
+
+    def export_attendees_data(self):
+        """Exportar datos de asistentes"""
+        try:
+            header, rows = self._export_rows()
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+        return {"csv_data": '\n'.join(','.join(_csv_cell(v) for v in row) for row in [header] + rows)}
+
+    def export_attendees_page(self, offset=0, limit=EXPORT_PAGE_SIZE):
+        """Página [offset, offset + limit) del export CSV (sin la cabecera en csv_rows)"""
+        try:
+            header, rows = self._export_rows(offset, limit)
+            total = self._query("SELECT COUNT(*) FROM attendees")[0][0]
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+        next_offset = offset + len(rows)
+        return {
+            "header": ','.join(_csv_cell(v) for v in header),
+            "csv_rows": '\n'.join(','.join(_csv_cell(v) for v in row) for row in rows),
+            "offset": offset,
+            "count": len(rows),
+            "total": total,
+            "next_offset": next_offset if next_offset < total else None
+        }
+
+    def get_attendees_snapshot(self, attendees_from=0, general_from=0, session_from=0):
+        """Volcado (o incremental desde los offsets dados) para el índice local"""
+        try:
+            with self._lock:
+                conn = self._connect()
+
+                def part(table, columns, start):
+                    total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    order = 'pos' if table == 'attendees' else 'id'
+                    rows = conn.execute(f"SELECT {columns} FROM {table} ORDER BY {order} LIMIT -1 OFFSET ?",
+                                        (start,)).fetchall()
+                    return {"from": start, "total": total, "rows": rows}
+
+                sessions = [row[0] for row in conn.execute("SELECT id FROM sessions ORDER BY pos")]
+                attendees = part('attendees', 'dni, nombres, apellidos', attendees_from)
+                general = part('general_attendance', 'dni, timestamp, kit_entregado', general_from)
+                session_attendance = part('session_attendance', 'dni, session_id', session_from)
+        except sqlite3.Error as e:
+            return {"error": str(e)}
+
+        attendees['rows'] = [[dni, _full_name(n, a)] for dni, n, a in attendees['rows']]
+        rows = general['rows']
+        general['rows'] = [dni for dni, _, _ in rows]
+        general['timestamps'] = [timestamp for _, timestamp, _ in rows]
+        general['kits'] = [bool(kit) for _, _, kit in rows]
+        session_attendance['rows'] = [list(row) for row in session_attendance['rows']]
+        return {
+            "sessions": sessions,
+            "attendees": attendees,
+            "general": general,
+            "session_attendance": session_attendance
+        }
+
+    def import_sheet(self, name, rows):
+        """
+        Cargar las filas de una hoja (la primera es la cabecera, como en el
+        CSV descargado de Google Sheets). Attendees y Sessions se combinan
+        por DNI/ID; las hojas de asistencia se agregan. Retorna las filas leídas.
+        """
+        expected = self.SHEET_HEADERS[name]
+        if not rows or [str(h).strip() for h in rows[0]] != expected:
+            raise ValueError(f'Cabeceras inválidas en hoja "{name}"')
+        data = [(i + 2, row + [''] * (len(expected) - len(row)))
+                for i, row in enumerate(rows[1:]) if any(str(v).strip() for v in row)]
+
+        with self._transaction() as conn:
+            if name == 'Attendees':
+                for sheet_row, row in data:
+                    self._insert_attendee(conn, sheet_row, row)
+            elif name == 'Sessions':
+                for sheet_row, row in data:
+                    self._upsert_session(conn, sheet_row, row)
+                self._compile_conflicts(conn)
+            elif name == 'GeneralAttendance':
+                for _, row in data:
+                    self._insert_general(conn, row)
+            else:
+                for _, row in data:
+                    self._upsert_session_attendance(conn, row)
+            self._recount_sessions(conn)
+            # La sincronización con Sheets continúa desde el final del CSV
+            self._set_meta(conn, **{self.SYNC_SHEETS[name]: len(rows) - 1})
+        return len(data)
+
+    # Escritura de filas de la hoja (import-sheets y pull de SheetsSync)
+
+    @staticmethod
+    def _is_blank(row):
+        return not any(str(v).strip() for v in row)
+
+    def _insert_attendee(self, conn, sheet_row, row):
+        # Como attendeesByDni, ante DNIs repetidos gana la primera fila
+        conn.execute("INSERT INTO attendees (nombres, apellidos, email, celular, dni, sheet_row) "
+                     "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (dni) DO NOTHING",
+                     [*row[:4], str(row[4]).strip(), sheet_row])
+
+    def _update_attendee(self, conn, sheet_row, row):
+        """Fila editada a mano: se ubica por su número de fila en la hoja"""
+        if self._is_blank(row):
+            conn.execute("DELETE FROM attendees WHERE sheet_row = ?", (sheet_row,))
+            return
+        updated = conn.execute("UPDATE OR IGNORE attendees SET nombres = ?, apellidos = ?, email = ?, "
+                               "celular = ?, dni = ? WHERE sheet_row = ?",
+                               [*row[:4], str(row[4]).strip(), sheet_row]).rowcount
+        if not updated:
+            self._insert_attendee(conn, sheet_row, row)
+
+    def _upsert_session(self, conn, sheet_row, row):
+        values = [str(row[0]).strip(), *row[1:4], _to_number(row[4]), *row[5:10], sheet_row]
+        if conn.execute("UPDATE OR IGNORE sessions SET id = ?, ponente = ?, tipo = ?, eje = ?, cupos_totales = ?, "
+                        "dia = ?, duracion = ?, tiempo_inicio = ?, tiempo_fin = ?, horas = ? "
+                        "WHERE sheet_row = ?", values).rowcount:
+            return
+        conn.execute("INSERT INTO sessions (id, ponente, tipo, eje, cupos_totales, dia, duracion, "
+                     "tiempo_inicio, tiempo_fin, horas, sheet_row) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                     "ON CONFLICT (id) DO UPDATE SET ponente = excluded.ponente, tipo = excluded.tipo, "
+                     "eje = excluded.eje, cupos_totales = excluded.cupos_totales, dia = excluded.dia, "
+                     "duracion = excluded.duracion, tiempo_inicio = excluded.tiempo_inicio, "
+                     "tiempo_fin = excluded.tiempo_fin, horas = excluded.horas, sheet_row = excluded.sheet_row",
+                     values)
+
+    def _update_session(self, conn, sheet_row, row):
+        if self._is_blank(row):
+            conn.execute("DELETE FROM sessions WHERE sheet_row = ?", (sheet_row,))
+        else:
+            self._upsert_session(conn, sheet_row, row)
+
+    def _insert_general(self, conn, row):
+        """
+        Fila de GeneralAttendance. Si hay una fila local aún no vista en la
+        hoja para el mismo DNI y día (el mismo registro ya enviado, o un
+        duplicado hecho en otro punto), se une con la de la hoja.
+        """
+        dni, timestamp = str(row[0]).strip(), row[1]
+        if not dni:
+            return
+        day = _day_key(timestamp)
+        kit = int(str(row[2]).strip().lower() in ('true', 'verdadero', '1'))
+        merged = conn.execute("UPDATE general_attendance SET timestamp = ?, kit_entregado = ?, sync_state = 'synced' "
+                              "WHERE id = (SELECT id FROM general_attendance WHERE dni = ? AND day = ? "
+                              "AND sync_state != 'synced' ORDER BY id LIMIT 1)",
+                              (timestamp, kit, dni, day)).rowcount
+        if not merged:
+            conn.execute("INSERT INTO general_attendance (dni, timestamp, day, kit_entregado, sync_state) "
+                         "VALUES (?, ?, ?, ?, 'synced')", (dni, timestamp, day, kit))
+
+    def _upsert_session_attendance(self, conn, row):
+        dni, session_id = str(row[0]).strip(), str(row[1]).strip()
+        if not dni:
+            return
+        conn.execute("INSERT INTO session_attendance (dni, session_id, timestamp, sync_state) "
+                     "VALUES (?, ?, ?, 'synced') ON CONFLICT (dni, session_id) DO UPDATE SET "
+                     "timestamp = excluded.timestamp, sync_state = 'synced'",
+                     (dni, session_id, row[2]))
+
+    @staticmethod
+    def _compile_conflicts(conn):
+        """Recompilar la matriz de cruces tras cambiar la tabla de ponencias"""
+        sessions = conn.execute("SELECT id, dia, tiempo_inicio, tiempo_fin FROM sessions ORDER BY pos").fetchall()
+        conn.execute("DELETE FROM session_conflicts")
+        conn.executemany("INSERT INTO session_conflicts (session_id, conflict_id) VALUES (?, ?)",
+                         [(sid, other) for sid, others in _session_conflicts(sessions).items() for other in others])
+
+    @staticmethod
+    def _recount_sessions(conn):
+        conn.execute("UPDATE sessions SET registered = "
+                     "(SELECT COUNT(*) FROM session_attendance a WHERE a.session_id = sessions.id)")
+
+    @staticmethod
+    def _set_meta(conn, **values):
+        conn.executemany("INSERT OR REPLACE INTO sync_meta (name, value) VALUES (?, ?)", values.items())
+
+    # Sincronización con Google Sheets (ver SheetsSync)
+
+    def sync_watermarks(self):
+        """Offsets de fila ya leídos de cada hoja y versión de ediciones vista"""
+        stored = dict(self._query("SELECT name, value FROM sync_meta"))
+        return {key: stored.get(key, 0) for key in [*self.SYNC_PARTS, 'edits_since']}
+
+    def pending_sync(self, limit):
+        """
+        Registros locales por enviar: (generales, ponencias). Las ponencias de
+        un DNI con la asistencia general aún pendiente esperan a que esta se
+        envíe, para que Apps Script no las rechace. Cada fila recibe una
+        idempotency_key fija la primera vez que se envía.
+        """
+        with self._transaction() as conn:
+            general = conn.execute(
+                "SELECT id, dni, timestamp, push_key FROM general_attendance "
+                "WHERE sync_state = 'pending' ORDER BY id LIMIT ?", (limit,)).fetchall()
+            sessions = conn.execute(
+                "SELECT id, dni, session_id, timestamp, push_key FROM session_attendance s "
+                "WHERE sync_state = 'pending' AND NOT EXISTS (SELECT 1 FROM general_attendance g "
+                "WHERE g.dni = s.dni AND g.sync_state = 'pending') ORDER BY id LIMIT ?", (limit,)).fetchall()
+
+            items = {'general': [], 'session': []}
+            for kind, table, rows in (('general', 'general_attendance', general),
+                                      ('session', 'session_attendance', sessions)):
+                for row_id, dni, *rest, key in rows:
+                    if key is None:
+                        key = uuid.uuid4().hex
+                        conn.execute(f"UPDATE {table} SET push_key = ? WHERE id = ?", (key, row_id))
+                    item = {"id": row_id, "dni": dni, "timestamp": rest[-1], "idempotency_key": key}
+                    if kind == 'session':
+                        item['session_id'] = rest[0]
+                    items[kind].append(item)
+        return items['general'], items['session']
+
+    def resolve_push(self, kind, items, results):
+        """
+        Aplicar las respuestas de Sheets a los registros enviados. Sheets
+        gana: lo que rechaza se borra de la réplica y queda en
+        sync_conflicts. Retorna (aceptados, conflictos).
+        """
+        table = 'general_attendance' if kind == 'general' else 'session_attendance'
+        accepted = conflicts = 0
+        with self._transaction() as conn:
+            for item, result in zip(items, results):
+                # Solo si la fila sigue pendiente (un pull pudo unirla mientras tanto)
+                match = (item['id'], item['idempotency_key'])
+                if result.get('registered') or result.get('already_registered'):
+                    # Un duplicado en la hoja se une con la fila local en el próximo pull
+                    conn.execute(f"UPDATE {table} SET sync_state = 'pushed' "
+                                 f"WHERE id = ? AND push_key = ? AND sync_state = 'pending'", match)
+                    accepted += 1
+                elif conn.execute(f"DELETE FROM {table} WHERE id = ? AND push_key = ? AND sync_state = 'pending'",
+                                  match).rowcount:
+                    conn.execute("INSERT INTO sync_conflicts (kind, dni, session_id, timestamp, result, created_at) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)",
+                                 (kind, item['dni'], item.get('session_id'), item['timestamp'],
+                                  json.dumps(result, ensure_ascii=False), time.time()))
+                    conflicts += 1
+            if kind == 'session':
+                self._recount_sessions(conn)
+        return accepted, conflicts
+
+    def apply_sync_delta(self, base, delta):
+        """
+        Aplicar un getSyncDelta pedido a partir de los watermarks `base`.
+        Una parte leída desde el offset 0 reemplaza lo que había de esa hoja
+        (salvo los registros locales aún no vistos en ella). Si otro proceso
+        ya avanzó los watermarks el delta se descarta y se retorna None; si
+        no, los nuevos watermarks.
+        """
+        with self._transaction() as conn:
+            stored = dict(conn.execute("SELECT name, value FROM sync_meta").fetchall())
+            if any(stored.get(key, 0) != value for key, value in base.items()):
+                return None
+
+            attendees = delta['attendees']
+            if attendees['from'] == 0:
+                conn.execute("DELETE FROM attendees")
+            for sheet_row, row in enumerate(attendees['rows'], attendees['from'] + 2):
+                if not self._is_blank(row):
+                    self._insert_attendee(conn, sheet_row, row)
+            for sheet_row, *row in attendees['edited']:
+                self._update_attendee(conn, sheet_row, row)
+
+            sessions = delta['sessions']
+            if sessions['from'] == 0:
+                conn.execute("DELETE FROM sessions")
+            for sheet_row, row in enumerate(sessions['rows'], sessions['from'] + 2):
+                if not self._is_blank(row):
+                    self._upsert_session(conn, sheet_row, row)
+            for sheet_row, *row in sessions['edited']:
+                self._update_session(conn, sheet_row, row)
+            if sessions['from'] == 0 or sessions['rows'] or sessions['edited']:
+                self._compile_conflicts(conn)
+
+            if delta['general']['from'] == 0:
+                conn.execute("DELETE FROM general_attendance WHERE sync_state = 'synced'")
+            for row in delta['general']['rows']:
+                self._insert_general(conn, row)
+
+            if delta['session_attendance']['from'] == 0:
+                conn.execute("DELETE FROM session_attendance WHERE sync_state = 'synced'")
+            for row in delta['session_attendance']['rows']:
+                self._upsert_session_attendance(conn, row)
+
+            self._recount_sessions(conn)
+            watermarks = {key: delta[part]['from'] + len(delta[part]['rows'])
+                          for key, part in self.SYNC_PARTS.items()}
+            watermarks['edits_since'] = delta['edits_version']
+            self._set_meta(conn, **watermarks)
+        return watermarks
+
+    def sync_backlog(self):
+        """Registros locales aún no enviados / no vistos en Sheets y conflictos acumulados"""
+        with self._lock:
+            conn = self._connect()
+            counts = dict(conn.execute("""
+                SELECT sync_state, COUNT(*) FROM (
+                    SELECT sync_state FROM general_attendance WHERE sync_state != 'synced'
+                    UNION ALL
+                    SELECT sync_state FROM session_attendance WHERE sync_state != 'synced'
+                ) GROUP BY sync_state
+            """).fetchall())
+            oldest = [row[0] for row in conn.execute("""
+                SELECT * FROM (SELECT timestamp FROM general_attendance WHERE sync_state = 'pending' ORDER BY id LIMIT 1)
+                UNION ALL
+                SELECT * FROM (SELECT timestamp FROM session_attendance WHERE sync_state = 'pending' ORDER BY id LIMIT 1)
+            """)]
+            conflicts = conn.execute("SELECT COUNT(*) FROM sync_conflicts").fetchone()[0]
+        return {
+            "pending": counts.get('pending', 0),
+            "pushed": counts.get('pushed', 0),
+            "pending_lag_seconds": max((_age_seconds(ts) for ts in oldest), default=0),
+            "conflicts": conflicts
+        }
+
+class _Bitset:
+    """Un bit por asistente sobre un bytearray, con la cantidad de bits en 1 al día"""
+
+    def __init__(self):
+        self.bits = bytearray()
+        self.count = 0
+
+    def add(self, i):
+        byte, mask = i >> 3, 1 << (i & 7)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        if not self.bits[byte] & mask:
+            self.bits[byte] |= mask
+            self.count += 1
+
+    def __contains__(self, i):
+        byte = i >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (i & 7)))
+
+# Marca en AttendanceStore._dnis de un DNI que no son 8 dígitos (va en _other)
+_OTHER_DNI = 0xFFFFFFFF
+
+class AttendanceStore:
+    """
+    Estado de asistencia compacto para padrones grandes.
+
+    Cada asistente recibe un id denso, su orden de llegada (el de la hoja).
+    Los DNI de 8 dígitos se guardan como enteros de 32 bits en un índice
+    ordenado de arrays que se consulta por búsqueda binaria; los agregados
+    después del último ordenamiento esperan en un dict chico hasta que se
+    reordena todo. Los nombres van concatenados en un solo buffer UTF-8 con
+    sus offsets, y la asistencia general, el kit y cada ponencia en bitsets
+    de un bit por asistente que llevan su conteo. El día de la última
+    asistencia general va como ordinal en un array (0 = sin fecha).
+
+    No es thread-safe: AttendeeIndex lo usa bajo su lock.
+    """
+
+    def __init__(self):
+        self._dnis = array('I')
+        self._names = bytearray()
+        self._name_ends = array('I')
+        self._keys = array('I')
+        self._key_ids = array('I')
+        self._pending = {}
+        self._other = {}
+        self._other_dnis = {}
+        self._renamed = {}
+        self.general = _Bitset()
+        self.kits = _Bitset()
+        self._general_days = array('I')
+        self.sessions = {}
+
+    def __len__(self):
+        return len(self._dnis)
+
+    @staticmethod
+    def _key(dni):
+        dni = str(dni).strip()
+        return int(dni) if len(dni) == 8 and dni.isdigit() else None
+
+    def id_of(self, dni):
+        """Id denso del DNI, o None si no está en el padrón"""
+        key = self._key(dni)
+        if key is None:
+            return self._other.get(str(dni).strip())
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._key_ids[i]
+        return self._pending.get(key)
+
+    def add(self, dni, nombre):
+        """Agregar un asistente (o renombrarlo si ya estaba). Retorna su id"""
+        ident = self.id_of(dni)
+        if ident is not None:
+            self._rename(ident, nombre)
+            return ident
+        ident = self._append(dni, nombre)
+        if self._dnis[ident] != _OTHER_DNI:
+            self._pending[self._dnis[ident]] = ident
+        # Reordenar cuando los pendientes pesan; el costo se reparte entre los agregados
+        if len(self._pending) > max(4096, len(self._keys) // 4):
+            self.reindex()
+        return ident
+
+    def load(self, attendees, general, session_attendance, general_timestamps=(), general_kits=()):
+        """
+        Carga completa de un volcado sobre un store vacío. Resuelve los DNI
+        con un dict temporal, bastante más rápido que id_of fila por fila,
+        que se descarta al terminar. `general_timestamps` y `general_kits`
+        van en paralelo a `general` (vacíos si el backend no los envía).
+        """
+        ids = {}
+        for dni, nombre in attendees:
+            if dni in ids:
+                self._rename(ids[dni], nombre)
+            else:
+                ids[dni] = self._append(dni, nombre)
+        self.reindex(force=True)
+        for i, dni in enumerate(general):
+            ident = ids.get(dni)
+            if ident is not None:
+                self._mark_general(ident, general_timestamps[i] if i < len(general_timestamps) else None,
+                                   i < len(general_kits) and general_kits[i])
+        for dni, session_id in session_attendance:
+            ident = ids.get(dni)
+            if ident is not None:
+                self.sessions.setdefault(session_id, _Bitset()).add(ident)
+
+    def _append(self, dni, nombre):
+        ident = len(self._dnis)
+        key = self._key(dni)
+        if key is None:
+            self._dnis.append(_OTHER_DNI)
+            self._other[str(dni).strip()] = ident
+            self._other_dnis[ident] = str(dni).strip()
+        else:
+            self._dnis.append(key)
+        self._names.extend((nombre or '').encode('utf-8'))
+        self._name_ends.append(len(self._names))
+        return ident
+
+    def _rename(self, ident, nombre):
+        if self.name(ident) != (nombre or ''):
+            self._renamed[ident] = nombre or ''
+
+    def reindex(self, force=False):
+        """Pasar los DNI pendientes al índice ordenado"""
+        if not self._pending and not force:
+            return
+        # DNI e id empaquetados en un solo entero: se ordena sin función clave
+        packed = sorted((key << 32) | i for i, key in enumerate(self._dnis) if key != _OTHER_DNI)
+        self._keys = array('I', (p >> 32 for p in packed))
+        self._key_ids = array('I', (p & 0xFFFFFFFF for p in packed))
+        self._pending = {}
+
+    def dni(self, ident):
+        key = self._dnis[ident]
+        return self._other_dnis[ident] if key == _OTHER_DNI else f"{key:08d}"
+
+    def name(self, ident):
+        if ident in self._renamed:
+            return self._renamed[ident]
+        start = self._name_ends[ident - 1] if ident else 0
+        return self._names[start:self._name_ends[ident]].decode('utf-8')
+
+    def mark_general(self, dni, timestamp=None, kit=False):
+        ident = self.id_of(dni)
+        if ident is not None:
+            self._mark_general(ident, timestamp, kit)
+
+    def _mark_general(self, ident, timestamp, kit):
+        self.general.add(ident)
+        if kit:
+            self.kits.add(ident)
+        day = _day_ordinal(timestamp) if timestamp else 0
+        if day:
+            days = self._general_days
+            if ident >= len(days):
+                days.extend(bytes(4 * (ident + 1 - len(days))))
+            days[ident] = max(days[ident], day)
+
+    def general_day(self, ident):
+        """Fecha (ISO) de la última asistencia general conocida, o None"""
+        day = self._general_days[ident] if ident < len(self._general_days) else 0
+        return datetime.fromordinal(day).date().isoformat() if day else None
+
+    def mark_session(self, dni, session_id):
+        ident = self.id_of(dni)
+        if ident is not None:
+            self.sessions.setdefault(session_id, _Bitset()).add(ident)
+
+    def has_session(self, ident, session_id):
+        bits = self.sessions.get(session_id)
+        return bits is not None and ident in bits
+
+    def session_flags(self, ident, session_ids):
+        """[registrado en cada ponencia de `session_ids`] para un asistente"""
+        byte, mask = ident >> 3, 1 << (ident & 7)
+        flags = []
+        for session_id in session_ids:
+            bits = self.sessions.get(session_id)
+            flags.append(bits is not None and byte < len(bits.bits) and bool(bits.bits[byte] & mask))
+        return flags
+
+    def session_counts(self):
+        """Registrados por ponencia según el padrón local"""
+        return {session_id: bits.count for session_id, bits in self.sessions.items()}
+
+    def nbytes(self):
+        """Bytes de los arrays, el buffer de nombres y los bitsets (sin los dicts auxiliares)"""
+        arrays = (self._dnis, self._name_ends, self._keys, self._key_ids, self._general_days)
+        return (sum(len(a) * a.itemsize for a in arrays) + len(self._names) + len(self.general.bits)
+                + len(self.kits.bits) + sum(len(bits.bits) for bits in self.sessions.values()))
+
+class AttendeeIndex:
+    """
+    Índice en memoria de asistentes indexado por DNI.
+
+    Se carga con getAttendeesSnapshot en un hilo de fondo y se refresca
+    incrementalmente pidiendo solo las filas nuevas de cada hoja. Cada
+    `full_reload_every` refrescos se hace una recarga completa para recoger
+    ediciones o borrados en filas ya leídas. Mientras no esté listo,
+    `lookup` retorna None y la búsqueda cae a Apps Script. Los datos viven
+    en un AttendanceStore, así que un padrón de un millón de asistentes
+    ocupa decenas de MB por worker y no cientos.
+    """
+
+    def __init__(self, api, refresh_interval=ATTENDEE_INDEX_REFRESH_SECONDS,
+                 full_reload_every=ATTENDEE_INDEX_FULL_RELOAD_EVERY):
+        self.api = api
+        self.refresh_interval = refresh_interval
+        self.full_reload_every = max(1, full_reload_every)
+        self.ready = False
+        self.last_refresh = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._refreshes = 0
+        self._store = AttendanceStore()
+        self._session_ids = []
+        self._offsets = {"attendees_from": 0, "general_from": 0, "session_from": 0}
+
+    def ensure_started(self):
+        """Arrancar el hilo de refresco (una sola vez por proceso)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='attendee-index', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            full = not self.ready or self._refreshes % self.full_reload_every == 0
+            try:
+                self.refresh(full=full)
+            except Exception:
+                log.exception("Exception refrescando índice de asistentes")
+            time.sleep(self.refresh_interval)
+
+    def refresh(self, full=False):
+        """Traer filas nuevas de Apps Script y aplicarlas al índice"""
+        offsets = {key: 0 for key in self._offsets} if full else dict(self._offsets)
+        snapshot = self.api.get_attendees_snapshot(**offsets)
+        if 'error' in snapshot:
+            log.error("No se pudo refrescar el índice de asistentes", extra={"error": snapshot['error']})
+            return False
+
+        parts = {
+            "attendees_from": snapshot['attendees'],
+            "general_from": snapshot['general'],
+            "session_from": snapshot['session_attendance']
+        }
+        # Si alguna hoja tiene menos filas que antes, hubo borrados: recargar todo
+        if not full and any(part['total'] < offsets[key] for key, part in parts.items()):
+            return self.refresh(full=True)
+
+        # La recarga completa se arma fuera del lock; las incrementales son pocas filas
+        if full:
+            store = AttendanceStore()
+            general = snapshot['general']
+            store.load(snapshot['attendees']['rows'], general['rows'], snapshot['session_attendance']['rows'],
+                       general.get('timestamps', ()), general.get('kits', ()))
+
+        with self._lock:
+            if full:
+                self._store = store
+            else:
+                self._apply(self._store, snapshot)
+            self._session_ids = list(snapshot['sessions'])
+            self._offsets = {key: part['total'] for key, part in parts.items()}
+            self._refreshes += 1
+            self.last_refresh = datetime.now()
+            self.ready = True
+        return True
+
+    @staticmethod
+    def _apply(store, snapshot):
+        for dni, nombre in snapshot['attendees']['rows']:
+            store.add(dni, nombre)
+        general = snapshot['general']
+        timestamps, kits = general.get('timestamps', ()), general.get('kits', ())
+        for i, dni in enumerate(general['rows']):
+            store.mark_general(dni, timestamps[i] if i < len(timestamps) else None, i < len(kits) and kits[i])
+        for dni, session_id in snapshot['session_attendance']['rows']:
+            store.mark_session(dni, session_id)
+
+    def lookup(self, dni):
+        """Buscar un DNI en memoria con la misma forma que getAttendeeByDNI"""
+        if not self.ready:
+            return None
+        if not dni or len(dni) != 8:
+            return {"error": "dni inválido (8 dígitos)"}
+        with self._lock:
+            ident = self._store.id_of(dni)
+            if ident is None:
+                return {"error": "DNI no encontrado."}
+            result = {
+                "dni": dni,
+                "nombre": self._store.name(ident),
+                "asistencia_general": ident in self._store.general
+            }
+            result.update(zip(self._session_ids, self._store.session_flags(ident, self._session_ids)))
+        return result
+
+    def exists(self, dni):
+        with self._lock:
+            return self._store.id_of(dni) is not None
+
+    def has_general(self, dni):
+        with self._lock:
+            ident = self._store.id_of(dni)
+            return ident is not None and ident in self._store.general
+
+    def general_state(self, dni):
+        """(fecha ISO de la última asistencia general o None, ¿recibió kit?)"""
+        with self._lock:
+            ident = self._store.id_of(dni)
+            if ident is None:
+                return None, False
+            return self._store.general_day(ident), ident in self._store.kits
+
+    def has_session(self, dni, session_id):
+        with self._lock:
+            ident = self._store.id_of(dni)
+            return ident is not None and self._store.has_session(ident, session_id)
+
+    def has_session_id(self, session_id):
+        with self._lock:
+            return session_id in self._session_ids
+
+    def mark_general(self, dni, timestamp=None, kit=False):
+        """Reflejar al instante una asistencia general confirmada por Apps Script"""
+        with self._lock:
+            self._store.mark_general(dni, timestamp, kit)
+
+    def mark_session(self, dni, session_id):
+        """Reflejar al instante un registro en ponencia confirmado por Apps Script"""
+        with self._lock:
+            self._store.mark_session(dni, session_id)
+
+    def stats(self):
+        """Asistentes, asistencia general, registrados por ponencia y bytes del padrón local"""
+        with self._lock:
+            counts = self._store.session_counts()
+            return {
+                "attendees": len(self._store),
+                "general": self._store.general.count,
+                "sessions": {session_id: counts.get(session_id, 0) for session_id in self._session_ids},
+                "bytes": self._store.nbytes()
+            }
+
+    def export_chunks(self, session_names, page_size=EXPORT_PAGE_SIZE):
+        """
+        CSV del export (mismas columnas que exportAttendeesData) armado desde
+        el padrón local, de a `page_size` filas. `session_names` es {id: nombre}.
+        """
+        # Columnas y filas de la misma foto del padrón, tomada bajo el lock
+        with self._lock:
+            session_ids = sorted(self._session_ids)
+            store = self._store
+            total = len(store)
+        yield ','.join(_csv_cell(v) for v in ['DNI', 'Nombre', 'Asistencia General']
+                       + [session_names.get(sid, sid) for sid in session_ids])
+        for start in range(0, total, page_size):
+            lines = []
+            with self._lock:
+                for ident in range(start, min(start + page_size, total)):
+                    lines.append(','.join(
+                        [_csv_cell(store.dni(ident)), _csv_cell(store.name(ident)),
+                         'Sí' if ident in store.general else 'No']
+                        + ['Sí' if flag else 'No' for flag in store.session_flags(ident, session_ids)]))
+            yield '\n' + '\n'.join(lines)
+
+def _wake_future(future):
+    """Despertar a un waiter async (se llama en su event loop)"""
+    if not future.done():
+        future.set_result(None)
+
+def _wake_waiters(waiters):
+    """Despertar desde cualquier hilo a los waiters async (loop, future)"""
+    for loop, future in waiters:
+        try:
+            loop.call_soon_threadsafe(_wake_future, future)
+        except RuntimeError:
+            # El loop ya se cerró: nadie queda esperando
+            pass
+
+class _Flight:
+    """
+    Llamada upstream en curso compartida por todos los que la esperan.
+
+    Los hilos esperan `event`; las corrutinas, un asyncio.Future que el
+    líder resuelve al terminar, así no ocupan un hilo del executor.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self._lock = threading.Lock()
+        self._waiters = []
+
+    def set(self, result):
+        """Publicar el resultado y despertar a hilos y corrutinas"""
+        with self._lock:
+            self.result = result
+            self.event.set()
+            waiters, self._waiters = self._waiters, []
+        _wake_waiters(waiters)
+
+    async def wait(self):
+        """Esperar el resultado sin bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.event.is_set():
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        await future
+
+class ResponseCache:
+    """
+    Caché en memoria con TTL, stale-while-revalidate y coalescencia.
+
+    - Dentro del TTL se sirve la entrada sin llamar a Apps Script.
+    - Vencido el TTL pero dentro de `max_stale`, se sirve la entrada vieja
+      y se revalida en un hilo de fondo.
+    - Sin entrada utilizable, los pedidos concurrentes de la misma clave
+      comparten una única llamada upstream (single-flight).
+    Las respuestas con 'error' nunca se guardan: si la carga falla y hay
+    una entrada anterior, de cualquier antigüedad, se sirve esa.
+    """
+
+    def __init__(self, max_stale=CACHE_MAX_STALE_SECONDS):
+        self.max_stale = max_stale
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._flights = {}
+        self._listeners = {}
+        self._load_listeners = {}
+
+    def get(self, key, loader, ttl):
+        """Obtener `key` de la caché o cargarlo con `loader()`"""
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.monotonic() - entry[1] if entry else None
+            if entry and age < ttl:
+                self.hits += 1
+                return entry[0]
+            if entry and age < ttl + self.max_stale:
+                self.stale_hits += 1
+                if key not in self._flights:
+                    flight = self._flights[key] = _Flight()
+                    threading.Thread(target=self._load, args=(key, loader, flight), daemon=True).start()
+                return entry[0]
+            self.misses += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if leader:
+            self._load(key, loader, flight)
+        else:
+            flight.event.wait()
+        return flight.result
+
+    async def aget(self, key, loader, ttl):
+        """Igual que get(), pero `loader` es una corrutina (modo ASGI, ver asgi.py)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.monotonic() - entry[1] if entry else None
+            if entry and age < ttl:
+                self.hits += 1
+                return entry[0]
+            if entry and age < ttl + self.max_stale:
+                self.stale_hits += 1
+                if key not in self._flights:
+                    flight = self._flights[key] = _Flight()
+                    # La referencia en el vuelo evita que el GC recolecte la tarea
+                    flight.task = asyncio.ensure_future(self._aload(key, loader, flight))
+                return entry[0]
+            self.misses += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if leader:
+            await self._aload(key, loader, flight)
+        else:
+            # La carga en curso puede venir de un hilo WSGI: el líder resuelve el future
+            await flight.wait()
+        return flight.result
+
+    def _load(self, key, loader, flight):
+        try:
+            result = loader()
+        except Exception as e:
+            result = {"error": str(e)}
+        self._finish(key, flight, result)
+
+    async def _aload(self, key, loader, flight):
+        try:
+            result = await loader()
+        except Exception as e:
+            result = {"error": str(e)}
+        self._finish(key, flight, result)
+
+    def _finish(self, key, flight, result):
+        loaded = 'error' not in result
+        with self._lock:
+            entry = self._entries.get(key)
+            if loaded:
+                self._entries[key] = (result, time.monotonic())
+            elif entry:
+                self.fallbacks += 1
+                log.warning("Apps Script falló, se sirve la caché anterior",
+                            extra={"key": key, "age_seconds": round(time.monotonic() - entry[1]),
+                                   "error": result['error']})
+                result = entry[0]
+            self._flights.pop(key, None)
+        flight.set(result)
+        if loaded:
+            self._notify(self._load_listeners, key, result)
+            self._notify(self._listeners, key, result)
+
+    def on_change(self, key, callback):
+        """Registrar `callback(valor)` para cada carga o ajuste de `key`"""
+        self._listeners.setdefault(key, []).append(callback)
+
+    def on_load(self, key, callback):
+        """Registrar `callback(valor)` solo para las cargas desde el backend (no los ajustes locales)"""
+        self._load_listeners.setdefault(key, []).append(callback)
+
+    def _notify(self, listeners, key, value):
+        for callback in listeners.get(key, ()):
+            try:
+                callback(value)
+            except Exception:
+                log.exception("Exception notificando cambio de caché", extra={"key": key})
+
+    def update(self, key, fn):
+        """Ajustar una entrada existente sin renovar su antigüedad"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return
+            value = fn(entry[0])
+            self._entries[key] = (value, entry[1])
+        self._notify(self._listeners, key, value)
+
+    def refresh(self, key, loader):
+        """Recargar `key` ya, compartiendo la carga en curso si la hay"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if leader:
+            self._load(key, loader, flight)
+        else:
+            flight.event.wait()
+        return flight.result
+
+    def put(self, key, value, age=0):
+        """Guardar un valor traído de otra fuente (la caché compartida) como si fuera una carga del backend"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() - age)
+        self._notify(self._load_listeners, key, value)
+        self._notify(self._listeners, key, value)
+
+    def age(self, key):
+        """Segundos desde que se cargó `key` (None si no está en la caché)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return time.monotonic() - entry[1] if entry else None
+
+    def peek(self, key):
+        """Valor cacheado (aunque esté vencido) sin disparar cargas"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+# Partes de getAttendeesSnapshot y el parámetro con el que se piden desde un offset
+_SNAPSHOT_PARTS = (('attendees', 'attendees_from'), ('general', 'general_from'),
+                   ('session_attendance', 'session_from'))
+
+def _roster_data(snapshot):
+    """
+    Padrón del modo kiosko (filas de cada hoja) a partir de un
+    getAttendeesSnapshot completo, con la fecha y el kit de cada asistencia
+    general en paralelo a `general`
+    """
+    general = snapshot['general']
+    return {"sessions": snapshot['sessions'], **{part: snapshot[part]['rows'] for part, _ in _SNAPSHOT_PARTS},
+            "general_timestamps": general.get('timestamps', []), "general_kits": general.get('kits', [])}
+
+def _json_envelope(raw_data, message):
+    """Mismo cuerpo que jsonify({"success": True, "data": ..., "message": ...}) con `data` ya serializado"""
+    rest = json.dumps({"message": message, "success": True}, separators=(',', ':'))
+    return b'{"data":' + raw_data + b',' + rest[1:].encode('utf-8')
+
+# Cabecera de las instantáneas: marca, versión, escrita en (epoch) y bytes del JSON
+_SNAPSHOT_MAGIC = b'ASISNAP1'
+_SNAPSHOT_HEADER = struct.Struct('<8sQdQ')
+
+class SharedSnapshots:
+    """
+    Caché compartida entre los workers de gunicorn sobre archivos de instantánea.
+
+    El worker que toma el flock de refresher.lock es el único que llama a
+    Apps Script: recarga la lista de ponencias, la capacidad, los cruces y
+    el padrón, y cada carga se escribe en <dir>/<clave>.snap, un archivo
+    inmutable con versión que se arma aparte y se publica con os.replace.
+    Los demás lo mapean en memoria de solo lectura y, cuando cambia, lo pasan
+    a su response_cache (así disparan los mismos listeners que una carga).
+    El padrón no se copia a cada worker: la ruta del kiosko sirve los bytes
+    del archivo y AttendeeIndex se arma leyéndolo. Si una instantánea pasa
+    de TTL + CACHE_MAX_STALE_SECONDS, el worker vuelve a ir al backend; si
+    el refrescador muere, el lock queda libre y otro worker lo toma.
+    """
+
+    def __init__(self, directory, api, cache, poll_interval=SHARED_CACHE_POLL_SECONDS):
+        self.directory = directory
+        self.api = api
+        self.cache = cache
+        self.poll_interval = poll_interval
+        # Claves de response_cache compartidas: (loader, TTL)
+        self.sources = {
+            'sessions': (api.get_sessions_list, SESSIONS_CACHE_TTL),
+            'capacity': (api.get_sessions_capacity, CAPACITY_CACHE_TTL),
+            'conflicts': (api.get_session_conflicts, SESSIONS_CACHE_TTL),
+        }
+        self.roster_interval = (min(ROSTER_CACHE_TTL, ATTENDEE_INDEX_REFRESH_SECONDS) if ATTENDEE_INDEX_ENABLED
+                                else ROSTER_CACHE_TTL)
+        self.is_refresher = False
+        self.writes = 0
+        self.installs = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._lock_file = None
+        self._maps = {}
+        self._versions = {}
+        self._installed = {}
+        self._checked = {}
+        self._retry_at = {}
+        self._roster_loads = 0
+        self._roster_seen = (None, [])
+        for key in self.sources:
+            cache.on_load(key, lambda value, key=key: self._publish(key, value))
+        cache.on_load('roster', lambda value: self._publish('roster', _roster_data(value)))
+
+    def ensure_started(self):
+        """Arrancar el hilo de elección y refresco (una sola vez por proceso)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name='shared-cache', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if not self.is_refresher:
+                    self._elect()
+                if self.is_refresher:
+                    self._refresh_due()
+            except Exception:
+                log.exception("Exception refrescando la caché compartida")
+            time.sleep(self.poll_interval)
+
+    def _elect(self):
+        # flock es de Unix, igual que gunicorn; el lock se suelta solo si el proceso muere
+        import fcntl
+        if self._lock_file is None:
+            self._lock_file = open(os.path.join(self.directory, 'refresher.lock'), 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        self.is_refresher = True
+        log.info("Este worker refresca la caché compartida", extra={"pid": os.getpid()})
+
+    def _refresh_due(self):
+        """Recargar del backend las claves cuya instantánea ya cumplió su TTL"""
+        now = time.monotonic()
+        sources = [*((key, loader, ttl) for key, (loader, ttl) in self.sources.items()),
+                   ('roster', self._load_roster, self.roster_interval)]
+        for key, loader, ttl in sources:
+            if self._age(key) < ttl or now < self._retry_at.get(key, 0):
+                continue
+            result = self.cache.refresh(key, loader)
+            if 'error' in result:
+                # Sin escritura nueva la instantánea envejece; no reintentar en cada vuelta
+                self._retry_at[key] = now + ttl
+                log.warning("No se pudo refrescar la caché compartida", extra={"key": key, "error": result['error']})
+
+    def _age(self, key):
+        """Segundos desde que se escribió la instantánea de `key` (infinito si no hay)"""
+        with self._lock:
+            current = self._map(key)
+            return math.inf if current is None else max(0.0, time.time() - current[1])
+
+    def _load_roster(self):
+        """
+        getAttendeesSnapshot pidiendo solo las filas nuevas sobre el último
+        volcado; completo cada ATTENDEE_INDEX_FULL_RELOAD_EVERY recargas o si
+        alguna hoja perdió filas
+        """
+        previous = self.cache.peek('roster')
+        self._roster_loads += 1
+        if previous is None or self._roster_loads % max(1, ATTENDEE_INDEX_FULL_RELOAD_EVERY) == 0:
+            return self.api.get_attendees_snapshot()
+        delta = self.api.get_attendees_snapshot(**{arg: previous[part]['total'] for part, arg in _SNAPSHOT_PARTS})
+        if 'error' in delta:
+            return delta
+        if any(delta[part]['total'] < previous[part]['total'] for part, _ in _SNAPSHOT_PARTS):
+            return self.api.get_attendees_snapshot()
+        merged = {"sessions": delta['sessions'],
+                  **{part: {"from": 0, "total": delta[part]['total'],
+                            "rows": previous[part]['rows'] + delta[part]['rows']} for part, _ in _SNAPSHOT_PARTS}}
+        for column, blank in (('timestamps', None), ('kits', False)):
+            # Alineadas con las filas aunque una de las lecturas no traiga la columna
+            before = previous['general'].get(column, [])
+            before = before + [blank] * (len(previous['general']['rows']) - len(before))
+            merged['general'][column] = before + delta['general'].get(column, [blank] * len(delta['general']['rows']))
+        return merged
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.snap")
+
+    def _publish(self, key, value):
+        # Solo el refrescador escribe; en los demás la carga vino de la instantánea
+        if self.is_refresher:
+            self.write(key, value)
+
+    def write(self, key, value):
+        """Publicar una nueva versión de `key`: se escribe en un temporal y se reemplaza de una vez"""
+        payload = json.dumps(value, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        with self._lock:
+            current = self._map(key)
+            version = max(self._versions.get(key, 0), current[0] if current else 0) + 1
+            self._versions[key] = version
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, version, time.time(), len(payload)))
+            f.write(payload)
+        os.replace(tmp, path)
+        self.writes += 1
+
+    def _map(self, key):
+        """(versión, escrita en, mmap) de la instantánea vigente de `key`; se llama con el lock tomado"""
+        path = self._path(key)
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            return None
+        current = self._maps.get(key)
+        if current and current[0] == inode:
+            return current[1:]
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            log.warning("No se pudo mapear la instantánea compartida", extra={"key": key, "error": str(e)})
+            return current[1:] if current else None
+        magic, version, written_at, length = (_SNAPSHOT_HEADER.unpack_from(mapped)
+                                              if len(mapped) >= _SNAPSHOT_HEADER.size else (None, 0, 0, 0))
+        if magic != _SNAPSHOT_MAGIC or _SNAPSHOT_HEADER.size + length != len(mapped):
+            mapped.close()
+            log.warning("Instantánea compartida inválida", extra={"key": key})
+            return current[1:] if current else None
+        # Nadie guarda referencias al mapa anterior: las lecturas copian con el lock tomado
+        if current:
+            current[3].close()
+        self._maps[key] = (inode, version, written_at, mapped)
+        return version, written_at, mapped
+
+    def _read(self, key, max_age, known=None):
+        """
+        (versión, antigüedad, JSON) de `key` si la instantánea no pasa de
+        `max_age` segundos; el JSON es None si la versión es `known`
+        """
+        with self._lock:
+            current = self._map(key)
+            if current is None:
+                return None
+            version, written_at, mapped = current
+            age = max(0.0, time.time() - written_at)
+            if age >= max_age:
+                return None
+            return version, age, None if version == known else mapped[_SNAPSHOT_HEADER.size:]
+
+    def read(self, key, ttl):
+        """Valor de `key` desde la instantánea, o None si no hay una utilizable"""
+        snapshot = self._read(key, ttl + self.cache.max_stale)
+        return json.loads(snapshot[2]) if snapshot else None
+
+    def install(self, key):
+        """Pasar a response_cache la instantánea de `key` si hay una versión nueva (a lo sumo un stat por intervalo)"""
+        if self.is_refresher or key not in self.sources:
+            return
+        now = time.monotonic()
+        if now - self._checked.get(key, 0) < self.poll_interval:
+            return
+        self._checked[key] = now
+        snapshot = self._read(key, self.sources[key][1] + self.cache.max_stale, known=self._installed.get(key))
+        if snapshot is None or snapshot[2] is None:
+            return
+        version, age, payload = snapshot
+        self._installed[key] = version
+        self.installs += 1
+        self.cache.put(key, json.loads(payload), age)
+
+    def loader(self, key, loader, ttl):
+        """Loader para response_cache: la instantánea mientras sirva, el backend si no"""
+        if self.is_refresher or key not in self.sources:
+            return loader
+
+        def load():
+            value = self.read(key, ttl)
+            return value if value is not None else loader()
+        return load
+
+    def aloader(self, key, loader, ttl):
+        """Igual que loader(), con `loader` corrutina (modo ASGI)"""
+        if self.is_refresher or key not in self.sources:
+            return loader
+
+        async def load():
+            value = self.read(key, ttl)
+            return value if value is not None else await loader()
+        return load
+
+    def roster_json(self):
+        """JSON del padrón del kiosko tal como está en el archivo, o None si no hay uno vigente"""
+        snapshot = self._read('roster', self.roster_interval + self.cache.max_stale)
+        return snapshot[2] if snapshot else None
+
+    def get_attendees_snapshot(self, attendees_from=0, general_from=0, session_from=0):
+        """
+        getAttendeesSnapshot para AttendeeIndex leído de la instantánea del
+        padrón. Si la versión no cambió desde la última lectura no se vuelve
+        a parsear: se responden las mismas filas sin novedades.
+        """
+        offsets = {"attendees": attendees_from, "general": general_from, "session_attendance": session_from}
+        seen_version, seen_sessions = self._roster_seen
+        snapshot = self._read('roster', self.roster_interval + self.cache.max_stale,
+                              known=seen_version if any(offsets.values()) else None)
+        if snapshot is None:
+            return self.api.get_attendees_snapshot(attendees_from, general_from, session_from)
+        version, age, payload = snapshot
+        if payload is None:
+            return {"sessions": seen_sessions,
+                    **{part: {"from": start, "total": start, "rows": []} for part, start in offsets.items()}}
+        roster = json.loads(payload)
+        self._roster_seen = (version, roster['sessions'])
+        snapshot = {"sessions": roster['sessions'],
+                    **{part: {"from": start, "total": len(roster[part]), "rows": roster[part][start:]}
+                       for part, start in offsets.items()}}
+        snapshot['general']['timestamps'] = roster.get('general_timestamps', [])[general_from:]
+        snapshot['general']['kits'] = roster.get('general_kits', [])[general_from:]
+        return snapshot
+
+    def ages(self):
+        """Antigüedad en segundos de cada instantánea presente"""
+        ages = {key: self._age(key) for key in [*self.sources, 'roster']}
+        return {key: round(age, 3) for key, age in ages.items() if age != math.inf}
+
+class VersionedFeed:
+    """
+    Versión de datos de una colección por ID (capacidad o lista de ponencias).
+
+    Cada publicación que cambia algo sube la versión y anota en qué versión
+    cambió o desapareció cada ID, así que read(since) arma el delta sin
+    guardar historial. Los clientes ven la versión como "<época>.<n>": la
+    época es aleatoria por proceso, y un token de otro worker o de antes de
+    un reinicio recibe el estado completo en lugar de un delta equivocado.
+
+    `key` es el campo con el ID de cada elemento cuando la colección es una
+    lista; sin él, la colección es un dict {id: elemento}.
+    """
+
+    def __init__(self, key=None):
+        self.key = key
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._lock = threading.Lock()
+        self._value = None
+        self._items = {}
+        self._changed_at = {}
+        self._removed_at = {}
+
+    def publish(self, value):
+        """Registrar un nuevo estado; retorna {"version", "changes", "removed"} o None si nada cambió"""
+        if self.key:
+            items = {item.get(self.key): item for item in value}
+        else:
+            items = dict(value)
+        with self._lock:
+            changes = {item_id: item for item_id, item in items.items() if self._items.get(item_id) != item}
+            removed = [item_id for item_id in self._items if item_id not in items]
+            if not changes and not removed:
+                return None
+            self.version += 1
+            for item_id in changes:
+                self._changed_at[item_id] = self.version
+                self._removed_at.pop(item_id, None)
+            for item_id in removed:
+                self._removed_at[item_id] = self.version
+                self._changed_at.pop(item_id, None)
+            self._value = value
+            self._items = items
+            return {"version": self.version, "changes": changes, "removed": removed}
+
+    def token(self):
+        return f"{self.epoch}.{self.version}"
+
+    def read(self, since=None):
+        """
+        (token, datos, removidos). Con un `since` de este proceso, `datos`
+        trae solo lo cambiado desde esa versión y `removidos` la lista de IDs
+        que ya no están; si no, `datos` es el estado completo y `removidos` None.
+        """
+        with self._lock:
+            token = self.token()
+            epoch, _, version = (since or '').partition('.')
+            if epoch != self.epoch or not version.isdigit() or int(version) > self.version:
+                return token, self._value, None
+            base = int(version)
+            changed = [item_id for item_id, at in self._changed_at.items() if at > base]
+            removed = [item_id for item_id, at in self._removed_at.items() if at > base]
+            if self.key:
+                data = [item for item_id, item in self._items.items() if item_id in changed]
+            else:
+                data = {item_id: self._items[item_id] for item_id in changed}
+            return token, data, removed
+
+class CapacityBroadcaster(VersionedFeed):
+    """
+    Difunde cambios de capacidad a los clientes SSE conectados.
+
+    Cada vez que la caché de capacidad cambia (refresco upstream o ajuste
+    por un registro) se calcula el delta por sesión contra el último estado
+    publicado y se encola en la cola de cada suscriptor. Un suscriptor lento
+    cuya cola se llena no bloquea a los demás: se le vacía la cola y recibe
+    un aviso de 'resync' para que pida el estado completo. La misma versión
+    sirve de ETag y de `since` para GET /api/v1/sessions/capacity.
+    """
+
+    def __init__(self, queue_size=CAPACITY_STREAM_QUEUE_SIZE):
+        super().__init__()
+        self.queue_size = queue_size
+        self._subscribers = set()
+
+    def subscribe(self, q=None):
+        """
+        Registrar un suscriptor. `q` puede ser cualquier objeto con
+        put_nowait() (el modo ASGI pasa un adaptador sobre asyncio.Queue).
+        """
+        if q is None:
+            q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def snapshot(self):
+        """(versión, capacidad completa) del último estado publicado"""
+        with self._lock:
+            return self.version, dict(self._items)
+
+    def publish(self, capacity):
+        """Publicar un nuevo estado de capacidad; solo se envían las sesiones que cambiaron"""
+        if not isinstance(capacity, dict) or 'error' in capacity:
+            return None
+        event = super().publish(capacity)
+        if event is None:
+            return None
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                self._resync(q)
+        return event
+
+    @staticmethod
+    def _resync(q):
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put_nowait({"resync": True})
+
+def _take_seat(session_id):
+    """Restar un cupo a la capacidad cacheada tras un registro exitoso"""
+    def adjust(capacity):
+        info = capacity.get(session_id)
+        if not info:
+            return capacity
+        adjusted = dict(capacity)
+        adjusted[session_id] = {**info, "available": max(0, info.get('available', 0) - 1)}
+        return adjusted
+    return adjust
+
+def _mark_full(session_id):
+    """Dejar en 0 la capacidad cacheada cuando Apps Script reporta sin cupos"""
+    def adjust(capacity):
+        info = capacity.get(session_id)
+        if not info:
+            return capacity
+        adjusted = dict(capacity)
+        adjusted[session_id] = {**info, "available": 0}
+        return adjusted
+    return adjust
+
+class ScanDeduplicator:
+    """
+    Ventana de deduplicación para escaneos repetidos.
+
+    El lector de la cámara entrega el mismo DNI varias veces por segundo.
+    Las peticiones con la misma clave (acción, dni, session_id,
+    idempotency_key) que llegan mientras otra está en curso esperan su
+    resultado, y las que llegan hasta `window` segundos después lo reciben
+    sin volver a llamar al backend. Una idempotency_key nueva es un
+    registro deliberado y no comparte resultado con los anteriores. Solo
+    se recuerdan los resultados que ya no pueden cambiar (registrado o ya
+    registrado); un rechazo (sin asistencia general, sin cupo, cruce) o un
+    error se comparte con los que esperaban, pero el próximo escaneo
+    vuelve a consultar. Pasado `max_entries` se descartan los menos
+    usados. Los duplicados reciben una copia marcada con 'duplicate_scan'
+    para que la respuesta diga que ya estaba registrado en lugar de
+    repetir el "registrado exitosamente".
+    """
+
+    def __init__(self, window=SCAN_DEDUP_WINDOW, max_entries=SCAN_DEDUP_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max_entries
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self._recent = collections.OrderedDict()
+        self._flights = {}
+
+    def _join(self, key):
+        """(resultado reciente o None, vuelo, ¿es el líder?)"""
+        with self._lock:
+            entry = self._recent.get(key)
+            if entry and time.monotonic() - entry[1] < self.window:
+                self._recent.move_to_end(key)
+                self.duplicates += 1
+                return self._replay(entry[0]), None, False
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.duplicates += 1
+                return None, flight, False
+            flight = self._flights[key] = _Flight()
+            return None, flight, True
+
+    def run(self, key, fn):
+        """Resultado de `fn()` para `key`, compartido con los escaneos duplicados"""
+        if self.window <= 0:
+            return fn()
+        recent, flight, leader = self._join(key)
+        if flight is None:
+            return recent
+        if leader:
+            try:
+                result = fn()
+            except Exception as e:
+                result = {"error": str(e)}
+            self._finish(key, flight, result)
+            return result
+        flight.event.wait()
+        return self._replay(flight.result)
+
+    async def arun(self, key, fn):
+        """Igual que run(), pero `fn` es una corrutina (modo ASGI, ver asgi.py)"""
+        if self.window <= 0:
+            return await fn()
+        recent, flight, leader = self._join(key)
+        if flight is None:
+            return recent
+        if leader:
+            try:
+                result = await fn()
+            except Exception as e:
+                result = {"error": str(e)}
+            self._finish(key, flight, result)
+            return result
+        await flight.wait()
+        return self._replay(flight.result)
+
+    @staticmethod
+    def _replay(result):
+        """Copia del resultado compartido para un escaneo duplicado"""
+        if 'error' in result:
+            return result
+        return {**result, "duplicate_scan": True}
+
+    @classmethod
+    def _final(cls, result):
+        """¿Resultado definitivo? Un check-in lo es si lo son todos sus pasos"""
+        if 'general' in result:
+            return all(cls._final(step) for step in (result['general'], result.get('session')) if step)
+        return any(result.get(flag) for flag in ('registered', 'already_registered', 'already_registered_today'))
+
+    def _finish(self, key, flight, result):
+        with self._lock:
+            self._flights.pop(key, None)
+            if self._final(result):
+                self._recent[key] = (result, time.monotonic())
+                self._recent.move_to_end(key)
+                while len(self._recent) > self.max_entries:
+                    self._recent.popitem(last=False)
+        flight.set(result)
+
+class SeatLedger:
+    """
+    Contador de cupos por ponencia para admitir registros sin sobrevender.
+
+    Cada registro reserva un cupo (lease) antes de llamar al backend y lo
+    confirma o libera con la respuesta, así nunca hay más registros en vuelo
+    que cupos libres y una ponencia llena se rechaza sin salir del proceso.
+    Los conteos se reconcilian con cada lectura de getSessionsCapacity y,
+    ante la duda, se subestiman los registrados: el backend, que revalida
+    la capacidad bajo LockService, sigue teniendo la última palabra. En
+    modo write-behind la lectura se suma a los registros que aún esperan en
+    el journal, que Apps Script todavía no cuenta. Una ponencia llena solo
+    se rechaza localmente si la lectura tiene menos de `lease_ttl`
+    segundos: con una más vieja los organizadores pueden haber subido los
+    cupos, así que decide el backend.
+    """
+
+    def __init__(self, lease_ttl=CAPACITY_LEASE_TTL, wait=CAPACITY_LEASE_WAIT_SECONDS):
+        self.lease_ttl = lease_ttl
+        self.wait = wait
+        self.local_rejections = 0
+        self._cond = threading.Condition()
+        self._async_waiters = set()
+        self._seats = {}
+        self._epoch = 0
+        self._last_lease = 0
+        self._read_at = float('-inf')
+        self._journal_seen = 0
+
+    def _notify(self):
+        """Avisar a los que esperan cupo, hilos y corrutinas (con self._cond tomado)"""
+        self._cond.notify_all()
+        _wake_waiters(self._async_waiters)
+        self._async_waiters.clear()
+
+    def reconcile(self, capacity, pending=None, age=0, journal_seen=None):
+        """
+        Adoptar los conteos de una lectura de getSessionsCapacity hecha hace
+        `age` segundos. `pending` es {session_id: registros aceptados aún no
+        enviados}, leído del journal hasta la fila `journal_seen`
+        """
+        pending = pending or {}
+        with self._cond:
+            # Los leases anteriores pueden estar ya incluidos en esta lectura
+            self._epoch += 1
+            self._read_at = time.monotonic() - age
+            if journal_seen is not None:
+                self._journal_seen = max(self._journal_seen, journal_seen)
+            for session_id, info in capacity.items():
+                seat = self._seats.setdefault(session_id, {"leases": {}})
+                seat['total'] = info.get('total', 0)
+                seat['registered'] = seat['total'] - info.get('available', 0) + pending.get(session_id, 0)
+                seat['name'] = info.get('name', session_id)
+            self._notify()
+
+    def acquire(self, session_id, wait=None):
+        """
+        Reservar un cupo de `session_id`, esperando hasta `wait` segundos
+        (por defecto self.wait) a que se libere uno. Retorna (lease, rechazo):
+        - (lease, None): cupo reservado hasta settle() o hasta vencer el lease
+        - (None, respuesta no_capacity): la ponencia está llena según una lectura reciente
+        - (None, None): ponencia desconocida, lectura vieja o espera agotada; decide el backend
+        """
+        deadline = time.monotonic() + (self.wait if wait is None else wait)
+        with self._cond:
+            while True:
+                outcome, delay = self._attempt(session_id, deadline)
+                if delay is None:
+                    return outcome
+                self._cond.wait(delay)
+
+    async def aacquire(self, session_id):
+        """Igual que acquire(), pero espera en el event loop sin ocupar un hilo (modo ASGI)"""
+        deadline = time.monotonic() + self.wait
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                outcome, delay = self._attempt(session_id, deadline)
+                if delay is None:
+                    return outcome
+                waiter = (loop, loop.create_future())
+                self._async_waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter[1], delay)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self._async_waiters.discard(waiter)
+
+    def _attempt(self, session_id, deadline):
+        """
+        Un intento de reserva con self._cond tomado. Retorna (resultado de
+        acquire(), None) o (None, segundos a esperar antes de reintentar)
+        """
+        seat = self._seats.get(session_id)
+        if seat is None:
+            return (None, None), None
+
+        now = time.monotonic()
+        leases = seat['leases']
+        for lease_id in [l for l, expires in leases.items() if expires <= now]:
+            del leases[lease_id]
+
+        if seat['total'] - seat['registered'] - len(leases) > 0:
+            self._last_lease += 1
+            leases[self._last_lease] = now + self.lease_ttl
+            return ((self._last_lease, self._epoch), None), None
+        if not leases:
+            if now - self._read_at > self.lease_ttl:
+                # Lectura vieja: los cupos pudieron cambiar en la hoja
+                return (None, None), None
+            self.local_rejections += 1
+            return (None, {
+                "no_capacity": True,
+                "session_id": session_id,
+                "session_name": seat['name'],
+                "available_capacity": 0
+            }), None
+
+        # Sin cupos libres pero con registros en vuelo: esperar su resultado
+        remaining = deadline - now
+        if remaining <= 0:
+            return (None, None), None
+        return None, min(remaining, min(leases.values()) - now)
+
+    def settle(self, session_id, result, lease=None, journal_id=None):
+        """
+        Confirmar o liberar el cupo según la respuesta del backend. En modo
+        write-behind `journal_id` es la fila encolada para este registro
+        """
+        with self._cond:
+            seat = self._seats.get(session_id)
+            if seat is None:
+                return
+            if lease:
+                seat['leases'].pop(lease[0], None)
+            if result.get('registered'):
+                if journal_id is not None:
+                    # Encolado: ya está contado si alguna reconciliación leyó su fila del journal
+                    fresh = journal_id > self._journal_seen
+                else:
+                    # Con otra época el registro puede estar ya en la lectura reconciliada
+                    fresh = lease and lease[1] == self._epoch
+                if fresh:
+                    seat['registered'] += 1
+            elif result.get('no_capacity'):
+                seat['registered'] = max(seat['registered'], seat['total'])
+            self._notify()
+
+class EventStats:
+    """
+    Agregados del evento que sirve GET /api/v1/stats.
+
+    La base (asistencia general, kits y registros por minuto) llega de
+    getEventStats a través de la caché de respuestas, cada
+    STATS_RESYNC_SECONDS. Entre lecturas la actualizan los registros que
+    acepta este worker (record_general / record_session). Las ponencias
+    salen de la caché de capacidad, que ya se ajusta con cada registro. El
+    payload se arma una vez por cambio (o por minuto, para correr la
+    ventana) y se sirve tal cual a todos los tableros. 'today' vuelve a
+    cero al cambiar el día local, sin esperar a la próxima lectura.
+    """
+
+    def __init__(self, window_minutes=STATS_WINDOW_MINUTES):
+        self.window_minutes = window_minutes
+        self.synced_at = None
+        self._lock = threading.Lock()
+        self._general = {"attendees": 0, "checkins": 0, "today": 0, "kits_delivered": 0}
+        self._day = datetime.now().date()
+        self._capacity = {}
+        self._per_minute = {}
+        self._payload = None
+
+    def seed(self, stats):
+        """Reemplazar la base con una respuesta de getEventStats"""
+        with self._lock:
+            self._general = dict(stats['general'])
+            self._day = datetime.now().date()
+            self._per_minute = {minute: [general, sessions] for minute, general, sessions in stats['per_minute']}
+            self.synced_at = datetime.now()
+            self._payload = None
+
+    def set_capacity(self, capacity):
+        if not isinstance(capacity, dict) or 'error' in capacity:
+            return
+        with self._lock:
+            self._capacity = capacity
+            self._payload = None
+
+    def record_general(self, result):
+        """Sumar una asistencia general aceptada; la repetida del mismo día no cuenta"""
+        if not result.get('registered') or result.get('already_registered_today'):
+            return
+        with self._lock:
+            self._roll_day()
+            self._general['checkins'] += 1
+            self._general['today'] += 1
+            # El kit se entrega solo en la primera asistencia del asistente
+            if result.get('kit_entregado'):
+                self._general['attendees'] += 1
+                self._general['kits_delivered'] += 1
+            self._count(0)
+
+    def record_session(self, result):
+        if not result.get('registered'):
+            return
+        with self._lock:
+            self._count(1)
+
+    def _roll_day(self):
+        """Reiniciar 'today' si cambió el día desde la última lectura o registro"""
+        day = datetime.now().date()
+        if day != self._day:
+            self._day = day
+            self._general['today'] = 0
+            self._payload = None
+
+    def _count(self, column):
+        minute = int(time.time() // 60) * 60
+        self._per_minute.setdefault(minute, [0, 0])[column] += 1
+        self._payload = None
+
+    def payload(self):
+        minute = int(time.time() // 60) * 60
+        with self._lock:
+            self._roll_day()
+            if self._payload is None or self._payload[0] != minute:
+                self._payload = (minute, self._build(minute))
+            return self._payload[1]
+
+    def _build(self, minute):
+        start = minute - (self.window_minutes - 1) * 60
+        for old in [m for m in self._per_minute if m < start]:
+            del self._per_minute[old]
+        window = [self._per_minute.get(m, (0, 0)) for m in range(start, minute + 60, 60)]
+
+        sessions = []
+        for session_id, info in self._capacity.items():
+            total = info.get('total', 0)
+            registered = max(0, total - info.get('available', 0))
+            sessions.append({
+                "id": session_id,
+                "name": info.get('name') or session_id,
+                "registered": registered,
+                "total": total,
+                "available": info.get('available', 0),
+                "fill_ratio": round(registered / total, 3) if total else 0
+            })
+        registered = sum(s['registered'] for s in sessions)
+        capacity = sum(s['total'] for s in sessions)
+
+        return {
+            "general": dict(self._general),
+            "sessions": sessions,
+            "totals": {
+                "registered": registered,
+                "capacity": capacity,
+                "available": sum(s['available'] for s in sessions),
+                "fill_ratio": round(registered / capacity, 3) if capacity else 0
+            },
+            "per_minute": {
+                "start": datetime.fromtimestamp(start).isoformat(timespec='minutes'),
+                "general": [general for general, _ in window],
+                "sessions": [registrations for _, registrations in window]
+            },
+            "synced_at": self.synced_at.isoformat(timespec='seconds') if self.synced_at else None
+        }
+
+class RegistrationJournal:
+    """
+    Journal local y durable de registros (SQLite en modo WAL).
+
+    En modo write-behind cada registro validado localmente se agrega aquí
+    y la petición HTTP responde de inmediato. Un hilo de fondo drena los
+    eventos pendientes hacia Apps Script en lotes, con backoff exponencial
+    entre reintentos. Cada evento lleva una idempotency_key (la del
+    cliente, si la envió) para que un reenvío tras un timeout no duplique
+    filas en la hoja; junto a ella se guarda la respuesta que recibió el
+    cliente, que se devuelve tal cual si reenvía la misma clave.
+
+    Estados: pending → done | rejected (Apps Script lo rechazó) | failed
+    (se agotaron los reintentos).
+    """
+
+    def __init__(self, path, api, batch_size=JOURNAL_BATCH_SIZE,
+                 drain_interval=JOURNAL_DRAIN_INTERVAL,
+                 max_attempts=JOURNAL_MAX_ATTEMPTS,
+                 retry_base=JOURNAL_RETRY_BASE_SECONDS):
+        self.path = path
+        self.api = api
+        self.batch_size = batch_size
+        self.drain_interval = drain_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS registration_journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    action TEXT NOT NULL,
+                    dni TEXT NOT NULL,
+                    session_id TEXT,
+                    timestamp TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    result TEXT,
+                    response TEXT
+                )
+            """)
+            # Journal creado antes de guardar la respuesta al cliente
+            if 'response' not in {row[1] for row in conn.execute("PRAGMA table_info(registration_journal)")}:
+                conn.execute("ALTER TABLE registration_journal ADD COLUMN response TEXT")
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_journal_pending
+                ON registration_journal (status, next_attempt_at, id)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_journal_dni
+                ON registration_journal (dni, action)
+            """)
+            self._conn = conn
+        return self._conn
+
+    def append(self, action, dni, session_id=None, timestamp=None, idempotency_key=None, response=None):
+        """
+        Agregar un evento al journal con la respuesta dada al cliente.
+
+        Si `idempotency_key` ya está en el journal no agrega otro evento.
+        Retorna (id de la fila, respuesta guardada o None si es nuevo)
+        """
+        key = idempotency_key or uuid.uuid4().hex
+        timestamp = timestamp or datetime.now().isoformat()
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "INSERT INTO registration_journal (idempotency_key, action, dni, session_id, timestamp, response) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (idempotency_key) DO NOTHING",
+                (key, action, dni, session_id, timestamp, json.dumps(response) if response is not None else None)
+            )
+            if not cursor.rowcount:
+                row_id, stored = conn.execute(
+                    "SELECT id, response FROM registration_journal WHERE idempotency_key = ?", (key,)
+                ).fetchone()
+                return row_id, {**(json.loads(stored) if stored else {}), "replayed": True}
+        self._wakeup.set()
+        return cursor.lastrowid, None
+
+    def response_for(self, idempotency_key):
+        """Respuesta dada al evento con esta idempotency_key, marcada 'replayed' (None si no existe)"""
+        if not idempotency_key:
+            return None
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT response FROM registration_journal WHERE idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {**(json.loads(row[0]) if row[0] else {}), "replayed": True}
+
+    def has_event(self, action, dni, session_id=None, day=None):
+        """¿Hay un evento no rechazado para este DNI (opcionalmente en el día local `day`, ISO)?"""
+        query = ("SELECT timestamp FROM registration_journal WHERE action = ? AND dni = ? "
+                 "AND status IN ('pending', 'done')")
+        params = [action, dni]
+        if session_id is not None:
+            query += " AND session_id = ?"
+            params.append(session_id)
+        with self._lock:
+            if day is None:
+                return self._connect().execute(query + " LIMIT 1", params).fetchone() is not None
+            rows = self._connect().execute(query, params).fetchall()
+        # El día se compara ya convertido a hora local: los clientes pueden mandar otra zona horaria
+        return any(_day_key(timestamp) == day for (timestamp,) in rows)
+
+    def pending_sessions(self):
+        """
+        Registros en ponencia aceptados localmente y aún no enviados, por
+        ponencia, y el id de la última fila que vio la lectura (las filas
+        con id mayor no están en el conteo). Retorna ({session_id: n}, id)
+        """
+        with self._lock:
+            conn = self._connect()
+            # Una sola transacción: el conteo y el id salen de la misma foto
+            conn.execute("BEGIN")
+            try:
+                rows = conn.execute(
+                    "SELECT session_id, COUNT(*) FROM registration_journal "
+                    "WHERE status = 'pending' AND action = 'registerSessionAttendance' GROUP BY session_id"
+                ).fetchall()
+                last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM registration_journal").fetchone()[0]
+            finally:
+                conn.execute("COMMIT")
+        return dict(rows), last_id
+
+    def status(self, limit=JOURNAL_STATUS_LIMIT):
+        """
+        Eventos por estado y los últimos rechazados o fallidos: los que el
+        kiosko vio como registrados y Apps Script no aceptó al drenar
+        """
+        with self._lock:
+            conn = self._connect()
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM registration_journal GROUP BY status"))
+            rows = conn.execute(
+                "SELECT action, dni, session_id, timestamp, status, last_error, result "
+                "FROM registration_journal WHERE status IN ('rejected', 'failed') ORDER BY id DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return {
+            **{status: counts.get(status, 0) for status in ('pending', 'done', 'rejected', 'failed')},
+            "recent_rejections": [
+                {"action": action, "dni": dni, "session_id": session_id, "timestamp": timestamp,
+                 "status": status, "error": error, "result": json.loads(result) if result else None}
+                for action, dni, session_id, timestamp, status, error, result in rows
+            ]
+        }
+
+    def pending_count(self):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT COUNT(*) FROM registration_journal WHERE status = 'pending'"
+            ).fetchone()
+        return row[0]
+
+    def ensure_started(self):
+        """Arrancar el hilo que drena el journal (una sola vez por proceso)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='journal-drain', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                while self.drain_once():
+                    pass
+            except Exception:
+                log.exception("Exception drenando journal de registros")
+            self._wakeup.wait(self.drain_interval)
+            self._wakeup.clear()
+
+    def drain_once(self):
+        """Enviar un lote de eventos pendientes. Retorna cuántos se procesaron"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, idempotency_key, action, dni, session_id, timestamp, attempts "
+                "FROM registration_journal WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY id LIMIT ?",
+                (time.time(), self.batch_size)
+            ).fetchall()
+
+        for action in ('registerGeneralAttendance', 'registerSessionAttendance'):
+            batch = [row for row in rows if row[2] == action]
+            if batch:
+                self._deliver(action, batch)
+        return len(rows)
+
+    def _deliver(self, action, rows):
+        """Enviar un lote de la misma acción con la acción *Batch de Apps Script"""
+        items = [
+            {"dni": dni, "session_id": session_id, "timestamp": timestamp, "idempotency_key": key}
+            for _, key, _, dni, session_id, timestamp, _ in rows
+        ]
+        if action == 'registerGeneralAttendance':
+            response = self.api.register_general_attendance_batch(items)
+        else:
+            response = self.api.register_session_attendance_batch(items)
+
+        if 'error' in response:
+            results = [response] * len(rows)
+        else:
+            results = response['results']
+
+        for row, result in zip(rows, results):
+            row_id, key, attempts = row[0], row[1], row[6] + 1
+            if 'error' in result:
+                if attempts >= self.max_attempts:
+                    status, next_attempt = 'failed', 0
+                    log.error("Registro descartado tras agotar reintentos",
+                              extra={"idempotency_key": key, "attempts": attempts, "error": result['error']})
+                else:
+                    status, next_attempt = 'pending', time.time() + self.retry_base * (2 ** (attempts - 1))
+                self._update(row_id, status, attempts, next_attempt, result['error'], None)
+                continue
+
+            accepted = result.get('registered') or result.get('already_registered')
+            self._update(row_id, 'done' if accepted else 'rejected', attempts, 0, None, json.dumps(result))
+
+    def _update(self, row_id, status, attempts, next_attempt, error, result):
+        with self._lock:
+            self._connect().execute(
+                "UPDATE registration_journal SET status = ?, attempts = ?, next_attempt_at = ?, "
+                "last_error = ?, result = ? WHERE id = ?",
+                (status, attempts, next_attempt, error, result, row_id)
+            )
+
+class SheetsSync:
+    """
+    Sincronización en dos sentidos entre el backend SQLite (réplica local)
+    y Google Sheets, que sigue siendo la fuente de verdad.
+
+    Cada ciclo primero hace push: los registros locales pendientes se
+    envían con las acciones *Batch de Apps Script (un único setValues por
+    lote), asistencias generales antes que ponencias. Luego hace pull:
+    getSyncDelta trae solo las filas agregadas desde el watermark de cada
+    hoja y las filas de Attendees/Sessions editadas a mano desde la última
+    versión vista. Si una hoja encoge (filas borradas) o cada
+    `full_pull_every` ciclos, Attendees y Sessions se releen completas.
+
+    Conflictos: si la hoja ya tenía el mismo registro (duplicado) la fila
+    local se une con la de la hoja en el pull; si Apps Script lo rechaza
+    (sin cupos, solapamiento, DNI o sesión inexistente) gana Sheets: la
+    fila local se descarta y queda en sync_conflicts para revisión.
+    """
+
+    def __init__(self, storage, api, interval=SHEETS_SYNC_INTERVAL,
+                 batch_size=SHEETS_SYNC_BATCH_SIZE, pull_limit=SHEETS_SYNC_PULL_LIMIT,
+                 full_pull_every=SHEETS_SYNC_FULL_PULL_EVERY):
+        self.storage = storage
+        self.api = api
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pull_limit = pull_limit
+        self.full_pull_every = max(1, full_pull_every)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._cycles = 0
+        self._failures = 0
+        self.last_push = None
+        self.last_pull = None
+        self.last_push_error = None
+        self.last_pull_error = None
+        self.rows_behind = None
+
+    def ensure_started(self):
+        """Arrancar el hilo de sincronización (una sola vez por proceso)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sheets-sync', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                ok = self.sync_once(full=self._cycles % self.full_pull_every == 0)
+            except Exception:
+                ok = False
+                log.exception("Exception sincronizando con Google Sheets")
+            self._failures = 0 if ok else self._failures + 1
+            # Backoff exponencial mientras Apps Script falle, hasta 5 minutos
+            time.sleep(min(self.interval * 2 ** self._failures, 300))
+
+    def sync_once(self, full=False):
+        """Un ciclo push + pull. Retorna True si ambos terminaron sin error"""
+        pushed = self.push()
+        pulled = self.pull(full=full)
+        self._cycles += 1
+        return pushed and pulled
+
+    def push(self):
+        """Enviar a Sheets todos los registros locales pendientes"""
+        while True:
+            general, sessions = self.storage.pending_sync(self.batch_size)
+            if not general and not sessions:
+                break
+            for kind, items in (('general', general), ('session', sessions)):
+                if items and not self._push_batch(kind, items):
+                    return False
+        self.last_push = time.time()
+        self.last_push_error = None
+        return True
+
+    def _push_batch(self, kind, items):
+        payload = [{k: v for k, v in item.items() if k != 'id'} for item in items]
+        if kind == 'general':
+            response = self.api.register_general_attendance_batch(payload)
+        else:
+            response = self.api.register_session_attendance_batch(payload)
+
+        if 'error' in response:
+            # Las filas siguen pendientes y se reenvían con la misma idempotency_key
+            self.last_push_error = response['error']
+            log.error("No se pudieron enviar registros a Sheets",
+                      extra={"kind": kind, "count": len(items), "error": response['error']})
+            return False
+
+        _, conflicts = self.storage.resolve_push(kind, items, response['results'])
+        if conflicts:
+            log.warning("Sheets rechazó registros locales; ver la tabla sync_conflicts",
+                        extra={"kind": kind, "conflicts": conflicts})
+        return True
+
+    def pull(self, full=False):
+        """Traer de Sheets las filas nuevas y las editadas a mano"""
+        base = self.storage.sync_watermarks()
+        offsets = dict(base)
+        if full:
+            offsets.update(attendees_from=0, sessions_from=0)
+
+        delta = self.api.get_sync_delta(limit=self.pull_limit, **offsets)
+        if 'error' not in delta:
+            # Hojas que encogieron o con el registro de ediciones desbordado: releerlas
+            reload = [key for key, part in self.storage.SYNC_PARTS.items()
+                      if offsets[key] and (delta[part]['total'] < offsets[key] or delta[part].get('reset'))]
+            if reload:
+                offsets.update(dict.fromkeys(reload, 0))
+                delta = self.api.get_sync_delta(limit=self.pull_limit, **offsets)
+
+        if 'error' in delta:
+            self.last_pull_error = delta['error']
+            log.error("No se pudieron leer los cambios de Sheets", extra={"error": delta['error']})
+            return False
+
+        watermarks = self.storage.apply_sync_delta(base, delta)
+        if watermarks is not None:
+            self.rows_behind = sum(max(0, delta[part]['total'] - watermarks[key])
+                                   for key, part in self.storage.SYNC_PARTS.items())
+        self.last_pull = time.time()
+        self.last_pull_error = None
+        return True
+
+    def status(self):
+        """Métricas de retraso de la réplica respecto a Sheets"""
+        now = time.time()
+        backlog = self.storage.sync_backlog()
+        return {
+            "running": self._thread is not None,
+            "push": {
+                "pending": backlog['pending'],
+                "unconfirmed": backlog['pushed'],
+                "lag_seconds": backlog['pending_lag_seconds'],
+                "last_success": datetime.fromtimestamp(self.last_push).isoformat() if self.last_push else None,
+                "last_error": self.last_push_error
+            },
+            "pull": {
+                "lag_seconds": round(now - self.last_pull, 1) if self.last_pull else None,
+                "rows_behind": self.rows_behind,
+                "last_success": datetime.fromtimestamp(self.last_pull).isoformat() if self.last_pull else None,
+                "last_error": self.last_pull_error
+            },
+            "conflicts": backlog['conflicts'],
+            "watermarks": self.storage.sync_watermarks()
+        }
+
+def _build_storage():
+    """Backend de almacenamiento según STORAGE_BACKEND"""
+    if STORAGE_BACKEND == 'sqlite':
+        return SQLiteStorage(SQLITE_DB_PATH)
+    if STORAGE_BACKEND == 'appscript':
+        return AppScriptAPI(APPSCRIPT_BASE_URL)
+    raise ValueError(f"STORAGE_BACKEND desconocido: '{STORAGE_BACKEND}' (use 'appscript' o 'sqlite')")
+
+# Initialize storage backend
+api_client = _build_storage()
+response_cache = ResponseCache()
+shared_snapshots = SharedSnapshots(SHARED_CACHE_DIR, api_client, response_cache) if SHARED_CACHE_DIR else None
+# Con la caché compartida el índice se arma desde la instantánea del padrón
+attendee_index = AttendeeIndex(shared_snapshots or api_client)
+registration_journal = RegistrationJournal(JOURNAL_PATH, api_client)
+capacity_broadcaster = CapacityBroadcaster()
+response_cache.on_change('capacity', capacity_broadcaster.publish)
+sessions_feed = VersionedFeed(key='id')
+response_cache.on_change('sessions', sessions_feed.publish)
+seat_ledger = SeatLedger()
+scan_dedup = ScanDeduplicator()
+
+def _reconcile_seats(capacity):
+    """Reconciliar el ledger sumando los registros en ponencia que esperan en el journal"""
+    # Un lote en pleno envío puede contarse dos veces: en esa ventana se rechaza de más, no se sobrevende
+    pending, journal_seen = (registration_journal.pending_sessions()
+                             if REGISTRATION_MODE == 'write_behind' else (None, None))
+    seat_ledger.reconcile(capacity, pending, response_cache.age('capacity') or 0, journal_seen)
+
+if CAPACITY_LEASES_ENABLED:
+    response_cache.on_load('capacity', _reconcile_seats)
+event_stats = EventStats()
+response_cache.on_load('event_stats', event_stats.seed)
+response_cache.on_change('capacity', event_stats.set_capacity)
+sheets_sync = (SheetsSync(api_client, AppScriptAPI(APPSCRIPT_BASE_URL))
+               if SHEETS_SYNC_ENABLED and isinstance(api_client, SQLiteStorage) else None)
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    metrics.inc('asistencia_http_in_flight', endpoint=request.endpoint or 'unmatched')
+
+@app.after_request
+def _record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    metrics.observe('asistencia_http_duration_seconds', time.perf_counter() - g.metrics_started,
+                    endpoint=endpoint)
+    metrics.inc('asistencia_http_requests_total', endpoint=endpoint, method=request.method,
+                status=str(response.status_code))
+    return response
+
+@app.teardown_request
+def _finish_request_metrics(exc):
+    # En los streams (SSE) llega al cerrarse la conexión
+    if 'metrics_started' in g:
+        metrics.inc('asistencia_http_in_flight', -1, endpoint=request.endpoint or 'unmatched')
+
+@metrics.collector
+def _component_metrics():
+    """Contadores que ya llevan la caché, el ledger de cupos y el logging"""
+    samples = [
+        ('asistencia_cache_requests_total', 'counter', 'Consultas a la caché de respuestas por resultado',
+         {"result": result}, count)
+        for result, count in (('hit', response_cache.hits), ('stale', response_cache.stale_hits),
+                              ('miss', response_cache.misses), ('fallback', response_cache.fallbacks))
+    ]
+    samples.extend(('asistencia_upstream_circuit_open', 'gauge',
+                    'Cortocircuito por acción (0 cerrado, 1 abierto, 0.5 llamada de prueba)',
+                    {"action": action}, {'closed': 0, 'open': 1, 'half_open': 0.5}[state])
+                   for action, state in circuit_breaker.states().items())
+    samples.append(('asistencia_seat_local_rejections_total', 'counter',
+                    'Registros en ponencias llenas rechazados sin llamar al backend', {},
+                    seat_ledger.local_rejections))
+    samples.append(('asistencia_scan_duplicates_total', 'counter',
+                    'Registros repetidos del mismo DNI resueltos sin llamar al backend', {},
+                    scan_dedup.duplicates))
+    samples.append(('asistencia_log_dropped_total', 'counter', 'Eventos de log descartados con la cola llena', {},
+                    log.handlers[0].dropped))
+    if attendee_index.ready:
+        index = attendee_index.stats()
+        samples.append(('asistencia_index_attendees', 'gauge', 'Asistentes en el índice local', {},
+                        index['attendees']))
+        samples.append(('asistencia_index_general', 'gauge', 'Asistentes con asistencia general en el índice local',
+                        {}, index['general']))
+        samples.extend(('asistencia_index_session_registered', 'gauge',
+                        'Registrados por ponencia según el índice local', {"session": session_id}, count)
+                       for session_id, count in index['sessions'].items())
+        samples.append(('asistencia_index_bytes', 'gauge', 'Memoria de los arrays y bitsets del índice local', {},
+                        index['bytes']))
+    if shared_snapshots is not None:
+        samples.append(('asistencia_shared_cache_refresher', 'gauge',
+                        'Este worker refresca la caché compartida (1) o la lee (0)', {},
+                        int(shared_snapshots.is_refresher)))
+        samples.append(('asistencia_shared_cache_writes_total', 'counter',
+                        'Instantáneas escritas por este worker', {}, shared_snapshots.writes))
+        samples.append(('asistencia_shared_cache_installs_total', 'counter',
+                        'Instantáneas nuevas leídas por este worker', {}, shared_snapshots.installs))
+        samples.extend(('asistencia_shared_cache_age_seconds', 'gauge', 'Antigüedad de cada instantánea compartida',
+                        {"key": key}, age) for key, age in shared_snapshots.ages().items())
+    return samples
+
+@app.before_request
+def _start_shared_snapshots():
+    """Elección del refrescador de la caché compartida desde la primera petición"""
+    if shared_snapshots is not None:
+        shared_snapshots.ensure_started()
+
+def _cached(key, loader, ttl):
+    """response_cache.get con la instantánea compartida entre workers delante, si está activa"""
+    if shared_snapshots is not None:
+        shared_snapshots.install(key)
+        loader = shared_snapshots.loader(key, loader, ttl)
+    return response_cache.get(key, loader, ttl)
+
+@app.before_request
+def _start_sheets_sync():
+    """La réplica SQLite se sincroniza en segundo plano desde la primera petición"""
+    if sheets_sync is not None:
+        sheets_sync.ensure_started()
+
+def _write_behind_ready():
+    """El modo write-behind solo actúa con el índice local ya cargado"""
+    if REGISTRATION_MODE != 'write_behind':
+        return False
+    attendee_index.ensure_started()
+    registration_journal.ensure_started()
+    return attendee_index.ready
+
+def _acquire_seat(session_id, wait=None):
+    """Reservar un cupo en seat_ledger, con la capacidad al día. Retorna (lease, rechazo)"""
+    if not CAPACITY_LEASES_ENABLED:
+        return None, None
+    # Dentro del TTL no sale del proceso; vencido, la revalidación reconcilia el ledger
+    _cached('capacity', api_client.get_sessions_capacity, CAPACITY_CACHE_TTL)
+    return seat_ledger.acquire(session_id, wait)
+
+def _enqueue_general_attendance(dni, timestamp=None, idempotency_key=None):
+    """
+    Validar localmente y encolar una asistencia general (respuesta estilo
+    Apps Script). Con la idempotency_key de un evento ya encolado devuelve
+    la respuesta original, marcada 'replayed'
+    """
+    replayed = registration_journal.response_for(idempotency_key)
+    if replayed is not None:
+        return replayed
+    if len(dni) != 8:
+        return {"error": "dni inválido"}
+    if not attendee_index.exists(dni):
+        return {"error": "DNI no existe en Attendees."}
+
+    timestamp = timestamp or datetime.now().isoformat()
+    today = _day_key(timestamp)
+    # La hoja (vía el índice) y el journal: ya vino hoy y/o ya tiene kit
+    last_day, has_kit = attendee_index.general_state(dni)
+    queued = registration_journal.has_event('registerGeneralAttendance', dni)
+    if last_day == today or (queued and registration_journal.has_event('registerGeneralAttendance', dni, day=today)):
+        return {
+            "registered": True,
+            "dni": dni,
+            # Como en Apps Script: el kit se entregó en alguna asistencia anterior (la primera encolada lo lleva)
+            "kit_entregado": has_kit or (queued and not attendee_index.has_general(dni)),
+            "already_registered_today": True,
+            "queued": True
+        }
+
+    first_time = not attendee_index.has_general(dni) and not queued
+    result = {
+        "registered": True,
+        "dni": dni,
+        "timestamp": timestamp,
+        "kit_entregado": first_time,
+        "queued": True
+    }
+    # Otro reenvío con la misma clave pudo encolarse entre tanto
+    _, replayed = registration_journal.append('registerGeneralAttendance', dni, timestamp=timestamp,
+                                              idempotency_key=idempotency_key, response=result)
+    return replayed or result
+
+def _enqueue_session_attendance(dni, session_id, timestamp=None, idempotency_key=None):
+    """
+    Validar localmente y encolar un registro en ponencia.
+
+    Replica las reglas de registerSessionAttendance. El solapamiento se
+    valida con la matriz de cruces, que se carga con el primer registro; si
+    Apps Script no la entrega lo evalúa al drenar y el evento queda
+    'rejected' en el journal (visible en /api/v1/sync/status).
+    Un reenvío con la misma idempotency_key recibe la respuesta original.
+    """
+    replayed = registration_journal.response_for(idempotency_key)
+    if replayed is not None:
+        return replayed
+    if len(dni) != 8:
+        return {"error": "dni inválido"}
+    if not attendee_index.exists(dni):
+        return {"error": "DNI no existe"}
+    if not attendee_index.has_session_id(session_id):
+        return {"error": "session_id no existe"}
+    if not attendee_index.has_general(dni) and not registration_journal.has_event('registerGeneralAttendance', dni):
+        return {"no_general_attendance": True, "dni": dni}
+
+    lease, rejection = _acquire_seat(session_id)
+    if rejection:
+        return rejection
+    capacity = response_cache.peek('capacity') or {}
+    session_name = capacity.get(session_id, {}).get('name', session_id)
+    conflict_id = _queued_conflict(dni, session_id)
+    journal_id = None
+    if (attendee_index.has_session(dni, session_id)
+            or registration_journal.has_event('registerSessionAttendance', dni, session_id)):
+        result = {
+            "already_registered": True,
+            "dni": dni,
+            "session_id": session_id,
+            "session_name": session_name
+        }
+    elif conflict_id:
+        result = {
+            "overlap": True,
+            "conflict_with": conflict_id,
+            "conflict_name": capacity.get(conflict_id, {}).get('name', conflict_id)
+        }
+    else:
+        result = {
+            "registered": True,
+            "dni": dni,
+            "session_id": session_id,
+            "session_name": session_name,
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "queued": True
+        }
+        journal_id, replayed = registration_journal.append(
+            'registerSessionAttendance', dni, session_id, result['timestamp'],
+            idempotency_key=idempotency_key, response=result)
+        if replayed:
+            # Otro reenvío con la misma clave se encoló entre tanto: este cupo no se usa
+            seat_ledger.settle(session_id, {}, lease)
+            return replayed
+    seat_ledger.settle(session_id, result, lease, journal_id)
+    return result
+
+def _queued_conflict(dni, session_id):
+    """Ponencia registrada o encolada del asistente que se cruza con `session_id`, según la matriz cacheada"""
+    # La primera vez se carga la matriz: sin ella un cruce se aceptaría y solo fallaría al drenar
+    conflicts = _cached('conflicts', api_client.get_session_conflicts, SESSIONS_CACHE_TTL)
+    if 'error' in conflicts:
+        conflicts = {}
+    for other in conflicts.get(session_id, ()):
+        if (attendee_index.has_session(dni, other)
+                or registration_journal.has_event('registerSessionAttendance', dni, other)):
+            return other
+    return None
+
+def _enqueue_checkin(dni, session_id=None, idempotency_key=None):
+    """
+    Check-in en modo write-behind: ambos pasos se validan y encolan
+    localmente. La asistencia general usa la idempotency_key del cliente
+    y la ponencia una derivada, así un reenvío repite ambas respuestas
+    """
+    if len(dni) != 8:
+        return {"error": "dni inválido"}
+    if not attendee_index.exists(dni):
+        return {"not_found": True, "dni": dni}
+
+    result = {"general": _enqueue_general_attendance(dni, idempotency_key=idempotency_key)}
+    if session_id:
+        # Ve en el journal la asistencia general recién encolada
+        result['session'] = _enqueue_session_attendance(
+            dni, session_id, idempotency_key=idempotency_key and f"{idempotency_key}:session")
+
+    attendee = attendee_index.lookup(dni)
+    attendee['asistencia_general'] = True
+    session = result.get('session', {})
+    if session.get('registered') or session.get('already_registered'):
+        attendee[session_id] = True
+    result['attendee'] = attendee
+    return result
+
+def _settle_checkin_seat(session_id, result, lease, rejection):
+    """Cerrar el cupo reservado para un check-in; si la ponencia estaba llena, informarlo como su resultado"""
+    if rejection:
+        if 'general' in result:
+            result['session'] = rejection
+    elif session_id:
+        seat_ledger.settle(session_id, result.get('session') or {}, lease)
+
+def _after_general_registration(dni, result):
+    """Reflejar localmente una asistencia general aceptada"""
+    if result.get('registered'):
+        attendee_index.mark_general(dni, result.get('timestamp'), result.get('kit_entregado'))
+    if not result.get('replayed'):
+        # Un reenvío con la misma idempotency_key ya se contó
+        event_stats.record_general(result)
+
+def _after_session_registration(dni, session_id, result):
+    """Reflejar localmente el resultado de un registro en ponencia"""
+    if result.get('registered') or result.get('already_registered'):
+        attendee_index.mark_session(dni, session_id)
+    if result.get('replayed'):
+        # Un reenvío con la misma idempotency_key ya se contó
+        return
+    event_stats.record_session(result)
+    if result.get('registered'):
+        response_cache.update('capacity', _take_seat(session_id))
+    elif result.get('no_capacity'):
+        response_cache.update('capacity', _mark_full(session_id))
+
+def _after_checkin(dni, session_id, result):
+    """Reflejar localmente los pasos aceptados de un check-in"""
+    if 'general' in result:
+        _after_general_registration(dni, result['general'])
+    if result.get('session'):
+        _after_session_registration(dni, session_id, result['session'])
+
+def _general_attendance_message(result):
+    """Determinar el mensaje según el estado"""
+    if _already_registered_today(result):
+        # Ya se registró hoy
+        if result.get('kit_entregado'):
+            return "Ya registró asistencia hoy. Kit entregado anteriormente"
+        return "Ya registró asistencia hoy"
+    if result.get('kit_entregado'):
+        # Primera vez - recibe kit
+        return "Asistencia general registrada exitosamente. Kit entregado"
+    # Día posterior - sin kit (ya lo recibió antes)
+    return "Asistencia general registrada exitosamente. Kit ya entregado anteriormente"
+
+def _already_registered_today(result):
+    """Ya tenía asistencia hoy, según el backend o porque es un escaneo repetido"""
+    return bool(result.get('already_registered_today') or result.get('duplicate_scan'))
+
+def _session_attendance_response(result, session_id):
+    """Traducir la respuesta de registerSessionAttendance al formato de la API"""
+    # Verificar si el registro fue exitoso según la respuesta
+    if result.get('registered') and not result.get('duplicate_scan'):
+        session_name = result.get('session_name', session_id)
+        return {
+            "success": True,
+            "message": f"Registrado exitosamente en {session_name}",
+            "data": result
+        }
+    elif result.get('already_registered') or result.get('registered'):
+        # Un escaneo repetido de un registro exitoso ya está registrado
+        session_name = result.get('session_name', session_id)
+        return {
+            "success": False,
+            "message": f"Ya está registrado en {session_name}"
+        }
+    elif result.get('no_general_attendance'):
+        return {
+            "success": False,
+            "message": "Debe registrar asistencia general primero"
+        }
+    elif result.get('no_capacity'):
+        session_name = result.get('session_name', session_id)
+        return {
+            "success": False,
+            "message": f"No hay cupos disponibles para {session_name}"
+        }
+    elif result.get('overlap'):
+        conflict_name = result.get('conflict_name', 'otra sesión')
+        return {
+            "success": False,
+            "message": f"Esta sesión se solapa con {conflict_name}",
+            "conflict_with": result.get('conflict_with'),
+            "conflict_name": conflict_name
+        }
+    else:
+        return {
+            "success": False,
+            "message": "Error desconocido al registrar en ponencia"
+        }
+
+def _checkin_response(result, session_id):
+    """Traducir la respuesta de checkin al formato de la API. Retorna (payload, status)"""
+    if 'error' in result:
+        return {
+            "success": False,
+            "message": "Error al registrar el check-in",
+            "error": result['error']
+        }, 500
+    if result.get('not_found'):
+        return {
+            "success": False,
+            "message": "Participante no encontrado en la base de datos"
+        }, 404
+
+    general = result['general']
+    session = result.get('session')
+    if result.get('duplicate_scan'):
+        general = {**general, "duplicate_scan": True}
+        session = session and {**session, "duplicate_scan": True}
+    payload = {
+        "success": True,
+        "message": _general_attendance_message(general),
+        "data": result['attendee'],
+        "general": general,
+        "kit_entregado": general.get('kit_entregado', False),
+        "already_registered_today": _already_registered_today(general)
+    }
+    if session_id:
+        session = session or {}
+        if 'error' in session:
+            payload['session'] = {
+                "success": False,
+                "message": f"Error al registrar en ponencia {session_id}",
+                "error": session['error']
+            }
+        else:
+            payload['session'] = _session_attendance_response(session, session_id)
+    return payload, 200
+
+def _versioned_response(feed, result, since, message):
+    """
+    Payload de una consulta a un VersionedFeed ya cargado en la caché.
+    Retorna (payload, token); con un `since` válido solo trae lo cambiado.
+    """
+    if feed.version == 0:
+        # Un pedido que esperó la primera carga puede llegar antes que el listener
+        feed.publish(result)
+    token, data, removed = feed.read(since)
+    payload = {
+        "success": True,
+        "data": data,
+        "version": token,
+        "message": message
+    }
+    if removed is not None:
+        payload['delta'] = True
+        payload['removed'] = removed
+    return payload, token
+
+def _conditional_json(payload, token):
+    """
+    jsonify() con ETag débil de la versión; si el cliente ya la tiene
+    (If-None-Match) responde 304 sin cuerpo
+    """
+    if request.if_none_match.contains_weak(token):
+        response = Response(status=304)
+    else:
+        response = jsonify(payload)
+    response.set_etag(token, weak=True)
+    # El navegador guarda la respuesta pero revalida en cada consulta
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _accepts_gzip(accept_encoding):
+    return parse_accept_header(accept_encoding)['gzip'] > 0
+
+@app.after_request
+def _compress_json(response):
+    """Comprimir con gzip las respuestas JSON grandes si el cliente lo acepta"""
+    if (not GZIP_MIN_BYTES or response.mimetype != 'application/json' or response.is_streamed
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if _accepts_gzip(request.headers.get('Accept-Encoding', '')):
+        response.set_data(gzip.compress(body, GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 # Routes
+@app.route('/metrics')
+def get_metrics():
+    """Métricas de este worker en el formato de texto de Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """Página principal"""
@@ -142,6 +4028,14 @@ def export_page():
     """Página de exportación"""
     return render_template('export.html')
 
+@app.route('/sw.js')
+def service_worker():
+    """Service Worker del modo kiosko offline, servido desde la raíz para controlar todas las páginas"""
+    response = app.send_static_file('js/sw.js')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Service-Worker-Allowed'] = '/'
+    return response
+
 # API Routes
 @app.route('/api/v1/attendees/search/<dni>', methods=['GET'])
 def search_attendee(dni):
@@ -163,7 +4057,12 @@ def search_attendee(dni):
     }
     """
     try:
-        result = api_client.get_attendee_by_dni(dni)
+        result = None
+        if ATTENDEE_INDEX_ENABLED:
+            attendee_index.ensure_started()
+            result = attendee_index.lookup(dni)
+        if result is None:
+            result = api_client.get_attendee_by_dni(dni)
         
         if 'error' in result:
             return jsonify({
@@ -185,13 +4084,60 @@ def search_attendee(dni):
             "error": str(e)
         }), 500
 
+@app.route('/api/v1/attendees/roster', methods=['GET'])
+def get_attendees_roster():
+    """
+    Padrón completo para el modo kiosko offline (se guarda en IndexedDB)
+    
+    Input: Ninguno
+    Output: {
+        "success": boolean,
+        "data": {
+            "sessions": [string],
+            "attendees": [[dni, nombre]],
+            "general": [dni],
+            "session_attendance": [[dni, session_id]]
+        },
+        "message": string
+    }
+    """
+    try:
+        # Con la caché compartida se envían los bytes de la instantánea, sin parsearla
+        raw = shared_snapshots.roster_json() if shared_snapshots is not None else None
+        if raw is not None:
+            return Response(_json_envelope(raw, "Padrón obtenido exitosamente"), mimetype='application/json')
+        
+        # Todos los kioskos comparten una misma lectura del volcado por TTL
+        result = response_cache.get('roster', api_client.get_attendees_snapshot, ROSTER_CACHE_TTL)
+        
+        if 'error' in result:
+            return jsonify({
+                "success": False,
+                "message": "Error al obtener el padrón",
+                "error": result['error']
+            }), 500
+        
+        return jsonify({
+            "success": True,
+            "data": _roster_data(result),
+            "message": "Padrón obtenido exitosamente"
+        })
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": "Error interno del servidor",
+            "error": str(e)
+        }), 500
+
 @app.route('/api/v1/attendees/general', methods=['POST'])
 def register_general_attendance():
     """
     Registrar asistencia general
     
     Input: {
-        "dni": string
+        "dni": string,
+        "idempotency_key": string (opcional, reintentos del kiosko offline)
     }
     Output: {
         "success": boolean,
@@ -209,7 +4155,17 @@ def register_general_attendance():
                 "message": "DNI es requerido"
             }), 400
         
-        result = api_client.register_general_attendance(dni)
+        def register():
+            if _write_behind_ready():
+                result = _enqueue_general_attendance(dni, idempotency_key=data.get('idempotency_key'))
+            else:
+                result = api_client.register_general_attendance(dni, idempotency_key=data.get('idempotency_key'))
+            if 'error' not in result:
+                _after_general_registration(dni, result)
+            return result
+        
+        # Un doble escaneo comparte el registro en curso o recién hecho
+        result = scan_dedup.run(('general', dni, None, data.get('idempotency_key')), register)
         
         if 'error' in result:
             return jsonify({
@@ -218,26 +4174,14 @@ def register_general_attendance():
                 "error": result['error']
             }), 500
         
-        # Determinar el mensaje según el estado
-        if result.get('already_registered_today'):
-            # Ya se registró hoy
-            if result.get('kit_entregado'):
-                message = "Ya registró asistencia hoy. Kit entregado anteriormente"
-            else:
-                message = "Ya registró asistencia hoy"
-        elif result.get('kit_entregado'):
-            # Primera vez - recibe kit
-            message = "Asistencia general registrada exitosamente. Kit entregado"
-        else:
-            # Día posterior - sin kit (ya lo recibió antes)
-            message = "Asistencia general registrada exitosamente. Kit ya entregado anteriormente"
+        message = _general_attendance_message(result)
         
         return jsonify({
             "success": True,
             "message": message,
             "data": result,
             "kit_entregado": result.get('kit_entregado', False),
-            "already_registered_today": result.get('already_registered_today', False)
+            "already_registered_today": _already_registered_today(result)
         })
     
     except Exception as e:
@@ -252,7 +4196,7 @@ def get_sessions_list():
     """
     Obtener lista de ponencias disponibles
     
-    Input: Ninguno
+    Input: ?since=<version> (opcional), cabecera If-None-Match (opcional)
     Output: {
         "success": boolean,
         "data": [
@@ -262,11 +4206,13 @@ def get_sessions_list():
                 "description": string (opcional)
             }
         ],
+        "version": string,
+        "delta": true y "removed": [string] (solo con since),
         "message": string
     }
     """
     try:
-        result = api_client.get_sessions_list()
+        result = _cached('sessions', api_client.get_sessions_list, SESSIONS_CACHE_TTL)
         
         if 'error' in result:
             return jsonify({
@@ -275,11 +4221,8 @@ def get_sessions_list():
                 "error": result['error']
             }), 500
         
-        return jsonify({
-            "success": True,
-            "data": result,
-            "message": "Lista de ponencias obtenida exitosamente"
-        })
+        return _conditional_json(*_versioned_response(sessions_feed, result, request.args.get('since'),
+                                                      "Lista de ponencias obtenida exitosamente"))
     
     except Exception as e:
         return jsonify({
@@ -293,7 +4236,7 @@ def get_sessions_capacity():
     """
     Obtener capacidad de ponencias
     
-    Input: Ninguno
+    Input: ?since=<version> (opcional), cabecera If-None-Match (opcional)
     Output: {
         "success": boolean,
         "data": {
@@ -301,11 +4244,13 @@ def get_sessions_capacity():
             "session_id_2": {"available": number, "total": number, "name": string},
             ...
         },
+        "version": string,
+        "delta": true y "removed": [string] (solo con since),
         "message": string
     }
     """
     try:
-        result = api_client.get_sessions_capacity()
+        result = _cached('capacity', api_client.get_sessions_capacity, CAPACITY_CACHE_TTL)
         
         if 'error' in result:
             return jsonify({
@@ -314,10 +4259,90 @@ def get_sessions_capacity():
                 "error": result['error']
             }), 500
         
+        return _conditional_json(*_versioned_response(capacity_broadcaster, result, request.args.get('since'),
+                                                      "Capacidad de ponencias obtenida exitosamente"))
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": "Error interno del servidor",
+            "error": str(e)
+        }), 500
+
+@app.route('/api/v1/sessions/conflicts', methods=['GET'])
+def get_session_conflicts():
+    """
+    Obtener los cruces de horario entre ponencias, para que el kiosko
+    deshabilite las que se solapan con las ya registradas del asistente
+    
+    Input: Ninguno
+    Output: {
+        "success": boolean,
+        "data": {
+            "session_id_1": ["session_id_2", ...],
+            ...
+        },
+        "message": string
+    }
+    """
+    try:
+        # Solo cambia con la hoja Sessions: mismo TTL que la lista de ponencias
+        result = _cached('conflicts', api_client.get_session_conflicts, SESSIONS_CACHE_TTL)
+        
+        if 'error' in result:
+            return jsonify({
+                "success": False,
+                "message": "Error al obtener cruces de horario",
+                "error": result['error']
+            }), 500
+        
         return jsonify({
             "success": True,
             "data": result,
-            "message": "Capacidad de ponencias obtenida exitosamente"
+            "message": "Cruces de horario obtenidos exitosamente"
+        })
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": "Error interno del servidor",
+            "error": str(e)
+        }), 500
+
+@app.route('/api/v1/stats', methods=['GET'])
+def get_event_stats():
+    """
+    Estadísticas del evento ya agregadas, para los tableros
+    
+    Input: Ninguno
+    Output: {
+        "success": boolean,
+        "data": {
+            "general": {"attendees": int, "today": int, "checkins": int, "kits_delivered": int},
+            "sessions": [{"id", "name", "registered", "total", "available", "fill_ratio"}, ...],
+            "totals": {"registered", "capacity", "available", "fill_ratio"},
+            "per_minute": {"start": string, "general": [int], "sessions": [int]},
+            "synced_at": string
+        },
+        "message": string
+    }
+    """
+    try:
+        # Las cargas alimentan event_stats por los listeners de la caché
+        for key, loader, ttl in (('event_stats', api_client.get_event_stats, STATS_RESYNC_SECONDS),
+                                 ('capacity', api_client.get_sessions_capacity, CAPACITY_CACHE_TTL)):
+            result = _cached(key, loader, ttl)
+            if 'error' in result:
+                return jsonify({
+                    "success": False,
+                    "message": "Error al obtener estadísticas",
+                    "error": result['error']
+                }), 500
+        
+        return jsonify({
+            "success": True,
+            "data": event_stats.payload(),
+            "message": "Estadísticas obtenidas exitosamente"
         })
     
     except Exception as e:
@@ -327,6 +4352,56 @@ def get_sessions_capacity():
             "error": str(e)
         }), 500
 
+def _sse_event(event, event_id, payload):
+    return f"event: {event}\nid: {event_id}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route('/api/v1/sessions/capacity/stream', methods=['GET'])
+def stream_sessions_capacity():
+    """
+    Canal Server-Sent Events con la capacidad de ponencias en vivo
+    
+    Input: Ninguno
+    Output (text/event-stream):
+        event: snapshot  data: {"version": number, "data": {session_id: {"available", "total", "name"}}}
+        event: delta     data: {"version": number, "changes": {session_id: {...}}, "removed": [session_id]}
+    
+    Se envía un snapshot al conectar y luego solo las sesiones cuya
+    disponibilidad cambió. Cada CAPACITY_STREAM_HEARTBEAT segundos se manda
+    un comentario keepalive y se revalida la caché compartida, de modo que
+    todos los clientes juntos generan a lo sumo una llamada upstream por TTL.
+    Requiere un worker asíncrono (gevent) para no ocupar un hilo por cliente.
+    """
+    def refresh_capacity():
+        return _cached('capacity', api_client.get_sessions_capacity, CAPACITY_CACHE_TTL)
+
+    def events():
+        q = capacity_broadcaster.subscribe()
+        try:
+            refresh_capacity()
+            yield "retry: 5000\n\n"
+            sent_version, capacity = capacity_broadcaster.snapshot()
+            yield _sse_event('snapshot', sent_version, {"version": sent_version, "data": capacity})
+            while True:
+                try:
+                    event = q.get(timeout=CAPACITY_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    refresh_capacity()
+                    yield ": keepalive\n\n"
+                    continue
+                if event.get('resync'):
+                    sent_version, capacity = capacity_broadcaster.snapshot()
+                    yield _sse_event('snapshot', sent_version, {"version": sent_version, "data": capacity})
+                elif event['version'] > sent_version:
+                    sent_version = event['version']
+                    yield _sse_event('delta', sent_version, event)
+        finally:
+            capacity_broadcaster.unsubscribe(q)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 @app.route('/api/v1/sessions/register', methods=['POST'])
 def register_session_attendance():
     """
@@ -334,7 +4409,8 @@ def register_session_attendance():
     
     Input: {
         "dni": string,
-        "session_id": string
+        "session_id": string,
+        "idempotency_key": string (opcional, reintentos del kiosko offline)
     }
     Output: {
         "success": boolean,
@@ -353,7 +4429,21 @@ def register_session_attendance():
                 "message": "DNI y session_id son requeridos"
             }), 400
         
-        result = api_client.register_session_attendance(dni, session_id)
+        def register():
+            if _write_behind_ready():
+                result = _enqueue_session_attendance(dni, session_id, idempotency_key=data.get('idempotency_key'))
+            else:
+                lease, result = _acquire_seat(session_id)
+                if result is None:
+                    result = api_client.register_session_attendance(dni, session_id,
+                                                                    idempotency_key=data.get('idempotency_key'))
+                    seat_ledger.settle(session_id, result, lease)
+            if 'error' not in result:
+                _after_session_registration(dni, session_id, result)
+            return result
+        
+        # Un doble escaneo comparte el registro en curso o recién hecho
+        result = scan_dedup.run(('session', dni, session_id, data.get('idempotency_key')), register)
         
         if 'error' in result:
             return jsonify({
@@ -362,44 +4452,243 @@ def register_session_attendance():
                 "error": result['error']
             }), 500
         
-        # Verificar si el registro fue exitoso según la respuesta
-        if result.get('registered'):
-            session_name = result.get('session_name', session_id)
-            return jsonify({
-                "success": True,
-                "message": f"Registrado exitosamente en {session_name}",
-                "data": result
-            })
-        elif result.get('already_registered'):
-            session_name = result.get('session_name', session_id)
-            return jsonify({
-                "success": False,
-                "message": f"Ya está registrado en {session_name}"
-            })
-        elif result.get('no_general_attendance'):
-            return jsonify({
-                "success": False,
-                "message": "Debe registrar asistencia general primero"
-            })
-        elif result.get('no_capacity'):
-            session_name = result.get('session_name', session_id)
-            return jsonify({
-                "success": False,
-                "message": f"No hay cupos disponibles para {session_name}"
-            })
-        elif result.get('overlap'):
-            conflict_name = result.get('conflict_name', 'otra sesión')
+        return jsonify(_session_attendance_response(result, session_id))
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": "Error interno del servidor",
+            "error": str(e)
+        }), 500
+
+@app.route('/api/v1/checkin', methods=['POST'])
+def checkin_attendee():
+    """
+    Check-in en la puerta: búsqueda, asistencia general y, opcionalmente,
+    registro en una ponencia con una sola llamada al backend
+    
+    Input: {
+        "dni": string,
+        "session_id": string (opcional),
+        "idempotency_key": string (opcional)
+    }
+    Output: {
+        "success": boolean,
+        "message": string,
+        "data": object (estado del asistente, como en la búsqueda),
+        "general": object,
+        "kit_entregado": boolean,
+        "already_registered_today": boolean,
+        "session": {"success": boolean, "message": string, ...} (solo con session_id)
+    }
+    """
+    try:
+        data = request.get_json()
+        dni = data.get('dni')
+        session_id = data.get('session_id')
+        
+        if not dni:
             return jsonify({
                 "success": False,
-                "message": f"Esta sesión se solapa con {conflict_name}",
-                "conflict_with": result.get('conflict_with'),
-                "conflict_name": conflict_name
-            })
+                "message": "DNI es requerido"
+            }), 400
+        
+        def checkin():
+            if _write_behind_ready():
+                result = _enqueue_checkin(dni, session_id, data.get('idempotency_key'))
+            else:
+                lease, rejection = _acquire_seat(session_id) if session_id else (None, None)
+                result = api_client.checkin(dni, None if rejection else session_id,
+                                            idempotency_key=data.get('idempotency_key'))
+                _settle_checkin_seat(session_id, result, lease, rejection)
+            _after_checkin(dni, session_id, result)
+            return result
+        
+        # Un doble escaneo comparte el check-in en curso o recién hecho
+        result = scan_dedup.run(('checkin', dni, session_id, data.get('idempotency_key')), checkin)
+        payload, status = _checkin_response(result, session_id)
+        return jsonify(payload), status
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": "Error interno del servidor",
+            "error": str(e)
+        }), 500
+
+def _batch_items(data, keys):
+    """
+    Normalizar el cuerpo de un endpoint por lotes a una lista de dicts.
+
+    Acepta {"items": [{...}]} o, para asistencia general, {"dnis": [...]}.
+    Retorna (items, mensaje_de_error).
+    """
+    items = data.get('items')
+    if items is None and 'dni' in keys:
+        items = [{"dni": dni} for dni in data.get('dnis') or []]
+    if not isinstance(items, list) or not items:
+        return None, "Se requiere una lista de items no vacía"
+    if len(items) > BATCH_MAX_ITEMS:
+        return None, f"Máximo {BATCH_MAX_ITEMS} items por lote"
+    normalized = []
+    for item in items:
+        if not isinstance(item, dict) or not all(item.get(k) for k in keys):
+            return None, f"Cada item requiere: {', '.join(keys)}"
+        entry = {k: str(item[k]).strip() for k in keys}
+        for optional in ('timestamp', 'idempotency_key'):
+            if item.get(optional):
+                entry[optional] = item[optional]
+        normalized.append(entry)
+    return normalized, None
+
+@app.route('/api/v1/attendees/general/batch', methods=['POST'])
+def register_general_attendance_batch():
+    """
+    Registrar asistencia general de varios DNIs en una sola llamada
+    (reenvío de escaneos offline y registros grupales)
+    
+    Input: {
+        "dnis": [string]
+    } o {
+        "items": [{"dni": string, "timestamp": string (opcional), "idempotency_key": string (opcional)}]
+    }
+    Output: {
+        "success": boolean,
+        "message": string,
+        "data": {
+            "results": [{"dni", "success", "message", "data", "kit_entregado", ...}],
+            "total": number,
+            "registered": number
+        }
+    }
+    """
+    try:
+        items, error = _batch_items(request.get_json() or {}, ('dni',))
+        if error:
+            return jsonify({"success": False, "message": error}), 400
+        
+        if _write_behind_ready():
+            results = [_enqueue_general_attendance(it['dni'], it.get('timestamp'), it.get('idempotency_key'))
+                       for it in items]
         else:
-            return jsonify({
-                "success": False,
-                "message": "Error desconocido al registrar en ponencia"
+            response = api_client.register_general_attendance_batch(items)
+            if 'error' in response:
+                return jsonify({
+                    "success": False,
+                    "message": "Error al registrar asistencia",
+                    "error": response['error']
+                }), 500
+            results = response['results']
+        
+        out = []
+        for item, result in zip(items, results):
+            if 'error' in result:
+                out.append({
+                    "dni": item['dni'],
+                    "success": False,
+                    "message": "Error al registrar asistencia",
+                    "error": result['error']
+                })
+                continue
+            _after_general_registration(item['dni'], result)
+            out.append({
+                "dni": item['dni'],
+                "success": True,
+                "message": _general_attendance_message(result),
+                "data": result,
+                "kit_entregado": result.get('kit_entregado', False),
+                "already_registered_today": result.get('already_registered_today', False)
             })
+        
+        registered = sum(1 for r in out if r['success'])
+        return jsonify({
+            "success": True,
+            "message": f"{registered} de {len(out)} registros procesados",
+            "data": {"results": out, "total": len(out), "registered": registered}
+        })
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": "Error interno del servidor",
+            "error": str(e)
+        }), 500
+
+@app.route('/api/v1/sessions/register/batch', methods=['POST'])
+def register_session_attendance_batch():
+    """
+    Registrar varios pares (dni, session_id) en una sola llamada
+    
+    Input: {
+        "items": [{"dni": string, "session_id": string, "timestamp": string (opcional),
+                   "idempotency_key": string (opcional)}]
+    }
+    Output: {
+        "success": boolean,
+        "message": string,
+        "data": {
+            "results": [{"dni", "session_id", "success", "message", ...}],
+            "total": number,
+            "registered": number
+        }
+    }
+    """
+    try:
+        items, error = _batch_items(request.get_json() or {}, ('dni', 'session_id'))
+        if error:
+            return jsonify({"success": False, "message": error}), 400
+        
+        if _write_behind_ready():
+            # _enqueue_session_attendance reserva y cierra su propio cupo
+            results = [
+                _enqueue_session_attendance(it['dni'], it['session_id'], it.get('timestamp'), it.get('idempotency_key'))
+                for it in items
+            ]
+        else:
+            # Un cupo por ítem, sin esperar: un ítem no debe quedar esperando el
+            # lease de otro del mismo lote. Los rechazados no salen del proceso
+            seats = [_acquire_seat(it['session_id'], wait=0) for it in items]
+            sent = [it for it, (_, rejection) in zip(items, seats) if rejection is None]
+            response = api_client.register_session_attendance_batch(sent) if sent else {"results": []}
+            if 'error' in response:
+                for item, (lease, rejection) in zip(items, seats):
+                    if rejection is None:
+                        seat_ledger.settle(item['session_id'], response, lease)
+                return jsonify({
+                    "success": False,
+                    "message": "Error al registrar en ponencias",
+                    "error": response['error']
+                }), 500
+            upstream = iter(response['results'])
+            results = []
+            for item, (lease, rejection) in zip(items, seats):
+                result = rejection or next(upstream)
+                if rejection is None:
+                    seat_ledger.settle(item['session_id'], result, lease)
+                results.append(result)
+        
+        out = []
+        for item, result in zip(items, results):
+            dni, session_id = item['dni'], item['session_id']
+            if 'error' in result:
+                out.append({
+                    "dni": dni,
+                    "session_id": session_id,
+                    "success": False,
+                    "message": f"Error al registrar en ponencia {session_id}",
+                    "error": result['error']
+                })
+                continue
+            _after_session_registration(dni, session_id, result)
+            out.append({"dni": dni, "session_id": session_id,
+                        **_session_attendance_response(result, session_id)})
+        
+        registered = sum(1 for r in out if r['success'])
+        return jsonify({
+            "success": True,
+            "message": f"{registered} de {len(out)} registros procesados",
+            "data": {"results": out, "total": len(out), "registered": registered}
+        })
     
     except Exception as e:
         return jsonify({
@@ -408,16 +4697,50 @@ def register_session_attendance():
             "error": str(e)
         }), 500
 
+def _export_csv_chunks(page):
+    """
+    Generar el CSV página a página a partir de la primera ya obtenida.
+
+    Solo una página vive en memoria; la siguiente se pide cuando el cliente
+    terminó de recibir la anterior.
+    """
+    yield page['header']
+    while True:
+        if page.get('csv_rows'):
+            yield '\n' + page['csv_rows']
+        next_offset = page.get('next_offset')
+        if next_offset is None:
+            return
+        page = api_client.export_attendees_page(next_offset, EXPORT_PAGE_SIZE)
+        if 'error' in page:
+            # Las cabeceras ya salieron con 200: cortar la conexión para que
+            # la descarga falle en lugar de quedar truncada en silencio
+            raise RuntimeError(f"Exportación interrumpida en la fila {next_offset}: {page['error']}")
+
 @app.route('/api/v1/attendees/export', methods=['GET'])
 def export_attendees():
     """
     Exportar datos de asistentes
     
-    Input: Ninguno
-    Output: Archivo CSV o JSON con los datos
+    Input: ?source=index (opcional, armar el CSV desde el índice local)
+    Output: Archivo CSV (transferido por partes) o JSON con los datos
+    
+    El CSV se envía mientras se pagina Apps Script de a EXPORT_PAGE_SIZE
+    asistentes, así que el primer byte llega con la primera página y la
+    memoria no crece con el tamaño del padrón. Con source=index y el índice
+    cargado no se llama a Apps Script: refleja la hoja de hace a lo sumo
+    ATTENDEE_INDEX_REFRESH_SECONDS más los registros de este worker.
     """
     try:
-        result = api_client.export_attendees_data()
+        if request.args.get('source') == 'index' and attendee_index.ready:
+            capacity = response_cache.peek('capacity') or {}
+            names = {sid: info.get('name') or sid for sid, info in capacity.items()}
+            return Response(attendee_index.export_chunks(names), mimetype='text/csv', headers={
+                "Content-Disposition": f'attachment; filename=asistentes_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+                "X-Accel-Buffering": "no"
+            })
+        
+        result = api_client.export_attendees_page(0, EXPORT_PAGE_SIZE)
         
         if 'error' in result:
             return jsonify({
@@ -426,18 +4749,18 @@ def export_attendees():
                 "error": result['error']
             }), 500
         
-        # Si la respuesta contiene un archivo CSV
+        headers = {
+            "Content-Disposition": f'attachment; filename=asistentes_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+            "X-Accel-Buffering": "no"
+        }
+        
+        # CSV paginado
+        if 'csv_rows' in result:
+            return Response(_export_csv_chunks(result), mimetype='text/csv', headers=headers)
+        
+        # Despliegue de Apps Script sin paginación: CSV completo en una sola respuesta
         if 'csv_data' in result:
-            output = io.StringIO()
-            output.write(result['csv_data'])
-            output.seek(0)
-            
-            return send_file(
-                io.BytesIO(output.getvalue().encode('utf-8')),
-                mimetype='text/csv',
-                as_attachment=True,
-                download_name=f'asistentes_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-            )
+            return Response(result['csv_data'], mimetype='text/csv', headers=headers)
         
         # Si la respuesta es JSON
         return jsonify({
@@ -453,6 +4776,47 @@ def export_attendees():
             "error": str(e)
         }), 500
 
+@app.route('/api/v1/sync/status', methods=['GET'])
+def get_sync_status():
+    """
+    Estado de la sincronización del backend SQLite con Google Sheets
+    
+    Input: Ninguno
+    Output: {
+        "success": boolean,
+        "data": {
+            "enabled": boolean,
+            "push": {"pending": number, "unconfirmed": number, "lag_seconds": number, ...},
+            "pull": {"lag_seconds": number, "rows_behind": number, ...},
+            "conflicts": number,
+            "watermarks": {...},
+            "journal": {"pending": number, "rejected": number, "recent_rejections": [...], ...}
+                       (solo con REGISTRATION_MODE=write_behind)
+        },
+        "message": string
+    }
+    """
+    try:
+        data = {"enabled": sheets_sync is not None}
+        if sheets_sync is not None:
+            data.update(sheets_sync.status())
+        if REGISTRATION_MODE == 'write_behind':
+            data['journal'] = registration_journal.status()
+        
+        return jsonify({
+            "success": True,
+            "data": data,
+            "message": ("Estado de sincronización obtenido exitosamente" if sheets_sync is not None
+                        else "Sincronización con Google Sheets deshabilitada")
+        })
+    
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": "Error interno del servidor",
+            "error": str(e)
+        }), 500
+
 @app.route('/api/v1/debug/scanned-code', methods=['POST'])
 def debug_scanned_code():
     """
@@ -474,40 +4838,28 @@ def debug_scanned_code():
         format_type = data.get('format', 'unknown')
         source = data.get('source', 'unknown')
         
-        # IMPRIMIR EN CONSOLA DEL SERVIDOR
-        print("=" * 60)
-        print("🔍 CÓDIGO ESCANEADO DETECTADO:")
-        print(f"📱 Fuente: {source}")
-        print(f"📋 Código: {code}")
-        print(f"🔖 Formato: {format_type}")
-        print(f"📏 Longitud: {len(code)} caracteres")
+        # Un solo evento DEBUG por escaneo (muestreado con LOG_DEBUG_SAMPLE_RATE)
+        fields = {"source": source, "format": format_type, "length": len(code)}
         
         # Inicializar variable numbers
         numbers = ''
         
-        # Si es detección de boxes solamente
+        # Si es detección de boxes solamente: QuaggaJS detectó formas que
+        # parecen códigos pero no logró decodificarlos
         if code == '[BOXES_DETECTED]':
             boxes_info = data.get('boxes_info', {})
-            print(f"📦 Detección de boxes: {boxes_info.get('count', 0)} boxes encontrados")
-            print("🔍 QuaggaJS detectó formas que parecen códigos pero no logró decodificarlos")
-            
-            # Imprimir información de los boxes
-            if 'boxes' in boxes_info:
-                for i, box in enumerate(boxes_info['boxes'][:3]):  # Solo primeros 3 boxes
-                    print(f"   📦 Box {i+1}: {box}")
+            fields['boxes'] = boxes_info.get('count', 0)
+            fields['first_boxes'] = boxes_info.get('boxes', [])[:3]
         else:
             # Intentar extraer números
             numbers = ''.join(filter(str.isdigit, code))
-            print(f"🔢 Solo números: {numbers} (longitud: {len(numbers)})")
+            fields['digits'] = len(numbers)
             
             # Verificar si podría ser DNI
             if len(numbers) >= 8:
-                possible_dni = numbers[:8]
-                print(f"✅ Posible DNI: {possible_dni}")
-            else:
-                print("❌ No contiene suficientes números para ser DNI")
+                fields['possible_dni'] = numbers[:8]
         
-        print("=" * 60)
+        log.debug("Código escaneado", extra=fields)
         
         return jsonify({
             "success": True,
@@ -521,13 +4873,45 @@ def debug_scanned_code():
         })
         
     except Exception as e:
-        print(f"❌ Error procesando código escaneado: {str(e)}")
+        log.exception("Error procesando código escaneado")
         return jsonify({
             "success": False,
             "message": "Error procesando código",
             "error": str(e)
         }), 500
 
+@app.cli.command('import-sheets')
+@click.option('--attendees', type=click.Path(exists=True), help='CSV de la hoja Attendees')
+@click.option('--sessions', type=click.Path(exists=True), help='CSV de la hoja Sessions')
+@click.option('--general', type=click.Path(exists=True), help='CSV de la hoja GeneralAttendance')
+@click.option('--session-attendance', type=click.Path(exists=True), help='CSV de la hoja SessionAttendance')
+def import_sheets(attendees, sessions, general, session_attendance):
+    """Cargar en el backend SQLite los CSV descargados de cada hoja"""
+    if not isinstance(api_client, SQLiteStorage):
+        raise click.ClickException("import-sheets requiere STORAGE_BACKEND=sqlite")
+    for name, path in (('Attendees', attendees), ('Sessions', sessions),
+                       ('GeneralAttendance', general), ('SessionAttendance', session_attendance)):
+        if not path:
+            continue
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            try:
+                count = api_client.import_sheet(name, list(csv.reader(f)))
+            except ValueError as e:
+                raise click.ClickException(str(e))
+        click.echo(f"{name}: {count} filas importadas en {api_client.path}")
+
+@app.cli.command('sync-sheets')
+@click.option('--full', is_flag=True, help='Releer Attendees y Sessions completas')
+def sync_sheets(full):
+    """Ejecutar un ciclo de sincronización del backend SQLite con Google Sheets"""
+    if not isinstance(api_client, SQLiteStorage):
+        raise click.ClickException("sync-sheets requiere STORAGE_BACKEND=sqlite")
+    sync = sheets_sync or SheetsSync(api_client, AppScriptAPI(APPSCRIPT_BASE_URL))
+    ok = sync.sync_once(full=full)
+    click.echo(json.dumps(sync.status(), indent=2, ensure_ascii=False))
+    if not ok:
+        raise click.ClickException("La sincronización terminó con errores")
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -0,0 +1,576 @@
+"""
+Modo de servicio asíncrono (ASGI)
+=================================
+Las rutas que pasan casi todo su tiempo esperando a Apps Script (búsqueda,
+registro general, registro en ponencia, check-in, ponencias, capacidad y
+el canal SSE) se atienden con handlers async que esperan a un cliente
+aiohttp, así que un solo proceso mantiene cientos de llamadas upstream en
+vuelo sin un hilo por petición. El resto de la aplicación Flask (páginas,
+exportación, lotes, debug) se sirve sin cambios en un pool de hilos vía
+a2wsgi.
+
+Comparte con app.py el índice de asistentes, la caché, el journal y el
+broadcaster de capacidad, y reutiliza sus helpers de respuesta, por lo que
+ambos modos devuelven exactamente los mismos JSON.
+
+Uso:
+    uv run uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 1   # modo async
+    uv run gunicorn --workers 1 --threads 2 app:app                  # modo sync
+"""
+
+import asyncio
+import json
+import os
+import gzip
+import re
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import aiohttp
+from a2wsgi import WSGIMiddleware
+from werkzeug.http import parse_etags
+
+import app as core
+
+# Modo async: conexiones simultáneas a Apps Script e hilos para las rutas WSGI
+APPSCRIPT_ASYNC_MAX_CONNECTIONS = int(os.getenv('APPSCRIPT_ASYNC_MAX_CONNECTIONS', '200'))
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '10'))
+
+
+class AsyncAppScriptAPI:
+    """Versión async de AppScriptAPI para las rutas servidas por el event loop"""
+
+    def __init__(self, base_url, max_connections=APPSCRIPT_ASYNC_MAX_CONNECTIONS,
+                 max_retries=core.APPSCRIPT_MAX_RETRIES,
+                 backoff_factor=core.APPSCRIPT_BACKOFF_FACTOR,
+                 connect_timeout=core.APPSCRIPT_CONNECT_TIMEOUT,
+                 read_timeout=core.APPSCRIPT_READ_TIMEOUT):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._session = None
+
+    @property
+    def session(self):
+        """
+        Sesión HTTP compartida con conexiones keep-alive.
+
+        Se crea perezosamente porque aiohttp la liga al event loop en curso.
+        Las redirecciones (Apps Script responde a /exec con un 302 hacia
+        googleusercontent.com) se siguen por defecto.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=self.timeout
+            )
+        return self._session
+
+    async def _request(self, method, **kwargs):
+        """
+        Igual que el cliente síncrono (ver core._UpstreamSession): timeout por
+        acción, cortocircuito, respaldo para lecturas lentas y métricas.
+        """
+        if 'json' in kwargs:
+            action = kwargs['json']['action']
+            kwargs['json'] = {**kwargs['json'], "timing": True}
+        else:
+            action = kwargs['params']['action']
+            kwargs['params'] = {**kwargs['params'], "timing": '1'}
+        if action in core.APPSCRIPT_ACTION_TIMEOUTS:
+            kwargs['timeout'] = aiohttp.ClientTimeout(sock_connect=self.timeout.sock_connect,
+                                                      sock_read=core.APPSCRIPT_ACTION_TIMEOUTS[action])
+        try:
+            core.circuit_breaker.allow(action)
+        except core.CircuitOpenError as e:
+            core.metrics.inc('asistencia_upstream_errors_total', action=action, reason='circuit_open')
+            return {"error": str(e)}
+
+        ok = False
+        try:
+            with core._track_upstream(action):
+                if core.APPSCRIPT_HEDGE_AFTER > 0 and method == 'GET' and action in core.APPSCRIPT_HEDGE_ACTIONS:
+                    status, text = await self._hedged(action, method, kwargs)
+                else:
+                    status, text = await self._send(method, kwargs)
+            ok = not core._upstream_failed(status)
+            if status != 200:
+                core.metrics.inc('asistencia_upstream_errors_total', action=action, reason=f'http_{status}')
+                return {"error": f"HTTP {status}: {text}"}
+            return core._unwrap_timing(action, json.loads(text))
+        except Exception as e:
+            return {"error": str(e) or type(e).__name__}
+        finally:
+            core.circuit_breaker.record(action, ok)
+
+    async def _send(self, method, kwargs):
+        """
+        Solo se reintenta cuando no se pudo conectar (la petición no llegó a
+        enviarse), para no duplicar registros. Retorna (status, texto).
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.session.request(method, self.base_url, **kwargs) as response:
+                    return response.status, await response.text()
+            except aiohttp.ClientConnectorError:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def _hedged(self, action, method, kwargs):
+        """Primera respuesta válida entre la original y una de respaldo; la otra se cancela"""
+        pending = {asyncio.ensure_future(self._send(method, kwargs))}
+        done, _ = await asyncio.wait(pending, timeout=core.APPSCRIPT_HEDGE_AFTER)
+        if not done:
+            core.metrics.inc('asistencia_upstream_hedges_total', action=action)
+            pending.add(asyncio.ensure_future(self._send(method, kwargs)))
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            good = [t for t in done if t.exception() is None and not core._upstream_failed(t.result()[0])]
+            if good or not pending:
+                for task in pending:
+                    task.cancel()
+                return (good or list(done))[0].result()
+
+    async def get_attendee_by_dni(self, dni):
+        """Buscar asistente por DNI"""
+        return await self._request('GET', params={"action": "getAttendeeByDNI", "dni": dni})
+
+    async def get_sessions_list(self):
+        """Obtener lista de ponencias disponibles"""
+        return await self._request('GET', params={"action": "getSessionsList"})
+
+    async def get_sessions_capacity(self):
+        """Obtener capacidad de todas las ponencias"""
+        return await self._request('GET', params={"action": "getSessionsCapacity"})
+
+    async def register_general_attendance(self, dni, timestamp=None, idempotency_key=None):
+        """Registrar asistencia general"""
+        return await self._request('POST', json={
+            "action": "registerGeneralAttendance",
+            "dni": dni,
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "idempotency_key": idempotency_key
+        })
+
+    async def register_session_attendance(self, dni, session_id, timestamp=None, idempotency_key=None):
+        """Registrar asistencia a ponencia"""
+        return await self._request('POST', json={
+            "action": "registerSessionAttendance",
+            "dni": dni,
+            "session_id": session_id,
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "idempotency_key": idempotency_key
+        })
+
+    async def checkin(self, dni, session_id=None, timestamp=None, idempotency_key=None):
+        """Búsqueda, asistencia general y registro opcional en ponencia en una sola ejecución"""
+        return await self._request('POST', json={
+            "action": "checkin",
+            "dni": dni,
+            "session_id": session_id,
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "idempotency_key": idempotency_key
+        })
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class ThreadedStorage:
+    """
+    Adaptador async para backends locales (STORAGE_BACKEND=sqlite): cada
+    operación corre en el pool de hilos para no bloquear el event loop.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getattr__(self, name):
+        method = getattr(self.storage, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return call
+
+    async def aclose(self):
+        pass
+
+
+class _AsyncSubscriber:
+    """
+    Suscriptor de CapacityBroadcaster para el event loop.
+
+    publish() se llama desde cualquier hilo; los eventos se pasan al loop con
+    call_soon_threadsafe. Si la cola se llena se vacía y se deja un aviso de
+    'resync', con la misma semántica que las colas de los clientes WSGI.
+    """
+
+    def __init__(self, loop, maxsize=core.CAPACITY_STREAM_QUEUE_SIZE):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def put_nowait(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"resync": True})
+
+
+def _internal_error(e):
+    return 500, {
+        "success": False,
+        "message": "Error interno del servidor",
+        "error": str(e)
+    }
+
+
+class AsyncGateway:
+    """Aplicación ASGI: rutas async propias y el resto delegado a Flask"""
+
+    def __init__(self, flask_app, api):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)
+        self.api = api
+        self.routes = [
+            ('GET', re.compile(r'^/api/v1/attendees/search/(?P<dni>[^/]+)$'), self.search_attendee),
+            ('POST', re.compile(r'^/api/v1/attendees/general$'), self.register_general_attendance),
+            ('GET', re.compile(r'^/api/v1/sessions$'), self.get_sessions_list),
+            ('GET', re.compile(r'^/api/v1/sessions/capacity$'), self.get_sessions_capacity),
+            ('POST', re.compile(r'^/api/v1/sessions/register$'), self.register_session_attendance),
+            ('POST', re.compile(r'^/api/v1/checkin$'), self.checkin_attendee),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http':
+            if scope['method'] == 'GET' and scope['path'] == '/api/v1/sessions/capacity/stream':
+                return await self.stream_sessions_capacity(scope, receive, send)
+            for method, pattern, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match and scope['method'] == method:
+                    with core.metrics.track('asistencia_http', endpoint=handler.__name__):
+                        try:
+                            status, payload, *headers = await handler(scope, receive, **match.groupdict())
+                        except Exception as e:
+                            status, payload = _internal_error(e)
+                            headers = []
+                        core.metrics.inc('asistencia_http_requests_total', endpoint=handler.__name__,
+                                         method=method, status=str(status))
+                        return await self._send_json(scope, send, status, payload, *headers)
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if core.ATTENDEE_INDEX_ENABLED:
+                    core.attendee_index.ensure_started()
+                if core.sheets_sync is not None:
+                    core.sheets_sync.ensure_started()
+                if core.shared_snapshots is not None:
+                    core.shared_snapshots.ensure_started()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.api.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    def _cors_headers(scope):
+        # Mismas cabeceras que añade flask_cors con su configuración por defecto
+        origin = dict(scope['headers']).get(b'origin')
+        if origin:
+            return [(b'access-control-allow-origin', origin), (b'vary', b'Origin')]
+        return [(b'access-control-allow-origin', b'*')]
+
+    async def _send_json(self, scope, send, status, payload, headers=()):
+        # Mismo formato que jsonify() fuera de modo debug, y el mismo gzip que core._compress_json
+        headers = list(headers) + self._cors_headers(scope)
+        body = b''
+        if payload is not None:
+            body = (self.flask_app.json.dumps(payload, separators=(",", ":")) + "\n").encode('utf-8')
+            headers.append((b'content-type', b'application/json'))
+            if core.GZIP_MIN_BYTES and len(body) >= core.GZIP_MIN_BYTES:
+                headers.append((b'vary', b'Accept-Encoding'))
+                if core._accepts_gzip(self._header(scope, b'accept-encoding')):
+                    body = gzip.compress(body, core.GZIP_LEVEL)
+                    headers.append((b'content-encoding', b'gzip'))
+            headers.append((b'content-length', str(len(body)).encode()))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def _header(scope, name):
+        return dict(scope['headers']).get(name, b'').decode('latin-1')
+
+    def _versioned(self, scope, feed, result, message):
+        """Igual que core._conditional_json: ETag débil de la versión, 304 y ?since="""
+        since = parse_qs(scope['query_string'].decode('latin-1')).get('since', [None])[0]
+        payload, token = core._versioned_response(feed, result, since, message)
+        headers = [(b'etag', f'W/"{token}"'.encode()), (b'cache-control', b'no-cache')]
+        if parse_etags(self._header(scope, b'if-none-match')).contains_weak(token):
+            return 304, None, headers
+        return 200, payload, headers
+
+    @staticmethod
+    async def _read_json(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return json.loads(b''.join(chunks))
+
+    async def search_attendee(self, scope, receive, dni):
+        """Buscar asistente por DNI (ver app.search_attendee)"""
+        result = None
+        if core.ATTENDEE_INDEX_ENABLED:
+            core.attendee_index.ensure_started()
+            result = core.attendee_index.lookup(dni)
+        if result is None:
+            result = await self.api.get_attendee_by_dni(dni)
+
+        if 'error' in result:
+            return 500, {
+                "success": False,
+                "message": "Error al buscar asistente",
+                "error": result['error']
+            }
+
+        return 200, {
+            "success": True,
+            "data": result,
+            "message": "Asistente encontrado" if result else "Asistente no encontrado"
+        }
+
+    @staticmethod
+    async def _write_behind_ready():
+        """core._write_behind_ready sin pasar por el pool de hilos una vez arrancados los hilos"""
+        if core.REGISTRATION_MODE != 'write_behind':
+            return False
+        if core.attendee_index._thread is None or core.registration_journal._thread is None:
+            # Solo el primer registro arranca el índice y el journal
+            return await asyncio.to_thread(core._write_behind_ready)
+        return core.attendee_index.ready
+
+    async def register_general_attendance(self, scope, receive):
+        """Registrar asistencia general (ver app.register_general_attendance)"""
+        data = await self._read_json(receive)
+        dni = data.get('dni')
+
+        if not dni:
+            return 400, {
+                "success": False,
+                "message": "DNI es requerido"
+            }
+
+        async def register():
+            if await self._write_behind_ready():
+                result = await asyncio.to_thread(core._enqueue_general_attendance, dni,
+                                                 idempotency_key=data.get('idempotency_key'))
+            else:
+                result = await self.api.register_general_attendance(dni, idempotency_key=data.get('idempotency_key'))
+            if 'error' not in result:
+                await asyncio.to_thread(core._after_general_registration, dni, result)
+            return result
+
+        result = await core.scan_dedup.arun(('general', dni, None, data.get('idempotency_key')), register)
+
+        if 'error' in result:
+            return 500, {
+                "success": False,
+                "message": "Error al registrar asistencia",
+                "error": result['error']
+            }
+
+        return 200, {
+            "success": True,
+            "message": core._general_attendance_message(result),
+            "data": result,
+            "kit_entregado": result.get('kit_entregado', False),
+            "already_registered_today": core._already_registered_today(result)
+        }
+
+    @staticmethod
+    async def _cached(key, loader, ttl):
+        """core.response_cache.aget con la caché compartida entre workers delante (ver app._cached)"""
+        if core.shared_snapshots is not None:
+            core.shared_snapshots.install(key)
+            loader = core.shared_snapshots.aloader(key, loader, ttl)
+        return await core.response_cache.aget(key, loader, ttl)
+
+    async def get_sessions_list(self, scope, receive):
+        """Obtener lista de ponencias (ver app.get_sessions_list)"""
+        result = await self._cached('sessions', self.api.get_sessions_list, core.SESSIONS_CACHE_TTL)
+
+        if 'error' in result:
+            return 500, {
+                "success": False,
+                "message": "Error al obtener lista de ponencias",
+                "error": result['error']
+            }
+
+        return self._versioned(scope, core.sessions_feed, result, "Lista de ponencias obtenida exitosamente")
+
+    async def get_sessions_capacity(self, scope, receive):
+        """Obtener capacidad de ponencias (ver app.get_sessions_capacity)"""
+        result = await self._cached('capacity', self.api.get_sessions_capacity, core.CAPACITY_CACHE_TTL)
+
+        if 'error' in result:
+            return 500, {
+                "success": False,
+                "message": "Error al obtener capacidad de ponencias",
+                "error": result['error']
+            }
+
+        return self._versioned(scope, core.capacity_broadcaster, result,
+                               "Capacidad de ponencias obtenida exitosamente")
+
+    async def _acquire_seat(self, session_id):
+        """Reservar un cupo en core.seat_ledger (ver app._acquire_seat)"""
+        if not core.CAPACITY_LEASES_ENABLED:
+            return None, None
+        await self._cached('capacity', self.api.get_sessions_capacity, core.CAPACITY_CACHE_TTL)
+        # La espera a que se liberen cupos no ocupa un hilo del executor
+        return await core.seat_ledger.aacquire(session_id)
+
+    async def register_session_attendance(self, scope, receive):
+        """Registrar asistencia a ponencia (ver app.register_session_attendance)"""
+        data = await self._read_json(receive)
+        dni = data.get('dni')
+        session_id = data.get('session_id')
+
+        if not dni or not session_id:
+            return 400, {
+                "success": False,
+                "message": "DNI y session_id son requeridos"
+            }
+
+        async def register():
+            if await self._write_behind_ready():
+                result = await asyncio.to_thread(core._enqueue_session_attendance, dni, session_id,
+                                                 idempotency_key=data.get('idempotency_key'))
+            else:
+                lease, result = await self._acquire_seat(session_id)
+                if result is None:
+                    result = await self.api.register_session_attendance(dni, session_id,
+                                                                        idempotency_key=data.get('idempotency_key'))
+                    core.seat_ledger.settle(session_id, result, lease)
+            if 'error' not in result:
+                await asyncio.to_thread(core._after_session_registration, dni, session_id, result)
+            return result
+
+        result = await core.scan_dedup.arun(('session', dni, session_id, data.get('idempotency_key')), register)
+
+        if 'error' in result:
+            return 500, {
+                "success": False,
+                "message": f"Error al registrar en ponencia {session_id}",
+                "error": result['error']
+            }
+
+        return 200, core._session_attendance_response(result, session_id)
+
+    async def checkin_attendee(self, scope, receive):
+        """Check-in en la puerta (ver app.checkin_attendee)"""
+        data = await self._read_json(receive)
+        dni = data.get('dni')
+        session_id = data.get('session_id')
+
+        if not dni:
+            return 400, {
+                "success": False,
+                "message": "DNI es requerido"
+            }
+
+        async def checkin():
+            if await self._write_behind_ready():
+                result = await asyncio.to_thread(core._enqueue_checkin, dni, session_id, data.get('idempotency_key'))
+            else:
+                lease, rejection = await self._acquire_seat(session_id) if session_id else (None, None)
+                result = await self.api.checkin(dni, None if rejection else session_id,
+                                                idempotency_key=data.get('idempotency_key'))
+                core._settle_checkin_seat(session_id, result, lease, rejection)
+            await asyncio.to_thread(core._after_checkin, dni, session_id, result)
+            return result
+
+        result = await core.scan_dedup.arun(('checkin', dni, session_id, data.get('idempotency_key')), checkin)
+        payload, status = core._checkin_response(result, session_id)
+        return status, payload
+
+    async def stream_sessions_capacity(self, scope, receive, send):
+        """
+        Canal SSE de capacidad (ver app.stream_sessions_capacity).
+
+        Cada cliente es una corrutina esperando su cola asyncio, no un hilo.
+        """
+        async def refresh_capacity():
+            await self._cached('capacity', self.api.get_sessions_capacity, core.CAPACITY_CACHE_TTL)
+
+        async def wait_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        async def emit(chunk):
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+
+        subscriber = _AsyncSubscriber(asyncio.get_running_loop())
+        core.capacity_broadcaster.subscribe(subscriber)
+        disconnected = asyncio.ensure_future(wait_disconnect())
+        try:
+            await refresh_capacity()
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ] + self._cors_headers(scope)
+            })
+            await emit("retry: 5000\n\n")
+            sent_version, capacity = core.capacity_broadcaster.snapshot()
+            await emit(core._sse_event('snapshot', sent_version, {"version": sent_version, "data": capacity}))
+            while not disconnected.done():
+                getter = asyncio.ensure_future(subscriber.queue.get())
+                done, _ = await asyncio.wait({getter, disconnected},
+                                             timeout=core.CAPACITY_STREAM_HEARTBEAT,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    if not disconnected.done():
+                        await refresh_capacity()
+                        await emit(": keepalive\n\n")
+                    continue
+                event = getter.result()
+                if event.get('resync'):
+                    sent_version, capacity = core.capacity_broadcaster.snapshot()
+                    await emit(core._sse_event('snapshot', sent_version, {"version": sent_version, "data": capacity}))
+                elif event['version'] > sent_version:
+                    sent_version = event['version']
+                    await emit(core._sse_event('delta', sent_version, event))
+        finally:
+            core.capacity_broadcaster.unsubscribe(subscriber)
+            disconnected.cancel()
+
+
+if isinstance(core.api_client, core.AppScriptAPI):
+    api_client = AsyncAppScriptAPI(core.APPSCRIPT_BASE_URL)
+else:
+    api_client = ThreadedStorage(core.api_client)
+app = AsyncGateway(core.app, api_client)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Prueba de carga: modo sync (gunicorn) vs modo async (uvicorn + asgi.py)
+=======================================================================
+Levanta el stub de Apps Script con una latencia fija por petición y, para
+cada modo, arranca el servidor en un subproceso y lanza N peticiones con
+C clientes concurrentes. Reporta rendimiento (req/s) y latencia.
+
+Modos:
+  - sync:   gunicorn --workers 1 --threads 2 app:app   (configuración original)
+  - gevent: gunicorn --worker-class gevent app:app      (Dockerfile, SERVER_MODE=sync)
+  - async:  uvicorn asgi:app                            (SERVER_MODE=async)
+
+Uso:
+    python bench_async.py --concurrency 200 --requests 1000 --latency-ms 500
+    python bench_async.py --modes sync,async --scenario search
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import requests
+
+from stub_appscript import start_stub
+
+MODES = {
+    'sync': ['gunicorn', '--workers', '1', '--threads', '2', 'app:app'],
+    'gevent': ['gunicorn', '--workers', '1', '--worker-class', 'gevent',
+               '--worker-connections', '1000', 'app:app'],
+    'async': ['uvicorn', 'asgi:app', '--workers', '1', '--log-level', 'warning'],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, base_url, journal_dir, extra_env=None, workers=1):
+    port = free_port()
+    command = [sys.executable, '-m'] + [str(workers) if previous == '--workers' else arg
+                                        for previous, arg in zip([None] + MODES[mode], MODES[mode])]
+    if mode == 'async':
+        command += ['--host', '127.0.0.1', '--port', str(port)]
+    else:
+        command += ['--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+    env = dict(os.environ,
+               APPSCRIPT_BASE_URL=base_url,
+               ATTENDEE_INDEX_ENABLED='0',
+               REGISTRATION_MODE='sync',
+               JOURNAL_PATH=os.path.join(journal_dir, f'{mode}.db'))
+    # extra_env puede sobrescribir los valores anteriores
+    env.update(extra_env or {})
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if requests.get(f"{url}/api/v1/sessions", timeout=2).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"El servidor en modo {mode} no arrancó")
+
+
+def make_request(scenario, i):
+    dni = str(20000000 + i)
+    if scenario == 'search':
+        return 'GET', f'/api/v1/attendees/search/{dni}', None
+    return 'POST', '/api/v1/sessions/register', {"dni": dni, "session_id": "sesion_1"}
+
+
+async def run_load(url, scenario, total, concurrency):
+    samples = []
+    errors = 0
+    counter = iter(range(total))
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+
+    async with aiohttp.ClientSession(url, connector=connector, timeout=timeout) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                method, path, body = make_request(scenario, i)
+                t0 = time.perf_counter()
+                try:
+                    async with client.request(method, path, json=body) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                samples.append((time.perf_counter() - t0) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    samples.sort()
+    return {
+        "throughput": total / elapsed,
+        "p50": samples[len(samples) // 2],
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "max": samples[-1],
+        "mean": statistics.mean(samples),
+        "errors": errors,
+    }
+
+
+def print_row(mode, stats):
+    print(f"   {mode:<8} {stats['throughput']:8.1f} req/s  "
+          f"p50={stats['p50']:.0f} ms  p95={stats['p95']:.0f} ms  "
+          f"max={stats['max']:.0f} ms  errores={stats['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga sync vs async')
+    parser.add_argument('--modes', default='sync,gevent,async',
+                        help='Modos a comparar, separados por comas')
+    parser.add_argument('--scenario', choices=['register', 'search'], default='register')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=500,
+                        help='Latencia simulada de Apps Script por petición')
+    args = parser.parse_args()
+
+    stub, base_url = start_stub(latency_ms=args.latency_ms)
+    print(f"\n📊 {args.requests} peticiones '{args.scenario}', {args.concurrency} concurrentes, "
+          f"latencia upstream {args.latency_ms:.0f} ms")
+
+    with tempfile.TemporaryDirectory() as journal_dir:
+        for mode in args.modes.split(','):
+            process, url = start_server(mode, base_url, journal_dir)
+            try:
+                print_row(mode, asyncio.run(run_load(url, args.scenario, args.requests, args.concurrency)))
+            finally:
+                process.terminate()
+                process.wait()
+    print()
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
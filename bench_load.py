@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+"""
+Suite de carga reproducible contra el stub local de Apps Script
+===============================================================
+Levanta el stub (stub_appscript.py) con latencia, variación y fallos
+configurables, arranca la app en un subproceso y ejecuta, en orden y sobre
+el mismo estado, los escenarios de un evento real:
+
+  - door_rush:     apertura de puertas, cada kiosko busca un DNI y hace check-in
+  - session_start: estampida al abrir una ponencia con cupos limitados
+  - dashboard:     pantallas y organizadores consultando capacidad y ponencias
+
+Por cada endpoint de /api/v1 reporta rendimiento, p50/p95/p99, errores
+(5xx o sin respuesta) y rechazos (200 con "success": false). Con --output
+guarda el resultado en JSON; con --baseline lo compara con una corrida
+anterior y termina con código 1 si algún endpoint empeoró más de --tolerance.
+Las llamadas que recibió el stub por acción se cuentan del lado del stub,
+así que con --workers N suman las de todos los workers.
+
+Uso:
+    python bench_load.py --output resultados.json
+    python bench_load.py --scenarios session_start --capacity 100 --latency-ms 800
+    python bench_load.py --baseline resultados.json --tolerance 0.2
+    python bench_load.py --env REGISTRATION_MODE=write_behind --env ATTENDEE_INDEX_ENABLED=1
+    python bench_load.py --scenarios dashboard --workers 4 --env SHARED_CACHE_DIR=/tmp/asistencia-cache
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import aiohttp
+
+from bench_async import MODES, start_server
+from stub_appscript import start_stub
+
+SEARCH = 'GET /api/v1/attendees/search/<dni>'
+CHECKIN = 'POST /api/v1/checkin'
+REGISTER = 'POST /api/v1/sessions/register'
+SESSIONS = 'GET /api/v1/sessions'
+CAPACITY = 'GET /api/v1/sessions/capacity'
+CONFLICTS = 'GET /api/v1/sessions/conflicts'
+
+
+def door_rush(i):
+    dni = str(30000000 + i)
+    return [(SEARCH, f'/api/v1/attendees/search/{dni}', None),
+            (CHECKIN, '/api/v1/checkin', {"dni": dni})]
+
+
+def session_start(i):
+    dni = str(30000000 + i)
+    return [(CAPACITY, '/api/v1/sessions/capacity', None),
+            (REGISTER, '/api/v1/sessions/register', {"dni": dni, "session_id": "sesion_1"})]
+
+
+def dashboard(i):
+    return [(CAPACITY, '/api/v1/sessions/capacity', None),
+            (SESSIONS, '/api/v1/sessions', None),
+            (CONFLICTS, '/api/v1/sessions/conflicts', None)]
+
+
+# Escenario -> (pasos de una iteración, iteraciones, clientes concurrentes)
+SCENARIOS = {
+    'door_rush': (door_rush, 1000, 100),
+    'session_start': (session_start, 500, 200),
+    'dashboard': (dashboard, 300, 20),
+}
+
+
+def percentile(samples, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    return samples[max(0, math.ceil(p * len(samples)) - 1)]
+
+
+def summarize(samples, elapsed):
+    summary = {}
+    for endpoint, records in sorted(samples.items()):
+        latencies = sorted(ms for ms, _, _ in records)
+        statuses = {}
+        for _, status, _ in records:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary[endpoint] = {
+            "count": len(records),
+            "throughput": round(len(records) / elapsed, 1),
+            "mean_ms": round(statistics.mean(latencies), 1),
+            "p50_ms": round(percentile(latencies, 0.50), 1),
+            "p95_ms": round(percentile(latencies, 0.95), 1),
+            "p99_ms": round(percentile(latencies, 0.99), 1),
+            "max_ms": round(latencies[-1], 1),
+            "errors": sum(1 for _, status, _ in records if status is None or status >= 500),
+            "rejected": sum(1 for _, _, rejected in records if rejected),
+            "statuses": statuses,
+        }
+    return summary
+
+
+async def run_scenario(url, steps, iterations, concurrency):
+    samples = {}
+    counter = iter(range(iterations))
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+
+    async with aiohttp.ClientSession(url, connector=connector, timeout=timeout) as client:
+        async def worker():
+            for i in counter:
+                for endpoint, path, body in steps(i):
+                    method = endpoint.split(' ', 1)[0]
+                    status, rejected = None, False
+                    t0 = time.perf_counter()
+                    try:
+                        async with client.request(method, path, json=body) as response:
+                            payload = await response.read()
+                            status = response.status
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        pass
+                    elapsed_ms = (time.perf_counter() - t0) * 1000
+                    if status == 200:
+                        try:
+                            rejected = json.loads(payload).get('success') is False
+                        except ValueError:
+                            pass
+                    samples.setdefault(endpoint, []).append((elapsed_ms, status, rejected))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"iterations": iterations, "concurrency": concurrency,
+            "elapsed_s": round(elapsed, 2), "endpoints": summarize(samples, elapsed)}
+
+
+UPSTREAM_LINE = re.compile(
+    r'^asistencia_upstream_(duration|script)_seconds_(sum|count)\{action="([^"]+)"\} (\S+)$')
+
+
+async def scrape_upstream(url):
+    """Sumas y conteos de /metrics por acción: {(acción, 'duration'|'script', 'sum'|'count'): valor}"""
+    try:
+        async with aiohttp.ClientSession() as client:
+            async with client.get(f"{url}/metrics") as response:
+                text = await response.text()
+    except aiohttp.ClientError:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        match = UPSTREAM_LINE.match(line)
+        if match:
+            kind, field, action, value = match.groups()
+            values[(action, kind, field)] = float(value)
+    return values
+
+
+def upstream_delta(before, after):
+    """Media de ida y vuelta y de ejecución del script por acción durante el escenario"""
+    out = {}
+    for action in sorted({key[0] for key in after}):
+        def delta(kind, field):
+            return after.get((action, kind, field), 0) - before.get((action, kind, field), 0)
+        calls = delta('duration', 'count')
+        if not calls:
+            continue
+        scripted = delta('script', 'count')
+        out[action] = {
+            "calls": int(calls),
+            "round_trip_ms": round(delta('duration', 'sum') / calls * 1000, 1),
+            "script_ms": round(delta('script', 'sum') / scripted * 1000, 1) if scripted else None,
+        }
+    return out
+
+
+def compare(results, baseline, tolerance):
+    """Endpoints cuyo p95 subió o cuyo rendimiento bajó más de `tolerance` respecto a la base"""
+    regressions = []
+    for name, scenario in results['scenarios'].items():
+        base_scenario = baseline.get('scenarios', {}).get(name)
+        if not base_scenario:
+            continue
+        for endpoint, stats in scenario['endpoints'].items():
+            base = base_scenario['endpoints'].get(endpoint)
+            if not base:
+                continue
+            if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{name} {endpoint}: p95 {base['p95_ms']} -> {stats['p95_ms']} ms")
+            if stats['throughput'] < base['throughput'] * (1 - tolerance):
+                regressions.append(f"{name} {endpoint}: {base['throughput']} -> {stats['throughput']} req/s")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_scenario(name, scenario):
+    print(f"\n📊 {name}: {scenario['iterations']} iteraciones, {scenario['concurrency']} concurrentes, "
+          f"{scenario['elapsed_s']} s")
+    for endpoint, stats in scenario['endpoints'].items():
+        print(f"   {endpoint:<38} {stats['throughput']:7.1f} req/s  p50={stats['p50_ms']:.0f}  "
+              f"p95={stats['p95_ms']:.0f}  p99={stats['p99_ms']:.0f} ms  "
+              f"errores={stats['errors']}  rechazos={stats['rejected']}")
+    for action, stats in scenario['upstream'].items():
+        script = f"{stats['script_ms']:.0f} ms" if stats['script_ms'] is not None else '-'
+        print(f"   ↳ {action:<36} {stats['calls']:6d} llamadas  ida y vuelta={stats['round_trip_ms']:.0f} ms  "
+              f"script={script}")
+    calls = ', '.join(f"{action}={count}" for action, count in scenario['stub_calls'].items())
+    print(f"   ⇢ recibidas por el stub: {calls or 'ninguna'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Suite de carga con stub de Apps Script')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='Escenarios a ejecutar, en orden y separados por comas')
+    parser.add_argument('--mode', choices=list(MODES), default='gevent')
+    parser.add_argument('--workers', type=int, default=1, help='Workers de gunicorn o uvicorn')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiplicador de las iteraciones de cada escenario')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='Clientes concurrentes (por defecto, el de cada escenario)')
+    parser.add_argument('--latency-ms', type=float, default=500,
+                        help='Latencia simulada de Apps Script por petición')
+    parser.add_argument('--jitter-ms', type=float, default=150)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--slow-rate', type=float, default=0)
+    parser.add_argument('--slow-ms', type=float, default=3000)
+    parser.add_argument('--capacity', type=int, default=100, help='Cupos por ponencia en el stub')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--env', action='append', default=[], metavar='CLAVE=VALOR',
+                        help='Variable de entorno extra para la app (repetible)')
+    parser.add_argument('--output', help='Archivo JSON donde guardar los resultados')
+    parser.add_argument('--baseline', help='Resultados JSON anteriores con los que comparar')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    stub_options = {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                    "error_rate": args.error_rate, "slow_rate": args.slow_rate,
+                    "slow_ms": args.slow_ms, "capacity": args.capacity, "seed": args.seed}
+    extra_env = dict(item.split('=', 1) for item in args.env)
+    stub, base_url = start_stub(**stub_options)
+
+    results = {
+        "meta": {"started_at": datetime.now().isoformat(timespec='seconds'), "commit": git_commit(),
+                 "python": platform.python_version(), "mode": args.mode, "workers": args.workers,
+                 "stub": stub_options,
+                 "env": extra_env},
+        "scenarios": {},
+    }
+
+    with tempfile.TemporaryDirectory() as journal_dir:
+        process, url = start_server(args.mode, base_url, journal_dir, extra_env, args.workers)
+        try:
+            for name in args.scenarios.split(','):
+                steps, iterations, concurrency = SCENARIOS[name]
+                before = asyncio.run(scrape_upstream(url))
+                stub_before = dict(stub.state.calls)
+                scenario = asyncio.run(run_scenario(url, steps, max(1, int(iterations * args.scale)),
+                                                    args.concurrency or concurrency))
+                scenario['upstream'] = upstream_delta(before, asyncio.run(scrape_upstream(url)))
+                scenario['stub_calls'] = {action: count - stub_before.get(action, 0)
+                                          for action, count in sorted(stub.state.calls.items())
+                                          if count > stub_before.get(action, 0)}
+                results['scenarios'][name] = scenario
+                print_scenario(name, scenario)
+        finally:
+            process.terminate()
+            process.wait()
+    stub.shutdown()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados guardados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n❌ Regresiones respecto a {args.baseline} (tolerancia {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones respecto a {args.baseline}")
+    print()
+
+
+if __name__ == '__main__':
+    main()
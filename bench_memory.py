@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Memoria del estado de asistencia por worker según el tamaño del padrón
+======================================================================
+Arma con datos sintéticos el mismo padrón en tres formas y mide con
+tracemalloc lo que ocupa cada una, cuánto tarda en cargarse y en buscar
+un DNI:
+
+  - objetos:   un dict por DNI como el que devuelve getAttendeeByDNI
+  - dict+sets: la forma anterior de AttendeeIndex (nombres en un dict,
+               asistencia general en un set y un set de ponencias por DNI)
+  - compacto:  AttendanceStore (índice ordenado de arrays y bitsets)
+
+Uso:
+    python bench_memory.py
+    python bench_memory.py --sizes 10000,100000,1000000 --sessions 40 --output memoria.json
+    python bench_memory.py --layouts dict+sets,compacto --sizes 1000000
+"""
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from app import AttendanceStore
+
+
+def synthetic_roster(size, sessions, seed):
+    """(ids de ponencias, filas de asistentes, DNIs con asistencia general, pares DNI/ponencia)"""
+    rng = random.Random(seed)
+    session_ids = [f"sesion_{i + 1}" for i in range(sessions)]
+    dnis = [f"{n:08d}" for n in rng.sample(range(10_000_000, 99_999_999), size)]
+    attendees = [[dni, f"Nombre{i} Apellido{i} Apellido{i % 97}"] for i, dni in enumerate(dnis)]
+    general = [dni for dni in dnis if rng.random() < 0.7]
+    session_attendance = [[dni, session_id] for dni in dnis
+                          for session_id in rng.sample(session_ids, min(3, sessions))]
+    return session_ids, attendees, general, session_attendance
+
+
+def build_objects(session_ids, attendees, general, session_attendance):
+    general = set(general)
+    by_dni = {}
+    for dni, session_id in session_attendance:
+        by_dni.setdefault(dni, set()).add(session_id)
+    state = {}
+    for dni, nombre in attendees:
+        attended = by_dni.get(dni, ())
+        state[dni] = {"dni": dni, "nombre": nombre, "asistencia_general": dni in general,
+                      **{session_id: session_id in attended for session_id in session_ids}}
+    return state
+
+
+def build_dict_sets(session_ids, attendees, general, session_attendance):
+    sessions_by_dni = {}
+    for dni, session_id in session_attendance:
+        sessions_by_dni.setdefault(dni, set()).add(session_id)
+    return {dni: nombre for dni, nombre in attendees}, set(general), sessions_by_dni
+
+
+def build_compact(session_ids, attendees, general, session_attendance):
+    # Igual que la recarga completa de AttendeeIndex
+    store = AttendanceStore()
+    store.load(attendees, general, session_attendance)
+    return store
+
+
+def lookup_objects(state, session_ids, dni):
+    return state.get(dni)
+
+
+def lookup_dict_sets(state, session_ids, dni):
+    names, general, sessions_by_dni = state
+    nombre = names.get(dni)
+    if nombre is None:
+        return None
+    attended = sessions_by_dni.get(dni, ())
+    return {"dni": dni, "nombre": nombre, "asistencia_general": dni in general,
+            **{session_id: session_id in attended for session_id in session_ids}}
+
+
+def lookup_compact(store, session_ids, dni):
+    ident = store.id_of(dni)
+    if ident is None:
+        return None
+    return {"dni": dni, "nombre": store.name(ident), "asistencia_general": ident in store.general,
+            **dict(zip(session_ids, store.session_flags(ident, session_ids)))}
+
+
+LAYOUTS = {
+    'objetos': (build_objects, lookup_objects),
+    'dict+sets': (build_dict_sets, lookup_dict_sets),
+    'compacto': (build_compact, lookup_compact),
+}
+
+
+def measure(layout, roster, lookups, seed):
+    build, lookup = LAYOUTS[layout]
+    session_ids, attendees = roster[0], roster[1]
+    # tracemalloc encarece cada asignación: la carga se cronometra aparte
+    gc.collect()
+    started = time.perf_counter()
+    state = build(*roster)
+    build_s = time.perf_counter() - started
+    del state
+    gc.collect()
+    tracemalloc.start()
+    state = build(*roster)
+    gc.collect()
+    used, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rng = random.Random(seed)
+    sample = [rng.choice(attendees)[0] for _ in range(lookups)]
+    started = time.perf_counter()
+    for dni in sample:
+        lookup(state, session_ids, dni)
+    lookup_us = (time.perf_counter() - started) / lookups * 1e6
+
+    return {"bytes": used, "bytes_per_attendee": round(used / len(attendees), 1), "peak_bytes": peak,
+            "build_s": round(build_s, 2), "lookup_us": round(lookup_us, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memoria del estado de asistencia por tamaño de padrón')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Tamaños de padrón, separados por comas')
+    parser.add_argument('--sessions', type=int, default=24, help='Ponencias del evento')
+    parser.add_argument('--layouts', default=','.join(LAYOUTS), help='Formas a medir, separadas por comas')
+    parser.add_argument('--lookups', type=int, default=100000, help='Búsquedas por DNI para medir la latencia')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Archivo JSON donde guardar los resultados')
+    args = parser.parse_args()
+
+    results = {"sessions": args.sessions, "sizes": {}}
+    for size in (int(n) for n in args.sizes.split(',')):
+        roster = synthetic_roster(size, args.sessions, args.seed)
+        results['sizes'][size] = {}
+        print(f"\n📦 {size:,} asistentes, {args.sessions} ponencias")
+        for layout in args.layouts.split(','):
+            stats = measure(layout, roster, args.lookups, args.seed)
+            results['sizes'][size][layout] = stats
+            print(f"   {layout:<10} {stats['bytes'] / 2**20:9.1f} MB  {stats['bytes_per_attendee']:8.1f} B/asistente  "
+                  f"pico={stats['peak_bytes'] / 2**20:.1f} MB  carga={stats['build_s']:.2f} s  "
+                  f"búsqueda={stats['lookup_us']:.2f} µs")
+        del roster
+        gc.collect()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados guardados en {args.output}")
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark del pool de conexiones de AppScriptAPI
+======================================================
+Compara la latencia por petición contra el stub local de Apps Script:
+  - antes:   requests.get() sin sesión (nueva conexión TCP en cada llamada)
+  - después: AppScriptAPI.session (conexiones keep-alive reutilizadas)
+
+Uso:
+    python bench_pool.py --requests 500 --handshake-ms 20
+"""
+
+import argparse
+import statistics
+import time
+
+import requests
+
+from app import AppScriptAPI
+from stub_appscript import start_stub
+
+
+def measure(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+def print_row(label, stats):
+    print(f"   {label:<28} media={stats['mean']:.3f} ms  "
+          f"p50={stats['p50']:.3f} ms  p95={stats['p95']:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del pool HTTP')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--handshake-ms', type=float, default=20,
+                        help='Coste simulado de abrir una conexión (TLS)')
+    args = parser.parse_args()
+
+    server, base_url = start_stub(handshake_ms=args.handshake_ms)
+    url = f"{base_url}?action=getAttendeeByDNI&dni=12345678"
+    client = AppScriptAPI(base_url)
+
+    # Calentamiento
+    requests.get(url, timeout=10)
+    client.session.get(url, timeout=client.timeout)
+
+    before = measure(lambda: requests.get(url, timeout=10), args.requests)
+    after = measure(lambda: client.session.get(url, timeout=client.timeout), args.requests)
+
+    print(f"\n📊 {args.requests} peticiones GET getAttendeeByDNI contra {base_url} "
+          f"(handshake simulado: {args.handshake_ms:.0f} ms)")
+    print_row("Sin pool (requests.get)", before)
+    print_row("Con pool (keep-alive)", after)
+    print(f"   Mejora en p50: {before['p50'] / after['p50']:.1f}x\n")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,7 @@ let toastElement = null;
 document.addEventListener('DOMContentLoaded', function() {
     initializeComponents();
     setupGlobalEventListeners();
+    setupOfflineKiosk();
 });
 
 function initializeComponents() {
@@ -32,6 +33,7 @@ function setupGlobalEventListeners() {
     // Handle network errors globally
     window.addEventListener('online', function() {
         showToast('Conexión', 'Conexión a internet restaurada', 'success');
+        flushOfflineScans();
     });
     
     window.addEventListener('offline', function() {
@@ -343,6 +345,106 @@ function throttle(func, limit) {
     };
 }
 
+// Capacidad en vivo (Server-Sent Events)
+// Llama a onUpdate(capacidadCompleta) con el snapshot inicial y tras cada delta.
+// Si el navegador no soporta EventSource, cae a polling con fallbackPoll.
+// Retorna una función para cerrar la suscripción.
+function subscribeCapacity(onUpdate, fallbackPoll, pollInterval = 30000) {
+    if (typeof EventSource === 'undefined') {
+        fallbackPoll();
+        const intervalId = setInterval(fallbackPoll, pollInterval);
+        return () => clearInterval(intervalId);
+    }
+    
+    let capacity = {};
+    let version = 0;
+    const source = new EventSource('/api/v1/sessions/capacity/stream');
+    
+    source.addEventListener('snapshot', function(e) {
+        const msg = JSON.parse(e.data);
+        version = msg.version;
+        capacity = msg.data;
+        onUpdate(capacity);
+    });
+    
+    source.addEventListener('delta', function(e) {
+        const msg = JSON.parse(e.data);
+        if (msg.version <= version) return;
+        version = msg.version;
+        capacity = Object.assign({}, capacity, msg.changes);
+        (msg.removed || []).forEach(id => delete capacity[id]);
+        onUpdate(capacity);
+    });
+    
+    // EventSource reconecta solo; al reconectar llega un snapshot nuevo
+    source.onerror = function() {
+        console.warn('Conexión de capacidad en vivo interrumpida, reintentando...');
+    };
+    
+    return () => source.close();
+}
+
+// Modo kiosko offline (ver static/js/offline.js y static/js/sw.js)
+// Registra el Service Worker, mantiene el padrón local al día y envía la
+// cola de escaneos al recuperar la conexión (y cada 30 s mientras haya).
+function setupOfflineKiosk() {
+    if (typeof OfflineKiosk === 'undefined' || !('indexedDB' in window)) return;
+    
+    // Los Service Workers solo existen en contexto seguro (HTTPS o localhost);
+    // sin él la cola sigue funcionando, pero la app no carga sin red
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch(error => {
+            console.warn('No se pudo registrar el Service Worker:', error);
+        });
+        navigator.serviceWorker.addEventListener('message', function(e) {
+            if (e.data && e.data.type === 'scans-flushed') {
+                reportFlush(e.data.result);
+            }
+        });
+    }
+    
+    OfflineKiosk.refreshRosterIfStale();
+    flushOfflineScans();
+    setInterval(() => {
+        flushOfflineScans();
+        OfflineKiosk.refreshRosterIfStale();
+    }, 30000);
+}
+
+async function flushOfflineScans() {
+    if (typeof OfflineKiosk === 'undefined' || !navigator.onLine) return;
+    try {
+        reportFlush(await OfflineKiosk.flush());
+    } catch (error) {
+        console.warn('No se pudo enviar la cola de escaneos:', error);
+    }
+}
+
+function reportFlush(result) {
+    updateQueueBadge(result.pending);
+    if (!result.sent) return;
+    
+    if (result.rejected.length > 0) {
+        const detail = result.rejected
+            .map(r => r.dni + (r.session_id ? ` (${r.session_id})` : '') + ': ' + r.message)
+            .join('; ');
+        showToast('Registros rechazados',
+            `${result.rejected.length} de ${result.sent} escaneos sin conexión fueron rechazados. ${detail}`, 'error');
+    } else {
+        showToast('Sincronizado', `${result.sent} escaneos sin conexión enviados`, 'success');
+    }
+}
+
+async function updateQueueBadge(count) {
+    const badge = document.getElementById('offlineQueueBadge');
+    if (!badge || typeof OfflineKiosk === 'undefined') return;
+    if (count === undefined) {
+        count = await OfflineKiosk.pendingCount().catch(() => 0);
+    }
+    document.getElementById('offlineQueueCount').textContent = count;
+    badge.classList.toggle('d-none', count === 0);
+}
+
 // Initialization check
 function initializationCheck() {
     const checks = {
@@ -385,7 +487,10 @@ window.RegistroApp = {
     playSuccessSound,
     handleError,
     debounce,
-    throttle
+    throttle,
+    subscribeCapacity,
+    flushOfflineScans,
+    updateQueueBadge
 };
 
 // Initialize the app
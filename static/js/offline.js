@@ -0,0 +1,390 @@
+// Modo kiosko offline: padrón en IndexedDB y cola de escaneos pendientes.
+// Se carga en las páginas (después de main.js) y en el Service Worker
+// (importScripts), así que no toca el DOM.
+(function(scope) {
+    const DB_NAME = 'asistencia-kiosko';
+    const DB_VERSION = 1;
+    const ROSTER_MAX_AGE_MS = 5 * 60 * 1000;  // Con conexión, refrescar el padrón cada 5 minutos
+    const SCAN_TIMEOUT_MS = 2500;             // Si el servidor tarda más, el escaneo pasa a la cola
+    const FLUSH_BATCH_SIZE = 100;             // No mayor que BATCH_MAX_ITEMS del servidor
+    const FLUSH_TIMEOUT_MS = 20000;
+    const FLUSH_LOCK_MS = FLUSH_TIMEOUT_MS + 10000;  // Turno de envío; cada lote lo renueva
+    const SYNC_TAG = 'flush-scans';
+    const JSON_HEADERS = { 'Content-Type': 'application/json' };
+
+    let dbPromise = null;
+    let flushing = null;
+
+    function openDB() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, DB_VERSION);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    db.createObjectStore('roster', { keyPath: 'dni' });
+                    db.createObjectStore('meta');
+                    const queue = db.createObjectStore('queue', { keyPath: 'id', autoIncrement: true });
+                    queue.createIndex('dni', 'dni');
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    // Ejecuta fn(...stores) en una transacción; resuelve con el resultado
+    // de la(s) petición(es) que retorne fn cuando la transacción termina
+    async function withStores(names, mode, fn) {
+        const db = await openDB();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(names, mode);
+            const out = fn(...names.map(name => tx.objectStore(name)));
+            tx.oncomplete = () => resolve(Array.isArray(out) ? out.map(r => r.result) : out && out.result);
+            tx.onerror = tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    function fetchWithTimeout(url, options = {}, timeout = SCAN_TIMEOUT_MS) {
+        const controller = new AbortController();
+        const timer = setTimeout(() => controller.abort(), timeout);
+        return fetch(url, { ...options, signal: controller.signal })
+            .finally(() => clearTimeout(timer));
+    }
+
+    function newKey() {
+        if (scope.crypto && scope.crypto.randomUUID) {
+            return scope.crypto.randomUUID();
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    function dayKey(date) {
+        return date.getFullYear() + '-' + (date.getMonth() + 1) + '-' + date.getDate();
+    }
+
+    // Padrón
+
+    async function syncRoster() {
+        const response = await fetchWithTimeout('/api/v1/attendees/roster', {}, FLUSH_TIMEOUT_MS);
+        const result = await response.json();
+        if (!response.ok || !result.success) {
+            throw new Error(result.message || 'HTTP ' + response.status);
+        }
+
+        const { sessions, attendees, general, session_attendance } = result.data;
+        const withGeneral = new Set(general);
+        const sessionsByDni = {};
+        session_attendance.forEach(([dni, sessionId]) => {
+            (sessionsByDni[dni] = sessionsByDni[dni] || []).push(sessionId);
+        });
+
+        await withStores(['roster', 'meta'], 'readwrite', (roster, meta) => {
+            roster.clear();
+            attendees.forEach(([dni, nombre]) => roster.put({
+                dni,
+                nombre,
+                general: withGeneral.has(dni),
+                sessions: sessionsByDni[dni] || []
+            }));
+            meta.put(sessions, 'sessions');
+            meta.put(Date.now(), 'roster_synced_at');
+        });
+        return attendees.length;
+    }
+
+    async function refreshRosterIfStale() {
+        if (!scope.navigator.onLine) return false;
+        try {
+            const syncedAt = await withStores(['meta'], 'readonly', meta => meta.get('roster_synced_at'));
+            if (syncedAt && Date.now() - syncedAt < ROSTER_MAX_AGE_MS) return false;
+            await syncRoster();
+            return true;
+        } catch (error) {
+            console.warn('No se pudo actualizar el padrón local:', error);
+            return false;
+        }
+    }
+
+    // Misma forma que GET /api/v1/attendees/search/<dni>, con los escaneos
+    // aún en cola aplicados encima del padrón. null si el DNI no está.
+    async function lookup(dni) {
+        const [record, sessions, queued] = await withStores(['roster', 'meta', 'queue'], 'readonly',
+            (roster, meta, queue) => [roster.get(dni), meta.get('sessions'), queue.index('dni').getAll(dni)]);
+        if (!record) return null;
+
+        const data = {
+            dni,
+            nombre: record.nombre,
+            asistencia_general: record.general || queued.some(item => item.kind === 'general')
+        };
+        (sessions || []).forEach(sessionId => {
+            data[sessionId] = record.sessions.includes(sessionId) ||
+                queued.some(item => item.kind === 'session' && item.session_id === sessionId);
+        });
+        return data;
+    }
+
+    // Cola de escaneos
+
+    async function enqueue(kind, dni, sessionId, idempotencyKey) {
+        const item = {
+            kind,
+            dni,
+            session_id: sessionId || null,
+            timestamp: new Date().toISOString(),
+            idempotency_key: idempotencyKey
+        };
+        item.id = await withStores(['queue'], 'readwrite', queue => queue.add(item));
+        requestBackgroundSync();
+        return item;
+    }
+
+    function pendingCount() {
+        return withStores(['queue'], 'readonly', queue => queue.count());
+    }
+
+    function requestBackgroundSync() {
+        // Solo en la página; en navegadores sin Background Sync la cola se envía al volver `online`
+        if (scope.document && 'serviceWorker' in scope.navigator) {
+            scope.navigator.serviceWorker.ready
+                .then(registration => registration.sync && registration.sync.register(SYNC_TAG))
+                .catch(() => {});
+        }
+    }
+
+    // Intenta el registro en línea con un timeout corto; sin conexión, con la
+    // red lenta o con el servidor caído lo valida contra el padrón local y lo
+    // encola. La misma idempotency_key viaja en ambos caminos, así que si la
+    // petición llegó a procesarse el reenvío no duplica filas.
+    async function postOrQueue(url, body, queueLocally) {
+        const idempotencyKey = newKey();
+        if (scope.navigator.onLine) {
+            try {
+                const response = await fetchWithTimeout(url, {
+                    method: 'POST',
+                    headers: JSON_HEADERS,
+                    body: JSON.stringify({ ...body, idempotency_key: idempotencyKey })
+                });
+                if (response.status < 500) {
+                    return await response.json();
+                }
+            } catch (error) {
+                console.warn('Registro en línea fallido, se encola:', error);
+            }
+        }
+        return queueLocally(idempotencyKey);
+    }
+
+    function registerGeneral(dni) {
+        return postOrQueue('/api/v1/attendees/general', { dni }, idempotencyKey => queueGeneral(dni, idempotencyKey));
+    }
+
+    // Check-in en un paso (POST /api/v1/checkin): sin conexión encola la
+    // asistencia general y devuelve en `data` el estado del padrón local
+    function checkin(dni) {
+        return postOrQueue('/api/v1/checkin', { dni }, async idempotencyKey => {
+            const result = await queueGeneral(dni, idempotencyKey);
+            if (result.success) {
+                // Misma forma que la respuesta del servidor
+                result.general = result.data;
+                result.data = await lookup(dni);
+            }
+            return result;
+        });
+    }
+
+    async function queueGeneral(dni, idempotencyKey) {
+        // Validación local (padrón + cola) antes de encolar
+        const attendee = await lookup(dni);
+        if (!attendee) {
+            return { success: false, message: 'Participante no encontrado en el padrón local' };
+        }
+
+        const today = dayKey(new Date());
+        const queued = await withStores(['queue'], 'readonly', queue => queue.index('dni').getAll(dni));
+        if (queued.some(item => item.kind === 'general' && dayKey(new Date(item.timestamp)) === today)) {
+            return {
+                success: true,
+                message: 'Ya registró asistencia hoy (pendiente de envío)',
+                data: { dni, queued: true },
+                kit_entregado: false,
+                already_registered_today: true,
+                queued: true
+            };
+        }
+
+        // Kit solo la primera vez, igual que en el servidor
+        const kit = !attendee.asistencia_general;
+        const item = await enqueue('general', dni, null, idempotencyKey);
+        return {
+            success: true,
+            message: kit
+                ? 'Asistencia registrada sin conexión. Kit entregado'
+                : 'Asistencia registrada sin conexión. Kit ya entregado anteriormente',
+            data: { dni, timestamp: item.timestamp, kit_entregado: kit, queued: true },
+            kit_entregado: kit,
+            already_registered_today: false,
+            queued: true
+        };
+    }
+
+    // `capacity` es la última capacidad conocida de la ponencia (puede faltar).
+    // El solapamiento de horarios solo lo valida el servidor al enviar la cola.
+    function registerSession(dni, sessionId, sessionName, capacity) {
+        return postOrQueue('/api/v1/sessions/register', { dni, session_id: sessionId }, async idempotencyKey => {
+            const attendee = await lookup(dni);
+            if (!attendee) {
+                return { success: false, message: 'Participante no encontrado en el padrón local' };
+            }
+            if (!attendee.asistencia_general) {
+                return { success: false, message: 'Debe registrar asistencia general primero' };
+            }
+            if (attendee[sessionId]) {
+                return { success: false, message: 'Ya está registrado en ' + sessionName };
+            }
+            if (capacity && capacity.available <= 0) {
+                return { success: false, message: 'No hay cupos disponibles para ' + sessionName };
+            }
+
+            const item = await enqueue('session', dni, sessionId, idempotencyKey);
+            return {
+                success: true,
+                message: 'Registrado sin conexión en ' + sessionName,
+                data: { dni, session_id: sessionId, session_name: sessionName, timestamp: item.timestamp, queued: true },
+                queued: true
+            };
+        });
+    }
+
+    // Envío de la cola
+
+    // Envía la cola en lotes (asistencias generales primero). Retorna
+    // { sent, rejected: [{kind, dni, session_id, message}], failed, busy, pending }.
+    // `failed` indica que la red o el servidor fallaron y quedan escaneos;
+    // `busy`, que otro contexto (página o Service Worker) ya la está enviando.
+    function flush() {
+        if (!flushing) {
+            const owner = newKey();
+            flushing = flushQueue(owner)
+                .finally(() => releaseFlush(owner).catch(() => {}))
+                .finally(() => { flushing = null; });
+        }
+        return flushing;
+    }
+
+    // La página y el Service Worker comparten la cola: antes de cada lote se
+    // toma o renueva un turno en `meta`. Las transacciones readwrite sobre el
+    // mismo store se serializan, así que solo un contexto lo obtiene; si ese
+    // contexto muere, el turno vence solo tras FLUSH_LOCK_MS.
+    function claimFlush(owner) {
+        return withStores(['meta'], 'readwrite', meta => {
+            const claim = { result: false };
+            const request = meta.get('flush_lock');
+            request.onsuccess = () => {
+                const lock = request.result;
+                if (!lock || lock.owner === owner || lock.expires < Date.now()) {
+                    meta.put({ owner, expires: Date.now() + FLUSH_LOCK_MS }, 'flush_lock');
+                    claim.result = true;
+                }
+            };
+            return claim;
+        });
+    }
+
+    function releaseFlush(owner) {
+        return withStores(['meta'], 'readwrite', meta => {
+            const request = meta.get('flush_lock');
+            request.onsuccess = () => {
+                if (request.result && request.result.owner === owner) {
+                    meta.delete('flush_lock');
+                }
+            };
+        });
+    }
+
+    async function flushQueue(owner) {
+        const result = { sent: 0, rejected: [], failed: false, busy: false, pending: 0 };
+        const queued = await withStores(['queue'], 'readonly', queue => queue.getAll());
+
+        for (const kind of ['general', 'session']) {
+            const items = queued.filter(item => item.kind === kind);
+            for (let i = 0; i < items.length && !result.failed && !result.busy; i += FLUSH_BATCH_SIZE) {
+                if (!await claimFlush(owner)) {
+                    result.busy = true;
+                    break;
+                }
+                await sendBatch(kind, items.slice(i, i + FLUSH_BATCH_SIZE), result);
+            }
+            // Las ponencias exigen la asistencia general previa: no se envían sin ella
+            if (result.failed || result.busy) break;
+        }
+
+        result.pending = await pendingCount();
+        return result;
+    }
+
+    async function sendBatch(kind, chunk, result) {
+        const url = kind === 'general' ? '/api/v1/attendees/general/batch' : '/api/v1/sessions/register/batch';
+        const items = chunk.map(item => {
+            const out = { dni: item.dni, timestamp: item.timestamp, idempotency_key: item.idempotency_key };
+            if (kind === 'session') out.session_id = item.session_id;
+            return out;
+        });
+
+        let response, body;
+        try {
+            response = await fetchWithTimeout(url, {
+                method: 'POST',
+                headers: JSON_HEADERS,
+                body: JSON.stringify({ items })
+            }, FLUSH_TIMEOUT_MS);
+            body = await response.json();
+        } catch (error) {
+            console.warn('No se pudo enviar la cola de escaneos:', error);
+            result.failed = true;
+            return;
+        }
+
+        if (response.ok && body.success) {
+            body.data.results.forEach((r, i) => {
+                // Un duplicado ya registrado en el servidor no es un rechazo
+                if (!r.success && !(r.message || '').includes('Ya está registrado')) {
+                    result.rejected.push({
+                        kind,
+                        dni: chunk[i].dni,
+                        session_id: chunk[i].session_id,
+                        message: r.error ? r.message + ': ' + r.error : r.message
+                    });
+                }
+            });
+        } else if (response.status === 400) {
+            // Lote inválido: reintentarlo no cambiaría la respuesta
+            chunk.forEach(item => result.rejected.push({
+                kind,
+                dni: item.dni,
+                session_id: item.session_id,
+                message: body.message
+            }));
+        } else {
+            // 5xx, 408, 413, 429...: los escaneos quedan en la cola para el próximo intento
+            result.failed = true;
+            return;
+        }
+
+        await withStores(['queue'], 'readwrite', queue => { chunk.forEach(item => queue.delete(item.id)); });
+        result.sent += chunk.length;
+    }
+
+    scope.OfflineKiosk = {
+        SYNC_TAG,
+        syncRoster,
+        refreshRosterIfStale,
+        lookup,
+        registerGeneral,
+        registerSession,
+        checkin,
+        pendingCount,
+        flush
+    };
+})(self);
@@ -0,0 +1,120 @@
+// Service Worker del modo kiosko offline (servido como /sw.js, ver app.service_worker)
+// - App shell (páginas, CSS/JS locales y de CDN): stale-while-revalidate
+// - Lista, capacidad y cruces de ponencias: red primero, última respuesta si no hay red
+// - Resto de la API (búsqueda, registros, SSE, export): siempre a la red
+// - Background Sync: envía la cola de escaneos de IndexedDB al volver la conexión
+importScripts('/static/js/offline.js');
+
+const SHELL_CACHE = 'asistencia-shell-v1';
+const DATA_CACHE = 'asistencia-data-v1';
+
+const SHELL_URLS = [
+    '/',
+    '/register',
+    '/sessions',
+    '/static/css/style.css',
+    '/static/js/main.js',
+    '/static/js/offline.js',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css',
+    'https://unpkg.com/@zxing/library@latest/umd/index.min.js'
+];
+
+const CACHED_API = ['/api/v1/sessions', '/api/v1/sessions/capacity', '/api/v1/sessions/conflicts'];
+
+self.addEventListener('install', event => {
+    // Un recurso de CDN caído no debe impedir la instalación
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(cache => Promise.all(SHELL_URLS.map(url =>
+                cache.add(url).catch(error => console.warn('No se pudo cachear', url, error)))))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys
+                .filter(key => key !== SHELL_CACHE && key !== DATA_CACHE)
+                .map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const url = new URL(request.url);
+    const sameOrigin = url.origin === self.location.origin;
+
+    if (sameOrigin && CACHED_API.includes(url.pathname)) {
+        event.respondWith(networkFirst(request));
+    } else if (!(sameOrigin && url.pathname.startsWith('/api/'))) {
+        event.respondWith(staleWhileRevalidate(event));
+    }
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === OfflineKiosk.SYNC_TAG) {
+        event.waitUntil(flushAndNotify());
+    }
+});
+
+async function staleWhileRevalidate(event) {
+    const request = event.request;
+    const cache = await caches.open(SHELL_CACHE);
+    const cached = await cache.match(request);
+
+    const network = fetch(request).then(response => {
+        if (response.ok) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    });
+
+    if (cached) {
+        event.waitUntil(network.catch(() => {}));
+        return cached;
+    }
+
+    try {
+        return await network;
+    } catch (error) {
+        // Página no visitada aún y sin red: mostrar el inicio
+        if (request.mode === 'navigate') {
+            const home = await cache.match('/');
+            if (home) return home;
+        }
+        throw error;
+    }
+}
+
+async function networkFirst(request) {
+    const cache = await caches.open(DATA_CACHE);
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request);
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+async function flushAndNotify() {
+    const result = await OfflineKiosk.flush();
+    const clients = await self.clients.matchAll();
+    clients.forEach(client => client.postMessage({ type: 'scans-flushed', result }));
+
+    // Rechazar hace que el navegador reintente la sincronización más tarde.
+    // Con `busy` la página ya está enviando la cola y no hace falta reintentar.
+    if (result.failed) {
+        throw new Error('Quedan ' + result.pending + ' escaneos pendientes');
+    }
+}
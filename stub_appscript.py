@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""
+Servidor stub local de Apps Script
+==================================
+Responde a las acciones GET/POST de APPSCRIPT_FINAL.gs con datos de prueba
+y registros en memoria, para medir el cliente AppScriptAPI sin depender de
+script.google.com. La latencia, su variación y los fallos son configurables.
+
+Uso:
+    python stub_appscript.py --port 8765
+    python stub_appscript.py --latency-ms 800 --jitter-ms 300 --error-rate 0.02 --seed 1
+    APPSCRIPT_BASE_URL=http://127.0.0.1:8765/exec uv run flask run
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+SESSIONS = [
+    {"id": "sesion_1", "name": "Ponencia 1", "description": "Eje 1"},
+    {"id": "sesion_2", "name": "Ponencia 2", "description": "Eje 2"},
+]
+
+ATTENDEES = [[f"{10000000 + i}", f"Asistente {i}"] for i in range(1000)]
+
+
+def snapshot_part(rows, params, key):
+    start = int(params.get(key, ['0'])[0] or 0)
+    return {"from": start, "total": len(rows), "rows": rows[start:]}
+
+
+class StubState:
+    """
+    Registros en memoria del stub, con las mismas validaciones de cupo,
+    duplicado e idempotency_key que APPSCRIPT_FINAL.gs. Cualquier DNI de
+    8 dígitos existe, y no se exige asistencia general para registrarse
+    en una ponencia.
+    """
+
+    def __init__(self, capacity=5000):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.general = {}
+        self.session_attendance = {}
+        self.counts = {s['id']: 0 for s in SESSIONS}
+        self.replies = {}
+        # Peticiones recibidas por acción, incluidas las que fallan
+        self.calls = {}
+
+    def count_call(self, action):
+        with self._lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+
+    def handle_get(self, params):
+        action = params.get('action', [''])[0]
+        if action == 'getAttendeeByDNI':
+            dni = params.get('dni', [''])[0]
+            if len(dni) != 8:
+                return {"error": "dni inválido (8 dígitos)"}
+            with self._lock:
+                attended = self.session_attendance.get(dni, set())
+                return {"dni": dni, "nombre": "Asistente Prueba", "asistencia_general": dni in self.general,
+                        **{s['id']: s['id'] in attended for s in SESSIONS}}
+        if action == 'getSessionsList':
+            return SESSIONS
+        if action == 'getSessionsCapacity':
+            with self._lock:
+                return {s['id']: {"available": max(0, self.capacity - self.counts[s['id']]),
+                                  "total": self.capacity, "name": s['name']} for s in SESSIONS}
+        if action == 'getSessionConflicts':
+            return {s['id']: [] for s in SESSIONS}
+        if action == 'getEventStats':
+            with self._lock:
+                return {"general": {"attendees": len(self.general), "checkins": len(self.general),
+                                    "today": len(self.general), "kits_delivered": len(self.general)},
+                        "per_minute": []}
+        if action == 'getAttendeesSnapshot':
+            return {"sessions": [s['id'] for s in SESSIONS],
+                    "attendees": snapshot_part(ATTENDEES, params, 'attendees_from'),
+                    "general": snapshot_part([], params, 'general_from'),
+                    "session_attendance": snapshot_part([], params, 'session_from')}
+        if action == 'exportAttendeesData':
+            if 'limit' not in params:
+                return {"csv_data": "DNI,Nombre,Asistencia General\n12345678,Asistente Prueba,No"}
+            offset = int(params.get('offset', ['0'])[0] or 0)
+            rows = ATTENDEES[offset:offset + int(params['limit'][0])]
+            next_offset = offset + len(rows)
+            return {"header": "DNI,Nombre,Asistencia General",
+                    "csv_rows": "\n".join(f"{dni},{nombre},No" for dni, nombre in rows),
+                    "offset": offset, "count": len(rows), "total": len(ATTENDEES),
+                    "next_offset": next_offset if next_offset < len(ATTENDEES) else None}
+        return {"error": "Acción GET no soportada."}
+
+    def handle_post(self, body):
+        # Reenvíos con la misma idempotency_key devuelven la respuesta original
+        key = body.get('idempotency_key')
+        if key and key in self.replies:
+            return self.replies[key]
+        out = self._dispatch_post(body)
+        if key and 'error' not in out:
+            self.replies[key] = out
+        return out
+
+    def _dispatch_post(self, body):
+        action = body.get('action', '')
+        dni = str(body.get('dni') or '')
+        if action == 'registerGeneralAttendance':
+            if len(dni) != 8:
+                return {"error": "dni inválido"}
+            with self._lock:
+                if dni in self.general:
+                    return {"registered": True, "dni": dni, "timestamp": self.general[dni],
+                            "kit_entregado": True, "already_registered_today": True}
+                self.general[dni] = body.get('timestamp')
+            return {"registered": True, "dni": dni, "timestamp": body.get('timestamp'), "kit_entregado": True}
+        if action == 'registerSessionAttendance':
+            session_id = body.get('session_id')
+            if len(dni) != 8:
+                return {"error": "dni inválido"}
+            if session_id not in self.counts:
+                return {"error": "session_id no existe"}
+            with self._lock:
+                if self.counts[session_id] >= self.capacity:
+                    return {"no_capacity": True, "session_id": session_id,
+                            "session_name": session_id, "available_capacity": 0}
+                attended = self.session_attendance.setdefault(dni, set())
+                if session_id in attended:
+                    return {"already_registered": True, "dni": dni,
+                            "session_id": session_id, "session_name": session_id}
+                attended.add(session_id)
+                self.counts[session_id] += 1
+            return {"registered": True, "dni": dni, "session_id": session_id,
+                    "session_name": session_id, "timestamp": body.get('timestamp')}
+        if action == 'checkin':
+            if len(dni) != 8:
+                return {"error": "dni inválido"}
+            out = {"general": self._dispatch_post({**body, "action": "registerGeneralAttendance"})}
+            if body.get('session_id'):
+                out['session'] = self._dispatch_post({**body, "action": "registerSessionAttendance"})
+            out['attendee'] = self.handle_get({'action': ['getAttendeeByDNI'], 'dni': [dni]})
+            return out
+        if action in ('registerGeneralAttendanceBatch', 'registerSessionAttendanceBatch'):
+            single = action[:-len('Batch')]
+            return {"results": [self.handle_post({**item, "action": single}) for item in body.get('items', [])]}
+        return {"error": "Acción POST no soportada."}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 para que el cliente pueda mantener la conexión abierta
+    protocol_version = 'HTTP/1.1'
+    # Cabeceras y cuerpo se escriben por separado: sin TCP_NODELAY el
+    # delayed-ACK añade ~40 ms por respuesta en conexiones reutilizadas
+    disable_nagle_algorithm = True
+    # Retardo simulado al abrir cada conexión (aproxima el handshake TLS)
+    handshake_delay = 0.0
+    # Retardo simulado por petición (tiempo de ejecución de Apps Script)
+    latency_delay = 0.0
+    # Variación aleatoria del retardo, +/- en segundos
+    latency_jitter = 0.0
+    # Fracción de peticiones que fallan con HTTP 500 o que tardan slow_delay más
+    error_rate = 0.0
+    slow_rate = 0.0
+    slow_delay = 0.0
+    state = None
+    rng = None
+
+    def setup(self):
+        super().setup()
+        if self.handshake_delay:
+            time.sleep(self.handshake_delay)
+
+    def _send_json(self, obj):
+        payload = json.dumps(obj).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self):
+        # Apps Script responde los errores internos con una página HTML
+        payload = b'<html><body>Error interno del servidor</body></html>'
+        self.send_response(500)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _run(self, handler, request, action, timing):
+        # Igual que jsonResponse(obj, timing) en Apps Script: el retardo
+        # simulado cuenta como tiempo de ejecución del script
+        started = time.perf_counter()
+        self.state.count_call(action)
+        roll = self.rng.random()
+        delay = self.latency_delay + self.rng.uniform(-self.latency_jitter, self.latency_jitter)
+        if self.error_rate <= roll < self.error_rate + self.slow_rate:
+            delay += self.slow_delay
+        if delay > 0:
+            time.sleep(delay)
+        if roll < self.error_rate:
+            return self._send_error()
+        out = handler(request)
+        if timing:
+            out = {"result": out, "timing": {"action": action,
+                                             "script_ms": round((time.perf_counter() - started) * 1000)}}
+        self._send_json(out)
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        self._run(self.state.handle_get, params, params.get('action', [''])[0], params.get('timing'))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b'{}'
+        body = json.loads(raw or b'{}')
+        self._run(self.state.handle_post, body, body.get('action', ''), body.get('timing'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    # Cola de accept() amplia para las pruebas de carga con cientos de conexiones
+    request_queue_size = 512
+
+    def handle_error(self, request, client_address):
+        # El cliente cortó la conexión (timeout o petición de respaldo descartada)
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def make_handler(handshake_ms=0, latency_ms=0, jitter_ms=0, error_rate=0, slow_rate=0, slow_ms=0,
+                 capacity=5000, seed=None):
+    return type('StubHandler', (StubHandler,), {'handshake_delay': handshake_ms / 1000,
+                                                'latency_delay': latency_ms / 1000,
+                                                'latency_jitter': jitter_ms / 1000,
+                                                'error_rate': error_rate,
+                                                'slow_rate': slow_rate,
+                                                'slow_delay': slow_ms / 1000,
+                                                'state': StubState(capacity),
+                                                'rng': random.Random(seed)})
+
+
+def start_stub(host='127.0.0.1', port=0, **options):
+    """
+    Levantar el stub en un hilo de fondo. Retorna (server, base_url).
+    `options` son los de make_handler; los registros quedan en server.state.
+    """
+    handler = make_handler(**options)
+    server = StubServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = handler.state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/exec"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub local de Apps Script')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--handshake-ms', type=float, default=0,
+                        help='Retardo por conexión nueva (simula TLS)')
+    parser.add_argument('--latency-ms', type=float, default=0,
+                        help='Retardo por petición (simula la ejecución de Apps Script)')
+    parser.add_argument('--jitter-ms', type=float, default=0,
+                        help='Variación aleatoria (+/-) del retardo por petición')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='Fracción de peticiones que responden HTTP 500')
+    parser.add_argument('--slow-rate', type=float, default=0,
+                        help='Fracción de peticiones que tardan --slow-ms adicionales')
+    parser.add_argument('--slow-ms', type=float, default=0)
+    parser.add_argument('--capacity', type=int, default=5000, help='Cupos por ponencia')
+    parser.add_argument('--seed', type=int, default=None, help='Semilla para repetir la misma secuencia')
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port),
+                        make_handler(args.handshake_ms, args.latency_ms, args.jitter_ms, args.error_rate,
+                                     args.slow_rate, args.slow_ms, args.capacity, args.seed))
+    server.daemon_threads = True
+    print(f"Stub Apps Script escuchando en http://{args.host}:{args.port}/exec")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
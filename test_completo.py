@@ -90,6 +90,26 @@ def test_capacidad_sesiones():
                 print(f"      - {sid}: {info['available']}/{info['total']} disponibles")
     return r
 
+def test_registro_general_lote(dnis):
+    """Test: Registro de asistencia general por lotes"""
+    r = requests.post(f"{BASE_URL}/api/v1/attendees/general/batch",
+                     json={'dnis': dnis})
+    print_result(f"Registro General por lote ({len(dnis)} DNIs)", r, True)
+    if r.status_code == 200:
+        for item in r.json().get('data', {}).get('results', []):
+            print(f"      - {item['dni']}: {item['message']}")
+    return r
+
+def test_registro_sesion_lote(items):
+    """Test: Registro en ponencias por lotes"""
+    r = requests.post(f"{BASE_URL}/api/v1/sessions/register/batch",
+                     json={'items': items})
+    print_result(f"Registro en sesiones por lote ({len(items)} items)", r, True)
+    if r.status_code == 200:
+        for item in r.json().get('data', {}).get('results', []):
+            print(f"      - {item['dni']} → {item['session_id']}: {item['message']}")
+    return r
+
 def run_all_tests():
     """Ejecutar todas las pruebas"""
     
@@ -198,6 +218,17 @@ def run_all_tests():
             else:
                 print("   ℹ️  No hay sesiones llenas en este momento")
     
+    # =====================================================
+    # SECCIÓN 7: REGISTRO POR LOTES
+    # =====================================================
+    print_section("7️⃣  REGISTRO POR LOTES - Grupos y Escaneos Offline")
+    
+    test_registro_general_lote([dni_test, dni_sin_general])
+    test_registro_sesion_lote([
+        {'dni': dni_test, 'session_id': 'sesion_1'},
+        {'dni': dni_sin_general, 'session_id': 'sesion_1'}
+    ])
+    
     # =====================================================
     # RESUMEN FINAL
     # =====================================================
@@ -0,0 +1,45 @@
+"""
+Configuración común de las pruebas.
+
+app.py lee su configuración del entorno al importarse: las pruebas usan el
+backend SQLite en un directorio temporal, sin red ni Apps Script.
+"""
+
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix='asistencia-tests-')
+os.environ.update({
+    'STORAGE_BACKEND': 'sqlite',
+    'SQLITE_DB_PATH': os.path.join(_TMP, 'asistencia.db'),
+    'JOURNAL_PATH': os.path.join(_TMP, 'registration_journal.db'),
+    'LOG_LEVEL': 'WARNING',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import app as core
+
+# s1 y s2 se cruzan (mismo día, 09:00-10:00 y 09:30-10:30); s3 es más tarde
+SESSIONS = [
+    ['s1', 'Ponente 1', 'Ponencia 1', 'Eje 1', 2, '15-nov', 60, '09:00', '10:00', '1'],
+    ['s2', 'Ponente 2', 'Ponencia 2', 'Eje 1', 5, '15-nov', 60, '09:30', '10:30', '1'],
+    ['s3', 'Ponente 3', 'Ponencia 3', 'Eje 2', 5, '15-nov', 60, '11:00', '12:00', '1'],
+]
+
+ATTENDEES = [[f'Nombre {i}', f'Apellido {i}', '', '', f'4000000{i}'] for i in range(6)]
+
+def load_sheets(storage, attendees=ATTENDEES, sessions=SESSIONS):
+    """Cargar las hojas de prueba como lo hace `flask import-sheets`"""
+    headers = core.SQLiteStorage.SHEET_HEADERS
+    storage.import_sheet('Attendees', [headers['Attendees']] + attendees)
+    storage.import_sheet('Sessions', [headers['Sessions']] + sessions)
+
+@pytest.fixture
+def storage(tmp_path):
+    """SQLiteStorage con el padrón y las ponencias de prueba"""
+    storage = core.SQLiteStorage(str(tmp_path / 'asistencia.db'))
+    load_sheets(storage)
+    return storage
@@ -0,0 +1,112 @@
+"""AttendanceStore: ids densos por DNI, bitsets de asistencia y export CSV del índice"""
+
+import app as core
+from conftest import SESSIONS, load_sheets
+
+def test_dense_ids_in_arrival_order():
+    store = core.AttendanceStore()
+    ids = [store.add(dni, f'N{i}') for i, dni in enumerate(['40000002', '00001234', 'X-77', '40000001'])]
+
+    assert ids == [0, 1, 2, 3]
+    assert len(store) == 4
+    # Antes del reordenamiento los DNI nuevos se encuentran en el dict de pendientes
+    assert store.id_of('00001234') == 1
+    store.reindex()
+    assert [store.id_of(dni) for dni in ['40000002', '00001234', 'X-77', '40000001']] == ids
+    # Ceros a la izquierda y DNI que no son 8 dígitos conservan su texto
+    assert store.dni(1) == '00001234'
+    assert store.dni(2) == 'X-77'
+    assert store.id_of('49999999') is None
+    assert store.id_of('1234') is None
+
+def test_add_existing_dni_renames():
+    store = core.AttendanceStore()
+    ident = store.add('40000000', 'Ana')
+    store.add('40000001', 'Luis')
+
+    assert store.add('40000000', 'Ana María') == ident
+    assert len(store) == 2
+    assert store.name(ident) == 'Ana María'
+    assert store.name(1) == 'Luis'
+
+def test_many_pending_dnis_trigger_reindex():
+    store = core.AttendanceStore()
+    dnis = [f'{i:08d}' for i in range(5000, 0, -1)]
+    for dni in dnis:
+        store.add(dni, '')
+
+    assert len(store._keys) > 4096
+    assert len(store._pending) < 4096
+    assert all(store.id_of(dni) == i for i, dni in enumerate(dnis))
+
+def test_bitset_counts_each_id_once():
+    bits = core._Bitset()
+    for i in (0, 9, 9, 63):
+        bits.add(i)
+
+    assert bits.count == 3
+    assert [i in bits for i in (0, 1, 9, 63, 64, 10_000)] == [True, False, True, True, False, False]
+    assert len(bits.bits) == 8
+
+def test_general_kit_and_sessions():
+    store = core.AttendanceStore()
+    for i in range(10):
+        store.add(f'4000000{i}', f'N{i}')
+    store.mark_general('40000003', '2025-11-14T09:00:00', kit=True)
+    store.mark_general('40000003', '2025-11-15T09:00:00')
+    store.mark_general('40000009')
+    store.mark_general('49999999')
+    store.mark_session('40000003', 's1')
+    store.mark_session('40000009', 's2')
+    store.mark_session('40000009', 's1')
+
+    assert store.general.count == 2 and 3 in store.general and 9 in store.general
+    assert store.kits.count == 1 and 3 in store.kits
+    assert store.general_day(3) == '2025-11-15'
+    assert store.general_day(9) is None
+    assert store.session_counts() == {'s1': 2, 's2': 1}
+    assert store.session_flags(9, ['s1', 's2', 's3']) == [True, True, False]
+    assert store.session_flags(0, ['s1', 's2']) == [False, False]
+    assert store.has_session(3, 's1') and not store.has_session(3, 's2')
+
+def test_load_snapshot():
+    store = core.AttendanceStore()
+    store.load(attendees=[['40000000', 'Ana'], ['40000001', 'Luis'], ['40000000', 'Ana María']],
+               general=['40000001', '49999999'],
+               session_attendance=[['40000001', 's1'], ['49999999', 's1']],
+               general_timestamps=['2025-11-15T10:00:00', '2025-11-15T10:00:00'],
+               general_kits=[True, True])
+
+    assert len(store) == 2
+    assert store.name(store.id_of('40000000')) == 'Ana María'
+    assert list(store.general.bits) == [0b10]
+    assert store.kits.count == 1
+    assert store.session_counts() == {'s1': 1}
+
+def test_export_chunks_match_apps_script_export(tmp_path):
+    storage = core.SQLiteStorage(str(tmp_path / 'export.db'))
+    load_sheets(storage, attendees=[
+        ['Ana, María', 'Pérez', '', '', '40000000'],
+        ['Luis "Lucho"', 'Gómez', '', '', '00001234'],
+        ['Eva', '', '', '', '40000002'],
+    ], sessions=[SESSIONS[2], SESSIONS[0], SESSIONS[1]])
+    storage.register_general_attendance('40000000')
+    storage.register_session_attendance('40000000', 's3')
+    storage.register_general_attendance('00001234')
+    storage.register_session_attendance('00001234', 's1')
+
+    index = core.AttendeeIndex(storage)
+    assert index.refresh(full=True)
+    names = {session['id']: session['name'] for session in storage.get_sessions_list()}
+    chunks = list(index.export_chunks(names, page_size=2))
+
+    # Columnas de ponencias ordenadas por ID, como exportAttendeesData()
+    expected = '\n'.join([
+        'DNI,Nombre,Asistencia General,Ponencia 1,Ponencia 2,Ponencia 3',
+        '40000000,"Ana, María Pérez",Sí,No,No,Sí',
+        '00001234,"Luis ""Lucho"" Gómez",Sí,Sí,No,No',
+        '40000002,Eva,No,No,No,No',
+    ])
+    assert len(chunks) == 3
+    assert ''.join(chunks) == expected
+    assert ''.join(chunks) == storage.export_attendees_data()['csv_data']
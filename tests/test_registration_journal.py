@@ -0,0 +1,138 @@
+"""RegistrationJournal: append idempotente, drenado, reintentos y rechazos"""
+
+import time
+
+import pytest
+
+import app as core
+
+class FakeAPI:
+    """Apps Script falso: registra los lotes y responde con `respond(items)`"""
+
+    def __init__(self, respond=None):
+        self.batches = []
+        self.respond = respond or (lambda items: {"results": [{"registered": True} for _ in items]})
+
+    def register_general_attendance_batch(self, items):
+        self.batches.append(('general', items))
+        return self.respond(items)
+
+    def register_session_attendance_batch(self, items):
+        self.batches.append(('session', items))
+        return self.respond(items)
+
+def _statuses(journal):
+    with journal._lock:
+        return journal._connect().execute(
+            "SELECT status, attempts FROM registration_journal ORDER BY id").fetchall()
+
+@pytest.fixture
+def make_journal(tmp_path):
+    def make(api, **kwargs):
+        return core.RegistrationJournal(str(tmp_path / 'journal.db'), api, **kwargs)
+    return make
+
+def test_append_is_idempotent_per_key(make_journal):
+    journal = make_journal(FakeAPI())
+    response = {"registered": True, "kit_entregado": True, "queued": True}
+
+    row_id, replayed = journal.append('registerGeneralAttendance', '40000000', idempotency_key='k1',
+                                      response=response)
+    assert replayed is None
+    again = journal.append('registerGeneralAttendance', '40000000', idempotency_key='k1',
+                           response={"registered": True, "kit_entregado": False})
+
+    assert again == (row_id, {**response, "replayed": True})
+    assert journal.response_for('k1') == {**response, "replayed": True}
+    assert journal.response_for('otra') is None
+    assert journal.pending_count() == 1
+
+def test_drain_groups_by_action(make_journal):
+    api = FakeAPI()
+    journal = make_journal(api)
+    journal.append('registerGeneralAttendance', '40000000', timestamp='2025-11-15T09:00:00', idempotency_key='g1')
+    journal.append('registerSessionAttendance', '40000000', 's1', idempotency_key='s1')
+    journal.append('registerGeneralAttendance', '40000001', idempotency_key='g2')
+
+    assert journal.drain_once() == 3
+    assert [(kind, [item['idempotency_key'] for item in items]) for kind, items in api.batches] == [
+        ('general', ['g1', 'g2']), ('session', ['s1'])]
+    assert api.batches[0][1][0] == {"dni": '40000000', "session_id": None,
+                                    "timestamp": '2025-11-15T09:00:00', "idempotency_key": 'g1'}
+    assert _statuses(journal) == [('done', 1)] * 3
+    assert journal.drain_once() == 0
+
+def test_drain_respects_batch_size(make_journal):
+    journal = make_journal(FakeAPI(), batch_size=2)
+    for i in range(5):
+        journal.append('registerGeneralAttendance', f'4000000{i}')
+
+    assert [journal.drain_once() for _ in range(4)] == [2, 2, 1, 0]
+
+def test_failed_delivery_backs_off(make_journal):
+    journal = make_journal(FakeAPI(lambda items: {"error": 'timeout'}), retry_base=60)
+    journal.append('registerGeneralAttendance', '40000000')
+
+    before = time.time()
+    assert journal.drain_once() == 1
+    with journal._lock:
+        status, attempts, next_attempt, error = journal._connect().execute(
+            "SELECT status, attempts, next_attempt_at, last_error FROM registration_journal").fetchone()
+    assert (status, attempts, error) == ('pending', 1, 'timeout')
+    assert next_attempt >= before + 60
+    # Hasta que venza el backoff no se reenvía
+    assert journal.drain_once() == 0
+
+def test_gives_up_after_max_attempts(make_journal):
+    journal = make_journal(FakeAPI(lambda items: {"results": [{"error": 'Apps Script no disponible'}]}),
+                           max_attempts=3, retry_base=0)
+    journal.append('registerGeneralAttendance', '40000000')
+
+    for attempt in range(1, 4):
+        assert journal.drain_once() == 1
+        assert _statuses(journal) == [('pending' if attempt < 3 else 'failed', attempt)]
+    assert journal.drain_once() == 0
+    assert journal.status()['failed'] == 1
+
+def test_rejected_events_are_reported(make_journal):
+    no_capacity = {"no_capacity": True, "session_id": 's1', "session_name": 'Ponencia 1', "available_capacity": 0}
+    api = FakeAPI(lambda items: {"results": [no_capacity if item['session_id'] == 's1' else {"already_registered": True}
+                                             for item in items]})
+    journal = make_journal(api)
+    journal.append('registerSessionAttendance', '40000000', 's1', timestamp='2025-11-15T09:00:00')
+    journal.append('registerSessionAttendance', '40000000', 's3')
+    assert journal.pending_sessions()[0] == {'s1': 1, 's3': 1}
+
+    journal.drain_once()
+
+    # Un duplicado ya registrado cuenta como entregado
+    assert _statuses(journal) == [('rejected', 1), ('done', 1)]
+    assert journal.pending_sessions()[0] == {}
+    assert not journal.has_event('registerSessionAttendance', '40000000', 's1')
+    assert journal.has_event('registerSessionAttendance', '40000000', 's3')
+    status = journal.status()
+    assert {key: status[key] for key in ('pending', 'done', 'rejected', 'failed')} == {
+        'pending': 0, 'done': 1, 'rejected': 1, 'failed': 0}
+    assert status['recent_rejections'] == [{
+        "action": 'registerSessionAttendance', "dni": '40000000', "session_id": 's1',
+        "timestamp": '2025-11-15T09:00:00', "status": 'rejected', "error": None, "result": no_capacity}]
+
+def test_retry_after_lost_response_does_not_duplicate(make_journal, storage):
+    storage.register_general_attendance('40000000')
+    calls = []
+
+    def lost_first_response(items):
+        # La primera vez el registro llega a la hoja pero la respuesta se pierde
+        result = storage.register_session_attendance_batch(items)
+        calls.append(result)
+        return {"error": 'timeout'} if len(calls) == 1 else result
+
+    journal = make_journal(FakeAPI(lost_first_response), retry_base=0)
+    journal.append('registerSessionAttendance', '40000000', 's3', idempotency_key='k1')
+    journal.drain_once()
+    journal.drain_once()
+
+    assert _statuses(journal) == [('done', 2)]
+    assert calls[1] == calls[0]
+    assert calls[1]['results'][0]['registered'] is True
+    assert storage.get_sessions_capacity()['s3']['available'] == 4
@@ -0,0 +1,123 @@
+"""ResponseCache: single-flight, stale-while-revalidate y respaldo ante errores"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app as core
+
+class SlowLoader:
+    """Loader que cuenta sus llamadas y no termina hasta que se lo liberan"""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        return self.value
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_single_flight_between_threads():
+    cache = core.ResponseCache(max_stale=0)
+    loader = SlowLoader({"a": 1})
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(cache.get, 'k', loader, 60) for _ in range(8)]
+        _wait_for(lambda: cache.misses == 8)
+        loader.release.set()
+        results = [future.result(5) for future in futures]
+
+    assert loader.calls == 1
+    assert results == [{"a": 1}] * 8
+    # Ya cargado, se sirve sin llamar al loader
+    assert cache.get('k', loader, 60) == {"a": 1}
+    assert (loader.calls, cache.hits) == (1, 1)
+
+def test_single_flight_between_coroutines():
+    cache = core.ResponseCache(max_stale=0)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"a": 1}
+
+    async def main():
+        return await asyncio.gather(*[cache.aget('k', loader, 60) for _ in range(8)])
+
+    assert asyncio.run(main()) == [{"a": 1}] * 8
+    assert calls == 1
+
+def test_coroutine_waits_for_thread_flight():
+    cache = core.ResponseCache(max_stale=0)
+    loader = SlowLoader({"a": 1})
+    leader = threading.Thread(target=cache.get, args=('k', loader, 60))
+    leader.start()
+    _wait_for(lambda: loader.calls == 1)
+
+    async def follower():
+        async def never():
+            raise AssertionError('la carga en curso debe compartirse')
+        task = asyncio.ensure_future(cache.aget('k', never, 60))
+        await asyncio.sleep(0.05)
+        loader.release.set()
+        return await task
+
+    assert asyncio.run(follower()) == {"a": 1}
+    leader.join(5)
+
+def test_stale_while_revalidate():
+    cache = core.ResponseCache(max_stale=60)
+    cache.put('k', {"v": 'old'}, age=20)
+    loader = SlowLoader({"v": 'new'})
+
+    # Vencido el TTL pero dentro de max_stale: responde ya con el valor viejo
+    assert cache.get('k', loader, 10) == {"v": 'old'}
+    assert cache.get('k', loader, 10) == {"v": 'old'}
+    assert cache.stale_hits == 2
+    _wait_for(lambda: loader.calls == 1)
+
+    loader.release.set()
+    _wait_for(lambda: cache.peek('k') == {"v": 'new'})
+    assert loader.calls == 1
+    assert cache.get('k', loader, 10) == {"v": 'new'}
+
+def test_too_stale_entry_loads_inline():
+    cache = core.ResponseCache(max_stale=5)
+    cache.put('k', {"v": 'old'}, age=100)
+
+    assert cache.get('k', lambda: {"v": 'new'}, 10) == {"v": 'new'}
+    assert cache.misses == 1
+
+def test_errors_are_not_cached():
+    cache = core.ResponseCache(max_stale=0)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        return {"error": 'Apps Script caído'}
+
+    assert cache.get('k', failing, 60) == {"error": 'Apps Script caído'}
+    assert cache.get('k', failing, 60) == {"error": 'Apps Script caído'}
+    assert len(calls) == 2
+    assert cache.peek('k') is None
+
+def test_failed_load_serves_previous_entry():
+    cache = core.ResponseCache(max_stale=0)
+    cache.put('k', {"v": 'old'}, age=100)
+
+    def failing():
+        raise RuntimeError('timeout')
+
+    assert cache.get('k', failing, 10) == {"v": 'old'}
+    assert cache.fallbacks == 1
@@ -0,0 +1,172 @@
+"""
+SQLiteStorage frente a las reglas de APPSCRIPT_FINAL.gs: kit solo la
+primera vez, una asistencia general por día, orden capacidad → duplicado →
+solapamiento, semántica de los lotes y reenvíos idempotentes. Incluye una
+carrera de varios procesos por los mismos cupos.
+"""
+
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import app as core
+from conftest import load_sheets
+
+DNI_A, DNI_B, DNI_C, DNI_D = '40000000', '40000001', '40000002', '40000003'
+
+def _general(storage, *dnis):
+    for dni in dnis:
+        assert storage.register_general_attendance(dni)['registered']
+
+def test_kit_only_first_time(storage):
+    yesterday = (datetime.now() - timedelta(days=1)).isoformat()
+    first = storage.register_general_attendance(DNI_A, yesterday)
+    assert first['registered'] and first['kit_entregado'] is True
+
+    today = storage.register_general_attendance(DNI_A)
+    assert today['registered'] and today['kit_entregado'] is False
+    assert 'already_registered_today' not in today
+
+def test_one_general_attendance_per_day(storage):
+    first = storage.register_general_attendance(DNI_A)
+    again = storage.register_general_attendance(DNI_A, datetime.now().isoformat())
+
+    assert again['already_registered_today'] is True
+    assert again['timestamp'] == first['timestamp']
+    # Ya recibió el kit en alguna asistencia anterior
+    assert again['kit_entregado'] is True
+    assert storage.get_event_stats()['general']['checkins'] == 1
+
+def test_unknown_and_invalid_dni(storage):
+    assert storage.register_general_attendance('123') == {"error": "dni inválido"}
+    assert storage.register_general_attendance('49999999') == {"error": "DNI no existe en Attendees."}
+    assert storage.register_session_attendance('49999999', 's1') == {"error": "DNI no existe"}
+
+def test_session_requires_general_attendance(storage):
+    assert storage.register_session_attendance(DNI_A, 's3') == {"no_general_attendance": True, "dni": DNI_A}
+    assert storage.register_session_attendance(DNI_A, 'nope') == {"error": "session_id no existe"}
+
+def test_capacity_is_checked_before_duplicate(storage):
+    _general(storage, DNI_A, DNI_B)
+    assert storage.register_session_attendance(DNI_A, 's1')['registered']
+    assert storage.register_session_attendance(DNI_B, 's1')['registered']
+
+    # s1 (2 cupos) está llena: el duplicado también recibe no_capacity, como en Apps Script
+    result = storage.register_session_attendance(DNI_A, 's1')
+    assert result == {"no_capacity": True, "session_id": 's1', "session_name": 'Ponencia 1',
+                      "available_capacity": 0}
+    assert storage.get_sessions_capacity()['s1']['available'] == 0
+
+def test_capacity_is_checked_before_overlap(storage):
+    _general(storage, DNI_A, DNI_B, DNI_C)
+    assert storage.register_session_attendance(DNI_A, 's2')['registered']
+    for dni in (DNI_B, DNI_C):
+        assert storage.register_session_attendance(dni, 's1')['registered']
+
+    assert storage.register_session_attendance(DNI_A, 's1')['no_capacity'] is True
+
+def test_duplicate_is_checked_before_overlap(storage):
+    _general(storage, DNI_A)
+    assert storage.register_session_attendance(DNI_A, 's2')['registered']
+
+    duplicate = storage.register_session_attendance(DNI_A, 's2')
+    assert duplicate == {"already_registered": True, "dni": DNI_A, "session_id": 's2',
+                         "session_name": 'Ponencia 2'}
+    overlap = storage.register_session_attendance(DNI_A, 's1')
+    assert overlap == {"overlap": True, "conflict_with": 's2', "conflict_name": 'Ponencia 2'}
+    assert storage.register_session_attendance(DNI_A, 's3')['registered']
+
+def test_general_batch(storage):
+    results = storage.register_general_attendance_batch([
+        {"dni": DNI_A},
+        {"dni": DNI_A},
+        {"dni": '123'},
+        {"dni": '49999999'},
+    ])['results']
+
+    assert results[0]['registered'] and results[0]['kit_entregado'] is True
+    # El segundo item ve el primero del mismo lote
+    assert results[1]['already_registered_today'] is True
+    assert results[2] == {"error": "dni inválido", "dni": '123'}
+    assert results[3] == {"error": "DNI no existe en Attendees.", "dni": '49999999'}
+
+def test_session_batch_counts_earlier_items(storage):
+    _general(storage, DNI_A, DNI_B, DNI_C)
+    results = storage.register_session_attendance_batch([
+        {"dni": DNI_A, "session_id": 's1'},
+        {"dni": DNI_B, "session_id": 's1'},
+        {"dni": DNI_C, "session_id": 's1'},
+        {"dni": DNI_C, "session_id": 's2'},
+        {"dni": DNI_C, "session_id": 's2'},
+        {"dni": DNI_A, "session_id": 's2'},
+        {"dni": DNI_D, "session_id": 's3'},
+        {"dni": DNI_D, "session_id": 'nope'},
+    ])['results']
+
+    assert [r.get('registered', False) for r in results[:2]] == [True, True]
+    assert results[2]['no_capacity'] is True
+    assert results[3]['registered']
+    assert results[4]['already_registered'] is True
+    assert results[5]['overlap'] is True and results[5]['conflict_with'] == 's1'
+    assert results[6] == {"no_general_attendance": True, "dni": DNI_D}
+    assert results[7] == {"error": "session_id no existe", "dni": DNI_D, "session_id": 'nope'}
+
+def test_idempotent_replay(storage):
+    _general(storage, DNI_A, DNI_B)
+    first = storage.register_session_attendance(DNI_A, 's3', idempotency_key='k1')
+    replay = storage.register_session_attendance(DNI_A, 's3', idempotency_key='k1')
+
+    # La respuesta original, no already_registered, y sin tomar otro cupo
+    assert replay == first and replay['registered']
+    assert storage.get_sessions_capacity()['s3']['available'] == 4
+
+    # El lote resuelve los reenvíos antes de procesar sus items
+    results = storage.register_session_attendance_batch([
+        {"dni": DNI_A, "session_id": 's3', "idempotency_key": 'k1'},
+        {"dni": DNI_B, "session_id": 's3', "idempotency_key": 'k2'},
+    ])['results']
+    assert results[0] == first
+    assert results[1]['registered']
+    assert storage.register_session_attendance(DNI_B, 's3', idempotency_key='k2') == results[1]
+
+def test_errors_are_not_remembered(storage):
+    assert 'error' in storage.register_general_attendance('123', idempotency_key='k1')
+    assert storage.register_general_attendance(DNI_A, idempotency_key='k1')['registered']
+
+# Carrera entre procesos: 4 procesos × 4 hilos por una ponencia de 50 cupos
+
+RACE_PROCESSES = 4
+RACE_THREADS = 4
+RACE_SEATS = 50
+RACE_ATTENDEES = 200
+
+def _race_worker(path, dnis, results):
+    storage = core.SQLiteStorage(path)
+    with ThreadPoolExecutor(RACE_THREADS) as pool:
+        outcomes = list(pool.map(lambda dni: storage.register_session_attendance(dni, 'big'), dnis))
+    results.put(outcomes)
+
+def test_capacity_race_between_processes(tmp_path):
+    path = str(tmp_path / 'race.db')
+    dnis = [f'5{i:07d}' for i in range(RACE_ATTENDEES)]
+    storage = core.SQLiteStorage(path)
+    load_sheets(storage, attendees=[['N', 'A', '', '', dni] for dni in dnis],
+                sessions=[['big', 'P', 'Grande', 'E', RACE_SEATS, '15-nov', 60, '09:00', '10:00', '1']])
+    storage.register_general_attendance_batch([{"dni": dni} for dni in dnis])
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_race_worker, args=(path, dnis[i::RACE_PROCESSES], results))
+               for i in range(RACE_PROCESSES)]
+    for worker in workers:
+        worker.start()
+    outcomes = [result for _ in workers for result in results.get(timeout=120)]
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    assert not [r for r in outcomes if 'error' in r]
+    assert sum(1 for r in outcomes if r.get('registered')) == RACE_SEATS
+    assert sum(1 for r in outcomes if r.get('no_capacity')) == RACE_ATTENDEES - RACE_SEATS
+    assert storage.get_sessions_capacity()['big']['available'] == 0
+    assert storage._query("SELECT COUNT(*) FROM session_attendance")[0][0] == RACE_SEATS
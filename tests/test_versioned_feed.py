@@ -0,0 +1,81 @@
+"""VersionedFeed: deltas con ?since= y respuestas condicionales (ETag / 304)"""
+
+import pytest
+
+import app as core
+from conftest import load_sheets
+
+def test_publish_only_bumps_on_changes():
+    feed = core.VersionedFeed()
+    assert feed.publish({"s1": {"available": 2}}) == {"version": 1, "changes": {"s1": {"available": 2}},
+                                                      "removed": []}
+    assert feed.publish({"s1": {"available": 2}}) is None
+    assert feed.version == 1
+
+def test_read_since_returns_delta():
+    feed = core.VersionedFeed()
+    feed.publish({"s1": {"available": 2}, "s2": {"available": 5}})
+    base = feed.token()
+    feed.publish({"s1": {"available": 1}, "s2": {"available": 5}})
+
+    token, data, removed = feed.read(base)
+    assert token == feed.token() != base
+    assert data == {"s1": {"available": 1}}
+    assert removed == []
+    # Al día: delta vacío
+    assert feed.read(token)[1:] == ({}, [])
+
+def test_read_since_reports_removed_ids_in_lists():
+    feed = core.VersionedFeed(key='id')
+    feed.publish([{"id": 's1', "name": 'A'}, {"id": 's2', "name": 'B'}])
+    base = feed.token()
+    feed.publish([{"id": 's2', "name": 'B2'}, {"id": 's3', "name": 'C'}])
+
+    _, data, removed = feed.read(base)
+    assert data == [{"id": 's2', "name": 'B2'}, {"id": 's3', "name": 'C'}]
+    assert removed == ['s1']
+
+@pytest.mark.parametrize('since', [None, '', 'otraepoca.1', 'basura', '{epoch}.99'])
+def test_unknown_since_returns_full_state(since):
+    feed = core.VersionedFeed()
+    value = {"s1": {"available": 2}}
+    feed.publish(value)
+    since = since and since.format(epoch=feed.epoch)
+
+    assert feed.read(since) == (feed.token(), value, None)
+
+@pytest.fixture
+def client():
+    load_sheets(core.api_client)
+    core.response_cache.invalidate('capacity')
+    return core.app.test_client()
+
+def test_capacity_etag_and_304(client):
+    first = client.get('/api/v1/sessions/capacity')
+    body = first.get_json()
+    assert first.status_code == 200
+    assert set(body['data']) == {'s1', 's2', 's3'}
+    assert 'delta' not in body
+    assert first.headers['ETag'] == f'W/"{body["version"]}"'
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    cached = client.get('/api/v1/sessions/capacity', headers={'If-None-Match': first.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.data == b''
+    assert cached.headers['ETag'] == first.headers['ETag']
+
+def test_capacity_since_after_registration(client):
+    version = client.get('/api/v1/sessions/capacity').get_json()['version']
+    dni = '40000005'
+    client.post('/api/v1/attendees/general', json={"dni": dni})
+    assert client.post('/api/v1/sessions/register', json={"dni": dni, "session_id": 's3'}).get_json()['success']
+
+    delta = client.get(f'/api/v1/sessions/capacity?since={version}').get_json()
+    assert delta['delta'] is True
+    assert delta['removed'] == []
+    assert list(delta['data']) == ['s3']
+    assert delta['version'] != version
+
+    stale = client.get('/api/v1/sessions/capacity', headers={'If-None-Match': f'W/"{version}"'})
+    assert stale.status_code == 200
+    assert stale.get_json()['data']['s3'] == delta['data']['s3']